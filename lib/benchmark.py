@@ -0,0 +1,220 @@
+"""
+Benchmarks of the curtailment engine, at parameterised scales.
+
+Every scale is a number of units x days x acceptances per unit per day. The FPN, BOAL and BOD data for a scale
+is generated by `lib.data.synthetic` and loaded into a temporary SQLite DB, which `analyze_curtailment` runs on
+and the per unit benchmarks read their frames from.
+Each benchmark records the best wall time over a few runs, and the peak memory (from tracemalloc) of one more.
+
+Results can be compared to a stored baseline, so that changes to the engine can be judged on numbers.
+"""
+import gc
+import json
+import logging
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+from lib.curtailment import (
+    analyze_curtailment,
+    analyze_one_unit,
+    linearize_physical_data,
+    resolve_applied_bid_offer_level,
+)
+from lib.data.synthetic import load_synthetic_data
+from lib.db_utils import DbRepository, drop_and_initialize_bod_table, drop_and_initialize_tables
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_START = pd.Timestamp("2022-01-01")
+RESULT_COLUMNS = ["benchmark", "scale", "units", "days", "acceptances", "wall_s", "peak_mb"]
+
+
+@dataclass(frozen=True)
+class Scale:
+    name: str
+    units: int
+    days: int
+    # per unit and day
+    acceptances: int
+
+
+SCALES = {
+    "small": Scale("small", units=5, days=1, acceptances=2),
+    "medium": Scale("medium", units=20, days=2, acceptances=4),
+    "large": Scale("large", units=100, days=7, acceptances=8),
+}
+
+
+def benchmark_end(scale: Scale) -> pd.Timestamp:
+    return BENCHMARK_START + pd.Timedelta(days=scale.days)
+
+
+def load_benchmark_db(db_path: str, scale: Scale, seed: int = 0) -> DbRepository:
+    """SQLite DB with the data of `scale` in the FPN, BOAL and BOD tables.
+
+    The data comes from the synthetic data generator, see `lib.data.synthetic`: every unit has an FPN and BOD
+    pairs -1 and 1 for every settlement period, and on average `scale.acceptances` turn downs a day, each
+    ramping down, holding for up to two hours and ramping back up.
+    """
+
+    drop_and_initialize_tables(db_path)
+    drop_and_initialize_bod_table(db_path)
+
+    load_synthetic_data(
+        create_engine(f"sqlite:///{db_path}", echo=False),
+        BENCHMARK_START,
+        benchmark_end(scale),
+        n_units=scale.units,
+        acceptances_per_day=scale.acceptances,
+        missing_fpn_fraction=0.0,
+        seed=seed,
+    )
+
+    return DbRepository(db_path)
+
+
+def _per_unit(df: pd.DataFrame, unit: str) -> pd.DataFrame:
+    return df.loc[[unit]]
+
+
+def _linearize(data: dict):
+    linearize_physical_data(data["fpn"])
+    linearize_physical_data(data["boal"])
+
+
+def _resolve(data: dict):
+    for unit in data["boal"].index.unique():
+        df_linear = linearize_physical_data(_per_unit(data["boal"], unit))
+        df_linear["Accept Time str"] = df_linear["Accept Time"].astype(str)
+        resolve_applied_bid_offer_level(df_linear)
+
+
+def _analyze_one_unit(data: dict):
+    # as in `analyze_curtailment`, only the units with acceptances are analyzed
+    for unit in data["boal"].index.unique():
+        analyze_one_unit(
+            df_boal_unit=_per_unit(data["boal"], unit),
+            df_fpn_unit=_per_unit(data["fpn"], unit),
+            df_bod_unit=_per_unit(data["bod"], unit),
+        )
+
+
+def _analyze_curtailment(engine: str) -> Callable[[dict], None]:
+    def run(data: dict):
+        analyze_curtailment(data["db"], data["start"], data["end"], engine=engine)
+
+    return run
+
+
+# benchmark name -> function of the benchmark data
+BENCHMARKS: Dict[str, Callable[[dict], None]] = {
+    "linearize_physical_data": _linearize,
+    "resolve_applied_bid_offer_level": _resolve,
+    "analyze_one_unit": _analyze_one_unit,
+    "analyze_curtailment[minute]": _analyze_curtailment("minute"),
+    "analyze_curtailment[exact]": _analyze_curtailment("exact"),
+}
+
+
+def measure(function: Callable[[], None], repeat: int = 3) -> Tuple[float, float]:
+    """Best wall time in seconds over `repeat` runs, and peak traced memory in MB of one more run"""
+
+    wall_times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        wall_times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(wall_times), peak / 2**20
+
+
+def run_benchmarks(
+    scales: List[Scale], benchmarks: Optional[List[str]] = None, repeat: int = 3, seed: int = 0
+) -> pd.DataFrame:
+    """Run `benchmarks` (default all of `BENCHMARKS`) at every scale, one row of results per run"""
+
+    benchmarks = list(BENCHMARKS) if benchmarks is None else benchmarks
+    unknown = [name for name in benchmarks if name not in BENCHMARKS]
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown benchmarks {unknown}, should be in {list(BENCHMARKS)}")
+
+    rows = []
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = load_benchmark_db(str(Path(tmp_dir) / "benchmark.db"), scale, seed=seed)
+            df_fpn, df_boal, df_bod = db.get_data_for_time_range(BENCHMARK_START, benchmark_end(scale))
+            data = {
+                "fpn": df_fpn,
+                "boal": df_boal,
+                "bod": df_bod,
+                "db": db,
+                "start": BENCHMARK_START,
+                "end": benchmark_end(scale),
+            }
+
+            for name in benchmarks:
+                logger.info(f"Benchmarking {name} at scale {scale.name}")
+                wall_s, peak_mb = measure(lambda: BENCHMARKS[name](data), repeat=repeat)
+                rows.append([name, scale.name, scale.units, scale.days, scale.acceptances, wall_s, peak_mb])
+
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def save_results(df: pd.DataFrame, path: Path):
+    """Write results as JSON records, which is also the format of a baseline"""
+    with open(path, "w") as f:
+        json.dump(df.round({"wall_s": 4, "peak_mb": 3}).to_dict(orient="records"), f, indent=2)
+
+
+def load_results(path: Path) -> pd.DataFrame:
+    with open(path) as f:
+        return pd.DataFrame(json.load(f), columns=RESULT_COLUMNS)
+
+
+@dataclass
+class Tolerance:
+    """How much slower or larger than the baseline a run can be, as ratios, before it is a regression.
+
+    Small absolute differences are never regressions, as they are mostly noise.
+    """
+
+    wall_ratio: float = 1.5
+    peak_ratio: float = 1.25
+    min_wall_s: float = 0.05
+    min_peak_mb: float = 1.0
+
+
+def find_regressions(df: pd.DataFrame, df_baseline: pd.DataFrame, tolerance: Tolerance = Tolerance()) -> pd.DataFrame:
+    """Runs of `df` that regressed past `df_baseline`, matched by benchmark and scale.
+
+    Returns the matched rows, with the baseline values and the ratios, for the regressed runs only.
+    Runs without a baseline are not compared.
+    """
+
+    keys = ["benchmark", "scale", "units", "days", "acceptances"]
+    df = df.merge(df_baseline[keys + ["wall_s", "peak_mb"]], on=keys, suffixes=("", "_baseline"))
+    df["wall_ratio"] = df["wall_s"] / df["wall_s_baseline"]
+    df["peak_ratio"] = df["peak_mb"] / df["peak_mb_baseline"]
+
+    slower = (df["wall_ratio"] > tolerance.wall_ratio) & (df["wall_s"] - df["wall_s_baseline"] > tolerance.min_wall_s)
+    larger = (df["peak_ratio"] > tolerance.peak_ratio) & (
+        df["peak_mb"] - df["peak_mb_baseline"] > tolerance.min_peak_mb
+    )
+
+    return df[slower | larger].reset_index(drop=True)
@@ -0,0 +1,156 @@
+"""
+Bid price index built once per run from the BOD table.
+
+Bid-offer data is a step function per unit and bid-offer pair: each row sets the price from its `timeFrom`
+until the next row. The index keeps every (unit, pair) as a sorted array of (timeFrom, price), so the
+prices for any number of (unit, time) points come from one vectorized as-of lookup, instead of an outer
+merge and forward fill per unit.
+
+Turn downs can be costed with pair -1 only, or across the whole bid ladder (pairs -1, -2, ...), split by the
+volume of each pair.
+"""
+import numpy as np
+import pandas as pd
+
+from lib.settlement_periods import to_epoch_seconds
+
+
+class BidPriceIndex:
+    """As-of lookup of BOD prices, for all units and bid-offer pairs"""
+
+    def __init__(self, df_bod: pd.DataFrame):
+        """`df_bod` is indexed by unit, as returned by `DbRepository.get_data_for_time_range`"""
+
+        if isinstance(df_bod, pd.Series):
+            df_bod = pd.DataFrame(df_bod).T
+
+        self.unit_names = pd.Index(df_bod.index.unique()).sort_values()
+        self.pairs = np.sort(df_bod["bidOfferPairNumber"].astype(float).unique())
+
+        units = self.unit_names.get_indexer(df_bod.index).astype(np.int64)
+        pairs = np.searchsorted(self.pairs, df_bod["bidOfferPairNumber"].astype(float).to_numpy())
+        times = to_epoch_seconds(df_bod["timeFrom"])
+
+        # every (unit, pair) is a sorted run of keys, with duplicated times resolved by the last row
+        self.origin = times.min() if len(times) > 0 else 0
+        self.span = times.max() - self.origin + 1 if len(times) > 0 else 1
+        keys = (units * len(self.pairs) + pairs) * self.span + times - self.origin
+        order = np.lexsort((np.arange(len(keys)), keys))
+        is_last = np.ones(len(order), dtype=bool)
+        is_last[:-1] = keys[order][1:] != keys[order][:-1]
+        order = order[is_last]
+
+        self.keys = keys[order]
+        self.bid_prices = df_bod["bidPrice"].astype(float).to_numpy()[order]
+        self.offer_prices = (
+            df_bod["offerPrice"].astype(float).to_numpy()[order] if "offerPrice" in df_bod.columns else None
+        )
+
+        # pair volumes, ramping linearly from bidOfferLevelFrom at timeFrom to bidOfferLevelTo at timeTo
+        if "bidOfferLevelFrom" in df_bod.columns:
+            self.time_from = times[order]
+            self.time_to = to_epoch_seconds(df_bod["timeTo"])[order]
+            self.level_from = df_bod["bidOfferLevelFrom"].astype(float).to_numpy()[order]
+            self.level_to = df_bod["bidOfferLevelTo"].astype(float).to_numpy()[order]
+
+    def _find(self, units, times, pairs) -> np.ndarray:
+        """Position of the latest BOD row at or before each (unit, time), or -1 if there is none.
+
+        With a scalar `pairs` this has one value per (unit, time), otherwise one row per (unit, time)
+        and one column per pair.
+        """
+
+        times = to_epoch_seconds(times)
+        if units is None:
+            # a single unit index, e.g. the BODs of one unit
+            unit_codes = np.zeros(len(times), dtype=np.int64)
+        else:
+            unit_codes = self.unit_names.get_indexer(np.asarray(units)).astype(np.int64)
+
+        pairs = np.asarray(pairs, dtype=float)
+        pair_codes = np.minimum(np.searchsorted(self.pairs, pairs), max(len(self.pairs) - 1, 0))
+        pair_found = self.pairs[pair_codes] == pairs if len(self.pairs) > 0 else np.zeros(pairs.shape, dtype=bool)
+
+        group = unit_codes[:, None] * len(self.pairs) + np.atleast_1d(pair_codes)[None, :]
+        keys = group * self.span + np.clip(times - self.origin, -1, self.span - 1)[:, None]
+        position = np.searchsorted(self.keys, keys, side="right") - 1
+
+        valid = (unit_codes >= 0)[:, None] & (times >= self.origin)[:, None] & (position >= 0)
+        valid &= np.atleast_1d(pair_found)[None, :]
+        valid[valid] = self.keys[position[valid]] // self.span == group[valid]
+        position = np.where(valid, position, -1)
+
+        return position[:, 0] if pairs.ndim == 0 else position
+
+    @staticmethod
+    def _prices_at(prices: np.ndarray, position: np.ndarray) -> np.ndarray:
+        result = np.full(position.shape, np.nan)
+        found = position >= 0
+        result[found] = prices[position[found]]
+        return result
+
+    def lookup(self, units, times, pair: float = -1.0) -> np.ndarray:
+        """Bid price of `pair` at each (unit, time), NaN before the first BOD of a unit.
+
+        `pair` can also be an array of pairs, giving one column of prices per pair.
+        `units=None` can be used when the index only holds one unit.
+        """
+        return self._prices_at(self.bid_prices, self._find(units, times, pair))
+
+    def lookup_for_costing(self, units, times, delta, costing: str = "pair") -> np.ndarray:
+        """Bid prices used to cost a turn down of `delta` MW at each (unit, time).
+
+        `costing` is one of
+        - "pair": the bid price of pair -1 only, the original methodology
+        - "ladder": the average price over the bid ladder, see `lookup_bid_ladder`
+        """
+        if costing == "pair":
+            return self.lookup(units, times, pair=-1)
+        elif costing == "ladder":
+            return self.lookup_bid_ladder(units, times, delta)
+        else:
+            raise ValueError(f"Unknown costing {costing}, should be 'pair' or 'ladder'")
+
+    def lookup_bid_ladder(self, units, times, volumes) -> np.ndarray:
+        """Average bid price to turn each (unit, time) down by `volumes` MW across the whole bid ladder.
+
+        The volume is split across the bid pairs in order, -1, -2, ..., each taking up to the size of its
+        bid-offer level, and any volume beyond the last pair is priced at the last pair. Where the volume
+        is 0 this is the price of the first pair. NaN before the first BOD of a unit.
+        """
+        times = to_epoch_seconds(times)
+        volumes = np.abs(np.asarray(volumes, dtype=float))
+        bid_pairs = self.pairs[self.pairs < 0][::-1]
+        if len(bid_pairs) == 0:
+            return np.full(len(times), np.nan)
+
+        # one row per (unit, time), one column per bid pair
+        position = self._find(units, times, bid_pairs)
+        found = position >= 0
+        prices = self._prices_at(self.bid_prices, position)
+        level_from = self._prices_at(self.level_from, position)
+        level_to = self._prices_at(self.level_to, position)
+        time_from = self._prices_at(self.time_from, position)
+        time_to = self._prices_at(self.time_to, position)
+
+        duration = time_to - time_from
+        ramp = np.divide(times[:, None] - time_from, duration, out=np.zeros_like(duration), where=duration > 0)
+        pair_volumes = np.where(found, np.abs(level_from + (level_to - level_from) * np.clip(ramp, 0, 1)), 0.0)
+
+        # fill the pairs in order
+        volume_before = np.cumsum(pair_volumes, axis=1) - pair_volumes
+        taken = np.clip(volumes[:, None] - volume_before, 0, pair_volumes)
+
+        rows = np.arange(len(times))
+        last_pair = len(bid_pairs) - 1 - np.argmax(found[:, ::-1], axis=1)
+        taken[rows, last_pair] += volumes - taken.sum(axis=1)
+
+        cost = np.where(found, taken * prices, 0.0).sum(axis=1)
+        first_price = prices[rows, np.argmax(found, axis=1)]
+        average = np.divide(cost, volumes, out=first_price.copy(), where=volumes > 0)
+
+        return np.where(found.any(axis=1), average, np.nan)
+
+    def lookup_offer(self, units, times, pair: float = 1.0) -> np.ndarray:
+        """Offer price of `pair` at each (unit, time), NaN before the first BOD of a unit"""
+        return self._prices_at(self.offer_prices, self._find(units, times, pair))
@@ -7,6 +7,7 @@ BASE_DIR = Path(__file__).parent.parent
 DATA_DIR = BASE_DIR / "data"
 SAVE_DIR = DATA_DIR / "PHYBM/raw"
 SQL_DIR = BASE_DIR / "sql"
+CURTAILMENT_CACHE_PATH = DATA_DIR / "curtailment_cache.db"
 
 DB_IP = os.environ.get("DB_IP")
 DB_USERNAME = os.environ.get("DB_USERNAME")
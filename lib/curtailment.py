@@ -1,15 +1,37 @@
+import concurrent.futures
 import logging
-from typing import Optional
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+from typing import Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
-
+import pyarrow as pa
+
+from lib.bid_prices import BidPriceIndex
+from lib.constants import MW_30m_TO_MWH
+from lib.curtailment_acceptances import ACCEPTANCE_PERIOD_COLUMNS, sum_acceptance_periods, sum_acceptances
+from lib.curtailment_cache import CurtailmentCache, analyze_units_with_cache
+from lib.curtailment_exact import SETTLEMENT_PERIOD_SECONDS, analyze_units_exact
+from lib.curtailment_matrix import CurtailmentMatrix
+from lib.curtailment_resolutions import check_resolutions, engine_period_seconds, roll_up, roll_up_all
 from lib.data.utils import MINUTES_TO_HOURS, add_utc_timezone
-from lib.db_utils import DbRepository
+from lib.db_utils import DbRepository, UnitPartition
+from lib.settlement_periods import to_epoch_seconds, to_local, to_utc
+from lib.spans import span
 
 logger = logging.getLogger(__name__)
 
 MINUTES_TO_HOURS = 1 / 60
 
+# 30 minute outputs of the curtailment engines, per unit or summed over units
+CURTAILMENT_COLUMNS = ["Level_FPN", "Level_BOAL", "Level_After_BOAL", "delta", "energy_mwh", "cost_gbp"]
+
+# rough peak memory of the engines, per minute of every unit for "minute" and per input row for "exact",
+# measured with tracemalloc and rounded up
+MINUTE_ENGINE_BYTES_PER_UNIT_MINUTE = 400
+EXACT_ENGINE_BYTES_PER_ROW = 400
+
 
 def resolve_applied_bid_offer_level(df_linear: pd.DataFrame):
     """
@@ -39,6 +61,103 @@ def resolve_applied_bid_offer_level(df_linear: pd.DataFrame):
     return resolved
 
 
+def resolve_applied_bid_offer_levels_all_units(df_boal: pd.DataFrame) -> pd.DataFrame:
+    """
+    Batched version of `resolve_applied_bid_offer_level`, for the whole BOAL table at once.
+
+    `df_boal` is the BOAL table as returned by `DbRepository`, indexed by unit, with
+    From/To levels and times. Returns one row per (Unit, minute) with the resolved "Level"
+    and the "Accept ID" that set it, matching the per-unit pandas implementation:
+    - every acceptance is upsampled to one-minute resolution and forward filled between its breakpoints
+    - where acceptances overlap, the last "Accept ID" (in sorted order) wins
+    """
+
+    columns = ["Unit", "Time", "Level", "Accept ID"]
+
+    if isinstance(df_boal, pd.Series):
+        df_boal = pd.DataFrame(df_boal).T
+
+    df_boal = df_boal[df_boal["Accept ID"].notna()]
+    if len(df_boal) == 0:
+        return pd.DataFrame(columns=columns)
+
+    unit_codes, unit_names = pd.factorize(df_boal.index, sort=True)
+    accept_ranks, accept_ids = pd.factorize(df_boal["Accept ID"], sort=True)
+
+    # linearize, "from" points first then "to" points, like `linearize_physical_data`
+    time_from = pd.DatetimeIndex(df_boal["timeFrom"])
+    time_to = pd.DatetimeIndex(df_boal["timeTo"])
+    tz = time_from.tz
+    minutes = np.concatenate([to_epoch_seconds(time_from), to_epoch_seconds(time_to)]) // 60
+    levels = np.concatenate([df_boal["levelFrom"].to_numpy(float), df_boal["levelTo"].to_numpy(float)])
+    unit_codes = np.concatenate([unit_codes, unit_codes]).astype(np.int64)
+    accept_ranks = np.concatenate([accept_ranks, accept_ranks]).astype(np.int64)
+
+    # one group per (unit, acceptance), sorted by minute and then by original position
+    group_keys = unit_codes * len(accept_ids) + accept_ranks
+    group_keys, groups = np.unique(group_keys, return_inverse=True)
+    group_units = group_keys // len(accept_ids)
+    group_ranks = group_keys % len(accept_ids)
+
+    order = np.lexsort((np.arange(len(minutes)), minutes, groups))
+    groups, minutes, levels = groups[order], minutes[order], levels[order]
+
+    is_group_start = np.r_[True, groups[1:] != groups[:-1]]
+    is_group_end = np.r_[groups[1:] != groups[:-1], True]
+    first_minute = minutes[is_group_start]
+    last_minute = minutes[is_group_end]
+
+    # upsample every acceptance to one row per minute
+    lengths = last_minute - first_minute + 1
+    offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+    n_rows = int(lengths.sum())
+    row_groups = np.repeat(np.arange(len(group_keys)), lengths)
+    row_minutes = first_minute[row_groups] + np.arange(n_rows) - offsets[row_groups]
+
+    # resample("T").first() keeps the first non-null level in each minute
+    valid = ~np.isnan(levels)
+    valid_groups, valid_minutes, valid_levels = groups[valid], minutes[valid], levels[valid]
+    is_first = np.r_[True, (valid_groups[1:] != valid_groups[:-1]) | (valid_minutes[1:] != valid_minutes[:-1])]
+    positions = offsets[valid_groups[is_first]] + valid_minutes[is_first] - first_minute[valid_groups[is_first]]
+
+    row_levels = np.full(n_rows, np.nan)
+    row_levels[positions] = valid_levels[is_first]
+
+    # forward fill, never across the start of an acceptance
+    filled = np.zeros(n_rows, dtype=bool)
+    filled[positions] = True
+    filled[offsets] = True
+    fill_from = np.maximum.accumulate(np.where(filled, np.arange(n_rows), 0))
+    row_levels = row_levels[fill_from]
+
+    # select the latest commitment for every (unit, timepoint)
+    keep = ~np.isnan(row_levels)
+    row_groups, row_minutes, row_levels = row_groups[keep], row_minutes[keep], row_levels[keep]
+    row_units = group_units[row_groups]
+    order = np.lexsort((group_ranks[row_groups], row_minutes, row_units))
+    row_groups, row_minutes, row_levels, row_units = (
+        row_groups[order],
+        row_minutes[order],
+        row_levels[order],
+        row_units[order],
+    )
+    is_last = np.r_[(row_units[1:] != row_units[:-1]) | (row_minutes[1:] != row_minutes[:-1]), True]
+
+    times = pd.to_datetime(row_minutes[is_last], unit="m")
+    if tz is not None:
+        times = times.tz_localize("UTC").tz_convert(tz)
+
+    return pd.DataFrame(
+        {
+            "Unit": np.asarray(unit_names)[row_units[is_last]],
+            "Time": times,
+            "Level": row_levels[is_last],
+            "Accept ID": np.asarray(accept_ids)[group_ranks[row_groups[is_last]]],
+        },
+        columns=columns,
+    )
+
+
 def linearize_physical_data(df: pd.DataFrame):
     """Convert a From/To horizontal format to a long format with values at different timepoitns"""
 
@@ -104,12 +223,27 @@ def calculate_notified_generation_in_mwh(df_merged: pd.DataFrame) -> float:
     return mw_minutes * MINUTES_TO_HOURS
 
 
+def add_costs(df_merged: pd.DataFrame):
+    """Add minute energy and cost columns, from "delta" in MW and "bidPrice" in £/MWh"""
+
+    # bid price is negative
+    df_merged["energy_mwh"] = df_merged["delta"] * MINUTES_TO_HOURS
+    df_merged["cost_gbp"] = -df_merged["bidPrice"] * df_merged["energy_mwh"]
+
+
 def analyze_one_unit(
     df_boal_unit: pd.DataFrame,
     df_fpn_unit: pd.DataFrame,
     df_bod_unit: Optional[pd.DataFrame] = None,
+    unit_boal_resolved: Optional[pd.DataFrame] = None,
 ) -> pd.DataFrame:
-    """Product a dataframe of actual (curtailed) vs. proposed generation"""
+    """Product a dataframe of actual (curtailed) vs. proposed generation
+
+    Costs are only added if `df_bod_unit` is given.
+
+    `unit_boal_resolved` can be passed if the BOAL levels have already been resolved
+    for this unit, e.g. by `resolve_applied_bid_offer_levels_all_units`, indexed by "Time".
+    """
 
     if isinstance(df_boal_unit, pd.Series):
         df_boal_unit = pd.DataFrame(df_boal_unit).T
@@ -119,15 +253,19 @@ def analyze_one_unit(
 
     logger.debug(
         f"Analyzing one unit for {len(df_boal_unit)} BOA, "
-        f"{len(df_fpn_unit)} FPN and {len(df_bod_unit)} BOD"
+        f"{len(df_fpn_unit)} FPN and {0 if df_bod_unit is None else len(df_bod_unit)} BOD"
     )
 
-    # Make time linear
-    df_boal_linear = linearize_physical_data(df_boal_unit)
-    df_boal_linear["Accept Time str"] = df_boal_linear["Accept Time"].astype(str)
+    if unit_boal_resolved is None:
+        # Make time linear
+        df_boal_linear = linearize_physical_data(df_boal_unit)
+        df_boal_linear["Accept Time str"] = df_boal_linear["Accept Time"].astype(str)
 
-    # resolve boa data
-    unit_boal_resolved = resolve_applied_bid_offer_level(df_boal_linear)
+        # resolve boa data
+        unit_boal_resolved = resolve_applied_bid_offer_level(df_boal_linear)
+
+    if len(unit_boal_resolved) == 0:
+        unit_boal_resolved = pd.DataFrame(columns=["Level"], index=pd.DatetimeIndex([], name="Time"), dtype=float)
 
     unit_fpn_resolved = linearize_physical_data(df_fpn_unit).set_index("Time").resample("T").mean(numeric_only=True).interpolate()
     unit_fpn_resolved["Notification Type"] = "FPN"
@@ -137,131 +275,435 @@ def analyze_one_unit(
 
     # We merge BOAL to FPN, so all FPN data is preserved. We want to include
     # units with an FPN but not BOAL
-    df_merged = unit_fpn_resolved.join(unit_boal_resolved["Level"], lsuffix="_FPN", rsuffix="_BOAL")
+    # keep the "Accept ID" that set each BOAL level, when it is known
+    boal_columns = [column for column in ["Level", "Accept ID"] if column in unit_boal_resolved.columns]
+    df_merged = unit_fpn_resolved.join(unit_boal_resolved[boal_columns], lsuffix="_FPN", rsuffix="_BOAL")
 
     # If there is no BOALF, then the level after the BOAL is the same as the FPN!
     df_merged["Level_After_BOAL"] = df_merged["Level_BOAL"].fillna(df_merged["Level_FPN"])
     df_merged["delta"] = df_merged["Level_FPN"] - df_merged["Level_After_BOAL"]
 
+    df_merged = df_merged.reset_index()
+
     # unsure if we should take '1' or '-1'. they seemd to have the same 'bidPrice'
     if df_bod_unit is not None:
-        df_bod_unit = df_bod_unit.copy()
-        df_bod_unit.reset_index(inplace=True)
-        df_bod_unit["bidOfferPairNumber"] = df_bod_unit["bidOfferPairNumber"].astype(float)
-        mask = df_bod_unit["bidOfferPairNumber"] == -1.0
-        df_bod_unit = df_bod_unit.loc[mask]
-        df_bod_unit["bidPrice"] = df_bod_unit["bidPrice"].astype(float)
-
         # put bid Price into returned dat
-        df_bod_unit["Time"] = pd.to_datetime(df_bod_unit.loc[:, "timeFrom"])
+        df_merged["bidPrice"] = BidPriceIndex(df_bod_unit).lookup(units=None, times=df_merged["Time"], pair=-1)
+        add_costs(df_merged)
 
-        df_merged = df_merged.merge(df_bod_unit[["bidPrice", "Time"]], on=["Time"], how="outer")
-        df_merged["bidPrice"].ffill(inplace=True)
+        assert "cost_gbp" in df_merged.columns
+        assert "energy_mwh" in df_merged.columns
 
-        # bid price is negative
-        df_merged["energy_mwh"] = df_merged["delta"] * 1 / 60
-        df_merged["cost_gbp"] = -df_merged["bidPrice"] * df_merged["energy_mwh"]
-
-    assert "cost_gbp" in df_merged.columns
-    assert "energy_mwh" in df_merged.columns
     assert "delta" in df_merged.columns
     assert "Level_After_BOAL" in df_merged.columns
     assert "Level_BOAL" in df_merged.columns
     assert "Level_FPN" in df_merged.columns
 
     # change Time from UTC to Europe/London, this is because Time is made from timeFrom which is in UTC
-    df_merged["Time"] = pd.to_datetime(df_merged["Time"].dt.tz_localize('UTC')).dt.tz_convert("Europe/London")
+    df_merged["Time"] = to_local(df_merged["Time"])
 
     return df_merged
 
 
-def analyze_curtailment(db: DbRepository, start_time, end_time) -> pd.DataFrame:
-    """Produces a dataframe characterizing curtailment between `start_time` and `end_time`
+def analyze_units_by_minute(
+    df_fpn: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    df_bod: pd.DataFrame,
+    costing: str = "pair",
+    acceptances: bool = False,
+    period_seconds: int = SETTLEMENT_PERIOD_SECONDS,
+) -> Union[pd.DataFrame, Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Run `analyze_one_unit` for every unit, upsampling to minutes, and average each unit into 30 minute chunks,
+    or chunks of `period_seconds`
 
-    This uses the SQLite Db's as input, generating a DF that can then be loaded to the Postgres Db
-    """
+    Returns one row per (Unit, Time) with the columns in `CURTAILMENT_COLUMNS`. Each minute is costed with
+    the bid prices for `costing`, see `BidPriceIndex.lookup_for_costing`.
 
-    df_fpn, df_boal, df_bod = db.get_data_for_time_range(start_time=start_time, end_time=end_time)
+    With `acceptances`, the energy and cost of every minute are also summed by the acceptance that set its
+    level, see `lib.curtailment_acceptances`, and returned as a second dataframe.
+    """
 
     curtailment_dfs = []
-    # get unique names from bods
-    units_fpn = df_fpn.index.unique()
-    units_boa = df_boal.index.unique()
-    units_bod = df_bod.index.unique()
+    fpn_by_unit, boal_by_unit = UnitPartition(df_fpn), UnitPartition(df_boal)
 
-    units = sorted(set(list(units_fpn) + list(units_boa) + list(units_bod)))
+    units = sorted(set(fpn_by_unit.units) | set(boal_by_unit.units) | set(df_bod.index.unique()))
     logger.info(f"Looking at {len(units)} units")
 
+    # resolve the BOAL levels for all units in one go
+    df_boal_resolved = resolve_applied_bid_offer_levels_all_units(df_boal)
+    boal_resolved_by_unit = {
+        unit: data.set_index("Time") for unit, data in df_boal_resolved.groupby("Unit", sort=False)
+    }
+
     for i, unit in enumerate(units):
         logger.debug(f"Analyzing {unit} ({i}/{len(units)})")
 
-        if unit in units_boa:
-            df_boal_unit = df_boal.loc[unit]
-        else:
-            logger.debug(f"No BOAs for {unit}, so making empty data")
-            df_boal_unit = pd.DataFrame(columns=df_boal.columns)
-
-        if unit in units_fpn:
-            df_fpn_unit = df_fpn.loc[unit]
-        else:
-            logger.debug(f"No FPN for {unit}, so making empty data")
-            df_fpn_unit = pd.DataFrame(columns=df_fpn.columns)
-
-        if unit in units_bod:
-            df_bod_unit = df_bod.loc[unit]
-        else:
-            logger.debug(f"No BODS for {unit}, so making empty data")
-            df_bod_unit = pd.DataFrame(columns=df_bod.columns)
+        # empty for units without BOAs or FPNs
+        df_boal_unit = boal_by_unit[unit]
+        df_fpn_unit = fpn_by_unit[unit]
 
+        # costs are added for all units at once below
         df_curtailment_unit = analyze_one_unit(
             df_boal_unit=df_boal_unit,
             df_fpn_unit=df_fpn_unit,
-            df_bod_unit=df_bod_unit,
+            unit_boal_resolved=boal_resolved_by_unit.get(unit, df_boal_resolved.iloc[:0].set_index("Time")),
         )
 
         curtailment_in_mwh = calculate_curtailment_in_mwh(df_curtailment_unit)
         generation_in_mwh = calculate_notified_generation_in_mwh(df_curtailment_unit)
-        costs_in_gbp = calculate_curtailment_costs_in_gbp(df_curtailment_unit)
 
         logger.debug(
             f"Curtailment for {unit} is {curtailment_in_mwh:.2f} MWh. "
             f"Generation was {generation_in_mwh:.2f} MWh"
-            f"Costs was {costs_in_gbp:.2f} £"
         )
         logger.debug(f"Done {i} out of {len(units)}")
 
+        df_curtailment_unit["Unit"] = unit
         curtailment_dfs.append(df_curtailment_unit)
 
+    if len(curtailment_dfs) == 0:
+        df_curtailment = pd.DataFrame(columns=["Unit", "Time"] + CURTAILMENT_COLUMNS)
+        if acceptances:
+            return df_curtailment, pd.DataFrame(columns=ACCEPTANCE_PERIOD_COLUMNS)
+        return df_curtailment
+
     df_curtailment = pd.concat(curtailment_dfs).copy()
-    total_curtailment = df_curtailment["delta"].sum() * MINUTES_TO_HOURS
-    logger.info(f"Total curtailment was {total_curtailment:.2f} MWh ")
+
+    # bid prices for all units and minutes in one lookup
+    bid_prices = BidPriceIndex(df_bod)
+    df_curtailment["bidPrice"] = bid_prices.lookup_for_costing(
+        df_curtailment["Unit"], df_curtailment["Time"], df_curtailment["delta"], costing=costing
+    )
+    add_costs(df_curtailment)
 
     # this sometimes happens when there are no boas
     df_curtailment["Level_BOAL"] = df_curtailment["Level_BOAL"].fillna(0.0)
     df_curtailment["cost_gbp"] = df_curtailment["cost_gbp"].fillna(0.0)
 
-    # group and sum by time (in 30 mins chunks)
-    df_curtailment = df_curtailment.reset_index()
-    df_curtailment["Time"] = pd.to_datetime(df_curtailment["Time"]).dt.floor("30T")
-    df_curtailment = df_curtailment.groupby(["Time"]).sum(numeric_only=True)
+    # group and sum by unit and time (in 30 mins chunks)
+    df_curtailment["time_from"] = pd.to_datetime(df_curtailment["Time"])
+    # floor in UTC, as local times are ambiguous when the clocks go back
+    df_curtailment["Time"] = to_local(to_utc(df_curtailment["time_from"]).dt.floor(f"{period_seconds}s"))
 
-    # Move 'Time' back to a column
+    if acceptances:
+        if "Accept ID" not in df_curtailment.columns:
+            df_curtailment["Accept ID"] = None
+        df_curtailment["time_to"] = df_curtailment["time_from"] + pd.Timedelta(minutes=1)
+        df_acceptance_periods = sum_acceptance_periods(df_curtailment)
+
+    df_curtailment = df_curtailment.groupby(["Unit", "Time"])[CURTAILMENT_COLUMNS].sum()
+
+    # Move 'Unit' and 'Time' back to columns
     df_curtailment = df_curtailment.reset_index()
 
     # delta is in MW, so if we sum in each 30 minutes, we to /30 to get the average
-    df_curtailment["delta"] = df_curtailment["delta"] / 30
-    df_curtailment["Level_After_BOAL"] = df_curtailment["Level_After_BOAL"] / 30
-    df_curtailment["Level_BOAL"] = df_curtailment["Level_BOAL"] / 30
-    df_curtailment["Level_FPN"] = df_curtailment["Level_FPN"] / 30
+    period_minutes = period_seconds // 60
+    df_curtailment["delta"] = df_curtailment["delta"] / period_minutes
+    df_curtailment["Level_After_BOAL"] = df_curtailment["Level_After_BOAL"] / period_minutes
+    df_curtailment["Level_BOAL"] = df_curtailment["Level_BOAL"] / period_minutes
+    df_curtailment["Level_FPN"] = df_curtailment["Level_FPN"] / period_minutes
+
+    if acceptances:
+        return df_curtailment, df_acceptance_periods
+
+    return df_curtailment
+
+
+def _analyze_units(
+    df_fpn: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    df_bod: pd.DataFrame,
+    engine: str,
+    workers: int = 1,
+    memory_budget_mb: Optional[float] = None,
+    **engine_options,
+) -> Union[pd.DataFrame, Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Run `engine` on all units, in batches and/or processes.
+
+    `engine_options` are passed on to the engine: `costing`, `acceptances` and `period_seconds`.
+    """
+    if memory_budget_mb is not None:
+        return analyze_units_in_batches(
+            df_fpn=df_fpn,
+            df_boal=df_boal,
+            df_bod=df_bod,
+            engine=engine,
+            workers=workers,
+            memory_budget_mb=memory_budget_mb,
+            **engine_options,
+        )
+    elif workers > 1:
+        return analyze_units_in_parallel(
+            df_fpn=df_fpn, df_boal=df_boal, df_bod=df_bod, engine=engine, workers=workers, **engine_options
+        )
+    elif engine == "minute":
+        return analyze_units_by_minute(df_fpn=df_fpn, df_boal=df_boal, df_bod=df_bod, **engine_options)
+    elif engine == "exact":
+        return analyze_units_exact(df_fpn=df_fpn, df_boal=df_boal, df_bod=df_bod, **engine_options)
+    else:
+        raise ValueError(f"Unknown curtailment engine {engine}, should be 'minute' or 'exact'")
+
+
+def estimate_memory_per_unit(
+    df_fpn: pd.DataFrame, df_boal: pd.DataFrame, df_bod: pd.DataFrame, engine: str
+) -> pd.Series:
+    """Rough peak memory in bytes that each unit needs in `engine`, indexed by unit"""
+
+    units = [np.asarray(df.index) for df in (df_fpn, df_boal, df_bod)]
+    rows = pd.Series(np.ones(sum(map(len, units))), index=np.concatenate(units)).groupby(level=0).sum()
+
+    if engine == "exact":
+        return rows * EXACT_ENGINE_BYTES_PER_ROW
+
+    # the minute engine upsamples every unit from its first to its last FPN
+    time_from = pd.Series(df_fpn["timeFrom"].to_numpy(), index=units[0]).groupby(level=0).min()
+    time_to = pd.Series(df_fpn["timeTo"].to_numpy(), index=units[0]).groupby(level=0).max()
+    minutes = ((time_to - time_from).dt.total_seconds() // 60 + 1).reindex(rows.index).fillna(1)
+
+    return minutes * MINUTE_ENGINE_BYTES_PER_UNIT_MINUTE
+
+
+def _batch_units(memory_per_unit: pd.Series, memory_budget: float) -> List[list]:
+    """Split units, in order, into batches whose total memory stays within `memory_budget`.
+    A unit that needs more than the budget on its own gets a batch to itself."""
+    batches = [[]]
+    batch_memory = 0.0
+    for unit, memory in memory_per_unit.items():
+        if len(batches[-1]) > 0 and batch_memory + memory > memory_budget:
+            batches.append([])
+            batch_memory = 0.0
+        batches[-1].append(unit)
+        batch_memory += memory
+
+    return [batch for batch in batches if len(batch) > 0]
+
+
+def analyze_units_in_batches(
+    df_fpn: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    df_bod: pd.DataFrame,
+    engine: str,
+    memory_budget_mb: float,
+    workers: int = 1,
+    **engine_options,
+) -> Union[pd.DataFrame, Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Analyze the units in batches, so the engine's working memory stays within `memory_budget_mb`.
+
+    Only the 30 minute results of each batch are kept, so the peak memory is that of the largest batch.
+    """
+    memory_per_unit = estimate_memory_per_unit(df_fpn, df_boal, df_bod, engine=engine)
+    batches = _batch_units(memory_per_unit, memory_budget=memory_budget_mb * 1024**2)
+    logger.info(f"Analyzing {len(memory_per_unit)} units in {len(batches)} batches of at most {memory_budget_mb} MB")
+
+    partitions = [UnitPartition(df) for df in (df_fpn, df_boal, df_bod)]
+    results = []
+    for i, units in enumerate(batches):
+        logger.debug(f"Analyzing batch {i} of {len(units)} units")
+        df_fpn_batch, df_boal_batch, df_bod_batch = [partition.take(units) for partition in partitions]
+        results.append(
+            _analyze_units(
+                df_fpn=df_fpn_batch,
+                df_boal=df_boal_batch,
+                df_bod=df_bod_batch,
+                engine=engine,
+                workers=workers,
+                **engine_options,
+            )
+        )
+
+    if len(results) == 0:
+        return _analyze_units(df_fpn=df_fpn, df_boal=df_boal, df_bod=df_bod, engine=engine, **engine_options)
+
+    return _concat_results(results, acceptances=engine_options.get("acceptances", False))
+
+
+def _concat_results(results: list, acceptances: bool) -> Union[pd.DataFrame, Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Combine the results of `_analyze_units` for separate groups of units"""
+    if not acceptances:
+        results = [(df_curtailment,) for df_curtailment in results]
+
+    df_curtailment = pd.concat([result[0] for result in results])
+    df_curtailment = df_curtailment.sort_values(["Unit", "Time"]).reset_index(drop=True)
+    if not acceptances:
+        return df_curtailment
+
+    df_acceptance_periods = pd.concat([result[1] for result in results])
+    df_acceptance_periods = df_acceptance_periods.sort_values(["Unit", "Accept ID", "Time"]).reset_index(drop=True)
+    return df_curtailment, df_acceptance_periods
+
+
+def _partition_units(units_and_rows: pd.Series, n_partitions: int) -> List[list]:
+    """Split units into `n_partitions` groups with roughly the same number of rows,
+    by handing out the largest units first"""
+    partitions = [[] for _ in range(n_partitions)]
+    rows = np.zeros(n_partitions)
+    for unit, n_rows in units_and_rows.sort_values(ascending=False).items():
+        i = int(np.argmin(rows))
+        partitions[i].append(unit)
+        rows[i] += n_rows
+
+    return [partition for partition in partitions if len(partition) > 0]
+
+
+def _write_to_shared_memory(dfs: List[pd.DataFrame]) -> Tuple[SharedMemory, List[int]]:
+    """Serialize dataframes as Arrow IPC streams, one after the other, in a new shared memory block"""
+    buffers = []
+    for df in dfs:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        buffers.append(sink.getvalue())
+
+    sizes = [buffer.size for buffer in buffers]
+    shared_memory = SharedMemory(create=True, size=max(sum(sizes), 1))
+    offset = 0
+    for buffer, size in zip(buffers, sizes):
+        shared_memory.buf[offset : offset + size] = memoryview(buffer).cast("B")
+        offset += size
+
+    return shared_memory, sizes
+
+
+def _read_from_shared_memory(name: str, sizes: List[int]) -> List[pd.DataFrame]:
+    """Read the dataframes written by `_write_to_shared_memory`, copying them out of the shared block"""
+    shared_memory = SharedMemory(name=name)
+    dfs = []
+    offset = 0
+    for size in sizes:
+        # copy the bytes out first, as the arrays of a dataframe (e.g. categorical indexes) can point into them
+        view = shared_memory.buf[offset : offset + size]
+        data = bytes(view)
+        view.release()
+        dfs.append(pa.ipc.open_stream(pa.py_buffer(data)).read_all().to_pandas())
+        offset += size
+    shared_memory.close()
+
+    return dfs
+
+
+def _analyze_partition(
+    name: str, sizes: List[int], engine: str, engine_options: dict
+) -> Union[pd.DataFrame, Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Process pool worker: read one partition of units from shared memory and analyze them"""
+    df_fpn, df_boal, df_bod = _read_from_shared_memory(name, sizes)
+    return _analyze_units(df_fpn=df_fpn, df_boal=df_boal, df_bod=df_bod, engine=engine, **engine_options)
+
+
+def analyze_units_in_parallel(
+    df_fpn: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    df_bod: pd.DataFrame,
+    engine: str,
+    workers: int,
+    **engine_options,
+) -> Union[pd.DataFrame, Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Partition the units across a pool of `workers` processes.
+
+    Each worker only gets the FPN, BOAL and BOD rows of its own units, passed as Arrow buffers in
+    shared memory rather than pickled dataframes. Returns the same per unit 30 minute frame as running
+    the engine in this process.
+    """
+    units_and_rows = pd.concat(
+        [df_fpn.index.value_counts(), df_boal.index.value_counts(), df_bod.index.value_counts()]
+    ).groupby(level=0).sum()
+    partitions = _partition_units(units_and_rows, n_partitions=workers)
+    logger.info(f"Analyzing {len(units_and_rows)} units in {len(partitions)} processes")
+
+    data_by_unit = [UnitPartition(df) for df in (df_fpn, df_boal, df_bod)]
+    shared_memories = []
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(partitions)) as executor:
+            tasks = []
+            for units in partitions:
+                shared_memory, sizes = _write_to_shared_memory([data.take(units) for data in data_by_unit])
+                shared_memories.append(shared_memory)
+                task = executor.submit(_analyze_partition, shared_memory.name, sizes, engine, engine_options)
+                tasks.append(task)
+
+            results = [task.result() for task in tasks]
+    finally:
+        for shared_memory in shared_memories:
+            shared_memory.close()
+            shared_memory.unlink()
+
+    return _concat_results(results, acceptances=engine_options.get("acceptances", False))
+
+
+def _analyze_time_range(
+    df_fpn: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    df_bod: pd.DataFrame,
+    start_time,
+    end_time,
+    engine: str,
+    workers: int,
+    cache: Optional[CurtailmentCache],
+    memory_budget_mb: Optional[float],
+    costing: str,
+    per_acceptance: bool,
+    period_seconds: int = SETTLEMENT_PERIOD_SECONDS,
+) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """Per unit 30 minute curtailment (or `period_seconds`), for the periods from `start_time` up to `end_time`.
+    With `per_acceptance`, the curtailment of those periods is also summed by acceptance."""
 
-    # remove anything after the start and end datetime
     end_time = add_utc_timezone(pd.to_datetime(end_time))
     start_time = add_utc_timezone(pd.to_datetime(start_time))
+
+    analyze_units = partial(
+        _analyze_units,
+        engine=engine,
+        workers=workers,
+        memory_budget_mb=memory_budget_mb,
+        costing=costing,
+        period_seconds=period_seconds,
+    )
+    if cache is not None and period_seconds != SETTLEMENT_PERIOD_SECONDS:
+        raise ValueError("Only settlement periods are cached, so resolutions under 30 minutes can not use a cache")
+
+    if per_acceptance and cache is not None:
+        raise ValueError("Curtailment per acceptance is not cached, so can not be used with a cache")
+
+    with span("analysis", rows_in=len(df_fpn) + len(df_boal) + len(df_bod)) as analysis:
+        if per_acceptance:
+            df_curtailment, df_acceptance_periods = analyze_units(df_fpn, df_boal, df_bod, acceptances=True)
+            df_acceptance_periods = df_acceptance_periods[
+                (df_acceptance_periods["Time"] >= start_time) & (df_acceptance_periods["Time"] < end_time)
+            ]
+            df_acceptances = sum_acceptances(df_acceptance_periods, df_boal)
+        elif cache is not None:
+            # results are cached separately for every engine and costing
+            cache_key = engine if costing == "pair" else f"{engine}-{costing}"
+            df_curtailment = analyze_units_with_cache(
+                df_fpn=df_fpn,
+                df_boal=df_boal,
+                df_bod=df_bod,
+                cache=cache,
+                engine=cache_key,
+                analyze_units=analyze_units,
+                start_time=start_time,
+                end_time=end_time,
+            )
+        else:
+            df_curtailment = analyze_units(df_fpn, df_boal, df_bod)
+        analysis.rows_out = len(df_curtailment)
+
+    total_curtailment = df_curtailment["delta"].sum() * MW_30m_TO_MWH
+    logger.info(f"Total curtailment was {total_curtailment:.2f} MWh ")
+
+    # remove anything after the start and end datetime
     df_curtailment = df_curtailment[df_curtailment["Time"] < pd.to_datetime(end_time)]
     df_curtailment = df_curtailment[df_curtailment["Time"] >= pd.to_datetime(start_time)]
 
-    # reset index
-    df_curtailment.reset_index(drop=True, inplace=True)
+    return df_curtailment, df_acceptances if per_acceptance else None
+
+
+def _sum_over_units(df_curtailment_by_unit: pd.DataFrame) -> pd.DataFrame:
+    # group and sum by time (in 30 mins chunks)
+    df_curtailment = df_curtailment_by_unit.groupby(["Time"])[CURTAILMENT_COLUMNS].sum()
+
+    # Move 'Time' back to a column
+    df_curtailment = df_curtailment.reset_index()
 
     assert "cost_gbp" in df_curtailment.columns
     assert "energy_mwh" in df_curtailment.columns
@@ -271,3 +713,222 @@ def analyze_curtailment(db: DbRepository, start_time, end_time) -> pd.DataFrame:
     assert "Level_FPN" in df_curtailment.columns
 
     return df_curtailment
+
+
+def _results(
+    df_curtailment_by_unit: pd.DataFrame,
+    df_acceptances: Optional[pd.DataFrame],
+    per_unit: bool,
+    resolutions: Optional[List[str]],
+    period_seconds: int,
+) -> Union[pd.DataFrame, tuple]:
+    """The national curtailment, followed by the per unit matrix and the per acceptance table if asked for.
+
+    The national curtailment is by settlement period, or a dictionary with one dataframe per resolution
+    if `resolutions` are given.
+    """
+    with span("aggregation", rows_in=len(df_curtailment_by_unit)):
+        df_by_settlement_period = roll_up(df_curtailment_by_unit, period_seconds, "30min")
+        if resolutions is None:
+            results = [_sum_over_units(df_by_settlement_period)]
+        else:
+            df_by_resolution = roll_up_all(df_curtailment_by_unit, period_seconds, resolutions)
+            results = [{resolution: _sum_over_units(df) for resolution, df in df_by_resolution.items()}]
+
+        if per_unit:
+            results.append(CurtailmentMatrix.from_unit_frame(df_by_settlement_period))
+    if df_acceptances is not None:
+        results.append(df_acceptances)
+
+    return results[0] if len(results) == 1 else tuple(results)
+
+
+def analyze_curtailment(
+    db: DbRepository,
+    start_time,
+    end_time,
+    engine: str = "minute",
+    workers: int = 1,
+    cache: Optional[CurtailmentCache] = None,
+    per_unit: bool = False,
+    compact: bool = False,
+    memory_budget_mb: Optional[float] = None,
+    costing: str = "pair",
+    per_acceptance: bool = False,
+    resolutions: Optional[List[str]] = None,
+) -> Union[pd.DataFrame, tuple]:
+    """Produces a dataframe characterizing curtailment between `start_time` and `end_time`
+
+    This uses the SQLite Db's as input, generating a DF that can then be loaded to the Postgres Db
+
+    `engine` selects how the FPN and BOAL levels are integrated:
+    - "minute": upsample every unit to one-minute resolution (the original methodology)
+    - "exact": integrate the piecewise-linear FPN and BOAL segments exactly, see `lib.curtailment_exact`
+
+    With `workers` > 1 the units are split across a pool of processes.
+
+    With a `cache`, only the (unit, settlement period) results whose FPN, BOAL or BOD rows have
+    changed since they were cached are recomputed.
+
+    With `per_unit`, a `CurtailmentMatrix` of the unit x settlement period results that were summed
+    into the national total is returned as well.
+
+    With `per_acceptance`, a table of the curtailed MWh and cost of every (Unit, Accept ID, Accept Time),
+    with the first and last time the acceptance set the unit's level, is returned after that, see
+    `lib.curtailment_acceptances`. This can not be used with a `cache`.
+
+    With `resolutions`, e.g. ["5min", "30min", "day", "month"], the national curtailment is returned as a
+    dictionary of one dataframe per resolution, all from the same engine pass, see `lib.curtailment_resolutions`.
+    Resolutions under 30 minutes can not be used with a `cache`.
+
+    With `compact`, the data is loaded with only the columns the engines use, categorical units and
+    float32 levels. With `memory_budget_mb`, the units are analyzed in batches that are estimated to
+    fit in that much memory.
+
+    `costing` selects the bid prices turn downs are costed with:
+    - "pair": bid-offer pair -1 only (the original methodology)
+    - "ladder": split across the whole bid ladder by the volume of each pair, see `BidPriceIndex.lookup_bid_ladder`
+
+    For long time ranges, see `analyze_curtailment_in_windows`.
+    """
+
+    if resolutions is not None:
+        check_resolutions(resolutions)
+    period_seconds = engine_period_seconds(resolutions or [])
+
+    df_fpn, df_boal, df_bod = db.get_data_for_time_range(start_time=start_time, end_time=end_time, compact=compact)
+
+    df_curtailment_by_unit, df_acceptances = _analyze_time_range(
+        df_fpn=df_fpn,
+        df_boal=df_boal,
+        df_bod=df_bod,
+        start_time=start_time,
+        end_time=end_time,
+        engine=engine,
+        workers=workers,
+        cache=cache,
+        memory_budget_mb=memory_budget_mb,
+        costing=costing,
+        per_acceptance=per_acceptance,
+        period_seconds=period_seconds,
+    )
+
+    return _results(
+        df_curtailment_by_unit,
+        df_acceptances,
+        per_unit=per_unit,
+        resolutions=resolutions,
+        period_seconds=period_seconds,
+    )
+
+
+def _active_acceptances(df_boal: pd.DataFrame, time: pd.Timestamp) -> pd.DataFrame:
+    """All rows of the acceptances that are still active after `time`"""
+    accepts = [np.asarray(df_boal.index), df_boal["Accept ID"].to_numpy()]
+    accept_to = df_boal["timeTo"].groupby(accepts).transform("max")
+    return df_boal[(accept_to > time).to_numpy()]
+
+
+def _latest_bids(df_bod: pd.DataFrame, time: pd.Timestamp) -> pd.DataFrame:
+    """The latest BOD rows at or before `time`, for every unit and bid-offer pair"""
+    df_bod = df_bod[(df_bod["timeFrom"] <= time).to_numpy()]
+    pairs = [np.asarray(df_bod.index), df_bod["bidOfferPairNumber"].to_numpy()]
+    latest = df_bod["timeFrom"].groupby(pairs).transform("max")
+    return df_bod[(df_bod["timeFrom"] == latest).to_numpy()]
+
+
+def _with_carried_rows(df: pd.DataFrame, df_carried: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Add the rows carried over from the previous window, or loaded around this one, dropping the ones that
+    were loaded again"""
+    if df_carried is None or len(df_carried) == 0:
+        return df
+
+    df_combined = pd.concat([df_carried, df])
+    df_combined = df_combined[~df_combined.reset_index().duplicated(keep="last").to_numpy()]
+    if isinstance(df.index, pd.CategoricalIndex):
+        df_combined.index = pd.CategoricalIndex(df_combined.index, name=df.index.name)
+
+    return df_combined
+
+
+def analyze_curtailment_in_windows(
+    db: DbRepository,
+    start_time,
+    end_time,
+    window: pd.Timedelta = pd.Timedelta(days=1),
+    engine: str = "minute",
+    workers: int = 1,
+    cache: Optional[CurtailmentCache] = None,
+    per_unit: bool = False,
+    compact: bool = True,
+    memory_budget_mb: Optional[float] = None,
+    costing: str = "pair",
+    per_acceptance: bool = False,
+    resolutions: Optional[List[str]] = None,
+) -> Iterator[Union[pd.DataFrame, tuple]]:
+    """Streaming version of `analyze_curtailment`, yielding the 30 minute results of one `window` at a time.
+
+    Only one window of FPN, BOAL and BOD data is loaded at once, so long time ranges run in flat memory.
+    The acceptances that are still active at the end of a window, and the latest BOD prices, are carried
+    over into the next window, and each window also loads every unit's FPN rows on either side of it, which
+    the engines interpolate from across gaps in the FPNs. So results match running `analyze_curtailment` on
+    the whole range.
+
+    With `per_acceptance`, an acceptance that spans several windows has a row in each of them. Likewise,
+    with `resolutions`, a day or month that spans several windows has a row in each of them, and these
+    rows add up to the whole period.
+    """
+
+    if resolutions is not None:
+        check_resolutions(resolutions)
+    period_seconds = engine_period_seconds(resolutions or [])
+
+    start_time = pd.to_datetime(start_time)
+    end_time = pd.to_datetime(end_time)
+
+    df_boal_carried, df_bod_carried = None, None
+    for window_start in pd.date_range(start_time, end_time, freq=window, inclusive="left"):
+        window_end = min(window_start + window, end_time)
+        logger.info(f"Analyzing curtailment from {window_start} to {window_end}")
+
+        df_fpn, df_boal, df_bod = db.get_data_for_time_range(
+            start_time=window_start, end_time=window_end, compact=compact
+        )
+        df_fpn = _with_carried_rows(
+            df_fpn,
+            db.get_fpn_around_time_range(
+                start_time=window_start,
+                end_time=window_end,
+                outer_start_time=start_time,
+                outer_end_time=end_time,
+                compact=compact,
+            ),
+        )
+        df_boal = _with_carried_rows(df_boal, df_boal_carried)
+        df_bod = _with_carried_rows(df_bod, df_bod_carried)
+
+        df_curtailment_by_unit, df_acceptances = _analyze_time_range(
+            df_fpn=df_fpn,
+            df_boal=df_boal,
+            df_bod=df_bod,
+            start_time=window_start,
+            end_time=window_end,
+            engine=engine,
+            workers=workers,
+            cache=cache,
+            memory_budget_mb=memory_budget_mb,
+            costing=costing,
+            per_acceptance=per_acceptance,
+            period_seconds=period_seconds,
+        )
+
+        df_boal_carried = _active_acceptances(df_boal, window_end)
+        df_bod_carried = _latest_bids(df_bod, window_end)
+
+        yield _results(
+            df_curtailment_by_unit,
+            df_acceptances,
+            per_unit=per_unit,
+            resolutions=resolutions,
+            period_seconds=period_seconds,
+        )
@@ -0,0 +1,63 @@
+"""
+Curtailment attributed to the acceptances (BOALs) that caused it.
+
+The engines already know which "Accept ID" sets the level of a unit at any time: the kernel that resolves
+overlapping acceptances returns it for every minute, and every exact segment carries it. Energy and cost
+are summed by (Unit, Accept ID, settlement period) in the same pass as the curtailment itself, so the
+periods can be filtered to a time range like the curtailment, and then summed per acceptance.
+"""
+import pandas as pd
+
+# per (unit, acceptance, settlement period), as produced by the engines
+ACCEPTANCE_PERIOD_COLUMNS = ["Unit", "Accept ID", "Time", "energy_mwh", "cost_gbp", "time_from", "time_to"]
+
+# per acceptance, `time_from` and `time_to` bound the time the acceptance set the level of the unit
+ACCEPTANCE_COLUMNS = ["Unit", "Accept ID", "Accept Time", "energy_mwh", "cost_gbp", "time_from", "time_to"]
+
+
+def sum_acceptance_periods(df: pd.DataFrame) -> pd.DataFrame:
+    """Sum energy and cost by (Unit, Accept ID, settlement period).
+
+    `df` has one row per minute or segment, with "Unit", "Accept ID", "Time" (the settlement period),
+    "time_from", "time_to", "energy_mwh" and "cost_gbp". Rows without an acceptance are dropped.
+    """
+
+    df = df[df["Accept ID"].notna()]
+    if len(df) == 0:
+        return pd.DataFrame(columns=ACCEPTANCE_PERIOD_COLUMNS)
+
+    df = df.groupby(["Unit", "Accept ID", "Time"], sort=True).agg(
+        energy_mwh=("energy_mwh", "sum"),
+        cost_gbp=("cost_gbp", "sum"),
+        time_from=("time_from", "min"),
+        time_to=("time_to", "max"),
+    )
+
+    return df.reset_index()[ACCEPTANCE_PERIOD_COLUMNS]
+
+
+def sum_acceptances(df_acceptance_periods: pd.DataFrame, df_boal: pd.DataFrame) -> pd.DataFrame:
+    """One row per (Unit, Accept ID, Accept Time), with curtailed MWh, cost in £, and the first and last
+    time the acceptance was effective. `df_boal` is the BOAL table the periods were computed from."""
+
+    if len(df_acceptance_periods) == 0:
+        return pd.DataFrame(columns=ACCEPTANCE_COLUMNS)
+
+    df = df_acceptance_periods.groupby(["Unit", "Accept ID"], sort=True).agg(
+        energy_mwh=("energy_mwh", "sum"),
+        cost_gbp=("cost_gbp", "sum"),
+        time_from=("time_from", "min"),
+        time_to=("time_to", "max"),
+    )
+    df = df.reset_index()
+
+    accept_times = pd.DataFrame(
+        {
+            "Unit": df_boal.index.astype(str).to_numpy(),
+            "Accept ID": df_boal["Accept ID"].to_numpy(),
+            "Accept Time": df_boal["Accept Time"].to_numpy(),
+        }
+    ).drop_duplicates(["Unit", "Accept ID"])
+    df = df.merge(accept_times, on=["Unit", "Accept ID"], how="left")
+
+    return df[ACCEPTANCE_COLUMNS]
@@ -0,0 +1,369 @@
+"""
+Incremental curtailment recompute.
+
+Every (unit, settlement period) gets a fingerprint of the FPN, BOAL and BOD rows its result depends on.
+Results are stored in an SQLite cache together with their fingerprint, so that re-running a time range
+only recomputes the periods whose inputs changed, e.g. after one late BOALF, and merges the rest back in
+from the cache.
+
+Fingerprints start with `CACHE_VERSION`, so results cached by an older version of the engines are never served.
+Results cached over `max_age` ago are dropped from the cache, so it does not grow without bound.
+"""
+import logging
+import os
+import sqlite3
+import time
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+from lib.constants import SQL_DIR
+from lib.curtailment_matrix import CurtailmentMatrix
+from lib.data.utils import add_utc_timezone
+from lib.settlement_periods import from_epoch_seconds, to_epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+SETTLEMENT_PERIOD_SECONDS = 30 * 60
+# bump whenever the results of an engine change, so the results cached before are recomputed
+CACHE_VERSION = 1
+CURTAILMENT_CACHE_MAX_DAYS = 30
+RESULT_COLUMNS = ["Level_FPN", "Level_BOAL", "Level_After_BOAL", "delta", "energy_mwh", "cost_gbp"]
+
+FPN_COLUMNS = ["timeFrom", "timeTo", "levelFrom", "levelTo"]
+BOAL_COLUMNS = ["timeFrom", "timeTo", "levelFrom", "levelTo", "Accept ID"]
+BOD_COLUMNS = [
+    "timeFrom",
+    "timeTo",
+    "bidOfferPairNumber",
+    "bidOfferLevelFrom",
+    "bidOfferLevelTo",
+    "bidPrice",
+    "offerPrice",
+]
+
+# mixed into the row hashes, so identical values in different tables do not cancel out
+FPN_SALT = np.uint64(0x9E3779B97F4A7C15)
+BOAL_SALT = np.uint64(0xC2B2AE3D27D4EB4F)
+BOD_SALT = np.uint64(0x165667B19E3779F9)
+
+
+def initialize_curtailment_cache_table(path_to_db):
+    """Create the cache table, if it does not exist yet
+
+    Tables without a "cached_at" column predate `CACHE_VERSION`, so none of their rows would be served, and they
+    are dropped.
+    """
+    connection = sqlite3.connect(path_to_db)
+
+    with open(SQL_DIR / "init_curtailment_cache_db.sql") as f:
+        query = f.read()
+
+    with connection:
+        columns = [row[1] for row in connection.execute("pragma table_info(curtailment_cache)")]
+        if len(columns) > 0 and "cached_at" not in columns:
+            connection.execute("drop table curtailment_cache")
+        connection.executescript(query)
+        connection.commit()
+    connection.close()
+
+
+class CurtailmentCache:
+    """SQLite store of per (unit, settlement period) curtailment results and their input fingerprints"""
+
+    def __init__(
+        self, db_path: str, max_age: Optional[pd.Timedelta] = None, now: Callable[[], float] = time.time
+    ):
+        self.db_path = db_path
+        if max_age is None:
+            max_age = pd.Timedelta(days=float(os.getenv("CURTAILMENT_CACHE_MAX_DAYS", CURTAILMENT_CACHE_MAX_DAYS)))
+        self.max_age = max_age
+        self._now = now
+        self.engine = create_engine(f"sqlite:///{self.db_path}", echo=False)
+        initialize_curtailment_cache_table(db_path)
+
+    def get(self, engine: str, start_time: int, end_time: int) -> pd.DataFrame:
+        """Cached results of this `CACHE_VERSION` for settlement periods starting between `start_time` and
+        `end_time` (epoch seconds)"""
+
+        query = (
+            "select * from curtailment_cache where engine = ? and time >= ? and time <= ? and fingerprint like ?"
+        )
+        with self.engine.connect() as conn:
+            df = pd.read_sql(query, conn, params=(engine, int(start_time), int(end_time), f"v{CACHE_VERSION}-%"))
+
+        df = df.rename(columns={"unit": "Unit", "time": "Time"}).drop(columns=["engine", "cached_at"])
+        df["has_output"] = df["has_output"].astype(bool)
+        return df
+
+    def get_matrix(self, engine: str, start_time, end_time) -> CurtailmentMatrix:
+        """Cached results for the settlement periods from `start_time` up to `end_time`, per unit and period"""
+
+        start_time = add_utc_timezone(pd.Timestamp(start_time))
+        end_time = add_utc_timezone(pd.Timestamp(end_time))
+        df = self.get(engine, start_time.timestamp(), end_time.timestamp() - 1)
+        df = df[df["has_output"]].copy()
+        df["Time"] = from_epoch_seconds(df["Time"])
+
+        return CurtailmentMatrix.from_unit_frame(df)
+
+    def put(self, engine: str, df: pd.DataFrame):
+        """Insert or replace results, one row per (Unit, Time) with a fingerprint, and drop the results cached
+        over `max_age` ago"""
+
+        columns = ["Unit", "Time", "fingerprint", "has_output"] + RESULT_COLUMNS
+        rows = df[columns].copy()
+        rows["Time"] = rows["Time"].astype(np.int64)
+        rows["has_output"] = rows["has_output"].astype(int)
+        rows.insert(0, "engine", engine)
+        now = self._now()
+        rows["cached_at"] = now
+
+        logger.debug(f"Caching {len(rows)} unit settlement periods")
+
+        connection = sqlite3.connect(self.db_path)
+        with connection:
+            connection.executemany(
+                f"insert or replace into curtailment_cache values ({', '.join(['?'] * len(rows.columns))})",
+                rows.astype(object).itertuples(index=False, name=None),
+            )
+            oldest = now - self.max_age.total_seconds()
+            n_dropped = connection.execute("delete from curtailment_cache where cached_at < ?", (oldest,)).rowcount
+        connection.close()
+
+        if n_dropped > 0:
+            logger.debug(f"Dropped {n_dropped} unit settlement periods cached over {self.max_age} ago")
+
+
+def _hash_rows(df: pd.DataFrame, columns: list, salt: np.uint64) -> np.ndarray:
+    columns = [column for column in columns if column in df.columns]
+    return pd.util.hash_pandas_object(df[columns], index=True).to_numpy(np.uint64) ^ salt
+
+
+def _expand_to_periods(units, time_from, time_to, hashes, period_seconds):
+    """Repeat each row for every period it touches, including a period that starts exactly at `time_to`"""
+    first = time_from // period_seconds
+    counts = np.maximum(time_to // period_seconds, first) - first + 1
+    repeated = np.repeat(np.arange(len(units)), counts)
+    offsets = np.r_[0, np.cumsum(counts)[:-1]]
+    periods = (first[repeated] + np.arange(counts.sum()) - offsets[repeated]) * period_seconds
+
+    return units[repeated], periods, hashes[repeated]
+
+
+def _group(*keys: np.ndarray):
+    """Sort by `keys` and find where every unique combination starts"""
+    order = np.lexsort(keys[::-1])
+    keys = tuple(key[order] for key in keys)
+
+    is_start = np.zeros(len(order), dtype=bool)
+    is_start[:1] = True
+    for key in keys:
+        is_start[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(is_start)
+
+    return order, starts, tuple(key[starts] for key in keys)
+
+
+def fingerprint_inputs(
+    df_fpn: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    df_bod: pd.DataFrame,
+    period_seconds: int = SETTLEMENT_PERIOD_SECONDS,
+) -> pd.DataFrame:
+    """
+    Fingerprint the inputs of every (Unit, settlement period), with Time as the period start in epoch seconds.
+
+    A period depends on
+    - the FPN rows that touch it and, if it is in a gap between the FPN rows of its unit, the FPN rows on
+      either side of the gap, as the engines interpolate across gaps
+    - every row of the acceptances that are active during it, as the latest acceptance wins
+    - the BOD rows starting in it, and the latest BOD rows before it, as prices are forward filled
+
+    Row hashes are summed (wrapping at 64 bits), so the fingerprint does not depend on row order. Fingerprints
+    start with `CACHE_VERSION`.
+    """
+
+    columns = ["Unit", "Time", "fingerprint"]
+
+    unit_names = pd.Index(df_fpn.index.unique()).union(df_boal.index.unique()).union(df_bod.index.unique())
+    if len(unit_names) == 0:
+        return pd.DataFrame(columns=columns)
+
+    # FPN, and the gaps between consecutive FPN rows of a unit, with the hashes of the rows on either side
+    fpn_units = unit_names.get_indexer(df_fpn.index).astype(np.int64)
+    fpn_from, fpn_to = to_epoch_seconds(df_fpn["timeFrom"]), to_epoch_seconds(df_fpn["timeTo"])
+    fpn_hashes = _hash_rows(df_fpn, FPN_COLUMNS, FPN_SALT)
+
+    order = np.lexsort((fpn_from, fpn_units))
+    fpn_units, fpn_from, fpn_to, fpn_hashes = fpn_units[order], fpn_from[order], fpn_to[order], fpn_hashes[order]
+    gap = np.flatnonzero((fpn_units[1:] == fpn_units[:-1]) & (fpn_from[1:] > fpn_to[:-1]))
+
+    fpn_units, fpn_periods, fpn_hashes = _expand_to_periods(
+        np.concatenate([fpn_units, fpn_units[gap]]),
+        np.concatenate([fpn_from, fpn_to[gap]]),
+        np.concatenate([fpn_to, fpn_from[gap + 1]]),
+        np.concatenate([fpn_hashes, fpn_hashes[gap] + fpn_hashes[gap + 1]]),
+        period_seconds,
+    )
+
+    # BOAL, one hash per acceptance, spread over every period the acceptance is active in
+    order, starts, (accept_units, _) = _group(
+        unit_names.get_indexer(df_boal.index).astype(np.int64), pd.factorize(df_boal["Accept ID"])[0]
+    )
+    boal_from, boal_to = to_epoch_seconds(df_boal["timeFrom"])[order], to_epoch_seconds(df_boal["timeTo"])[order]
+    boal_hashes = _hash_rows(df_boal, BOAL_COLUMNS, BOAL_SALT)[order]
+    if len(df_boal) > 0:
+        boal_units, boal_periods, boal_hashes = _expand_to_periods(
+            accept_units,
+            np.minimum.reduceat(boal_from, starts),
+            np.maximum.reduceat(boal_to, starts),
+            np.add.reduceat(boal_hashes, starts),
+            period_seconds,
+        )
+    else:
+        boal_units, boal_periods = accept_units, boal_from
+
+    # BOD rows, summed for every (unit, timeFrom)
+    bod_units = unit_names.get_indexer(df_bod.index).astype(np.int64)
+    order, starts, (bod_units, bod_from) = _group(bod_units, to_epoch_seconds(df_bod["timeFrom"]))
+    bod_hashes = _hash_rows(df_bod, BOD_COLUMNS, BOD_SALT)[order]
+    bod_hashes = np.add.reduceat(bod_hashes, starts) if len(starts) > 0 else bod_hashes
+
+    units = np.concatenate([fpn_units, boal_units, bod_units])
+    periods = np.concatenate([fpn_periods, boal_periods, bod_from // period_seconds * period_seconds])
+    hashes = np.concatenate([fpn_hashes, boal_hashes, bod_hashes])
+
+    order, starts, (units, periods) = _group(units, periods)
+    counts = np.diff(np.r_[starts, len(order)])
+    hashes = np.add.reduceat(hashes[order], starts)
+
+    # add the latest BOD rows at or before the start of each period
+    if len(bod_units) > 0:
+        span = max(periods.max(), bod_from.max()) - min(periods.min(), bod_from.min()) + 1
+        bod_keys = bod_units * span + bod_from - bod_from.min()
+        period_keys = units * span + periods - bod_from.min()
+        latest = np.searchsorted(bod_keys, period_keys, side="right") - 1
+        valid = latest >= 0
+        valid[valid] = bod_units[latest[valid]] == units[valid]
+        hashes[valid] += bod_hashes[latest[valid]]
+
+    return pd.DataFrame(
+        {
+            "Unit": np.asarray(unit_names)[units],
+            "Time": periods,
+            "fingerprint": [f"v{CACHE_VERSION}-{count}-{value:016x}" for count, value in zip(counts, hashes)],
+        },
+        columns=columns,
+    )
+
+
+def select_inputs_for_periods(
+    df_fpn: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    df_bod: pd.DataFrame,
+    df_periods: pd.DataFrame,
+    period_seconds: int = SETTLEMENT_PERIOD_SECONDS,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Select the rows needed to recompute the (Unit, Time) periods in `df_periods`.
+
+    For every unit this is a window from one period before its first period to one period after its
+    last one, with the last FPN row before the window and the first one after it, which the engines
+    interpolate from if the window is in a gap between FPN rows. The periods asked for are then computed
+    exactly as they would be from all the data. Units without any periods in `df_periods` are dropped.
+    """
+
+    windows = df_periods.groupby("Unit")["Time"].agg(["min", "max"])
+    window_start = windows["min"] - period_seconds
+    window_end = windows["max"] + 2 * period_seconds
+
+    def in_window(df, time_from, time_to):
+        start = window_start.reindex(df.index).to_numpy()
+        end = window_end.reindex(df.index).to_numpy()
+        return (time_to >= start) & (time_from <= end)
+
+    # FPNs in the window, and the ones on either side of it
+    fpn_from = pd.Series(to_epoch_seconds(df_fpn["timeFrom"]), index=df_fpn.index)
+    fpn_to = pd.Series(to_epoch_seconds(df_fpn["timeTo"]), index=df_fpn.index)
+    before = fpn_to.where(fpn_to.to_numpy() < window_start.reindex(df_fpn.index).to_numpy())
+    after = fpn_from.where(fpn_from.to_numpy() > window_end.reindex(df_fpn.index).to_numpy())
+    fpn_mask = (
+        in_window(df_fpn, fpn_from.to_numpy(), fpn_to.to_numpy())
+        | (fpn_to.to_numpy() == before.groupby(level=0).transform("max").to_numpy())
+        | (fpn_from.to_numpy() == after.groupby(level=0).transform("min").to_numpy())
+    )
+
+    # keep whole acceptances, as long as they are active in the window
+    boal_from, boal_to = to_epoch_seconds(df_boal["timeFrom"]), to_epoch_seconds(df_boal["timeTo"])
+    accepts = [df_boal.index, df_boal["Accept ID"]]
+    accept_from = pd.Series(boal_from, index=df_boal.index).groupby(accepts).transform("min").to_numpy()
+    accept_to = pd.Series(boal_to, index=df_boal.index).groupby(accepts).transform("max").to_numpy()
+    boal_mask = in_window(df_boal, accept_from, accept_to)
+
+    # BODs in the window, and the latest ones before it
+    bod_from = pd.Series(to_epoch_seconds(df_bod["timeFrom"]), index=df_bod.index)
+    before = bod_from.where(bod_from.to_numpy() < window_start.reindex(df_bod.index).to_numpy())
+    latest_before = before.groupby(level=0).transform("max").to_numpy()
+    bod_mask = in_window(df_bod, bod_from.to_numpy(), bod_from.to_numpy()) | (bod_from.to_numpy() == latest_before)
+
+    return df_fpn[fpn_mask], df_boal[boal_mask], df_bod[bod_mask]
+
+
+def analyze_units_with_cache(
+    df_fpn: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    df_bod: pd.DataFrame,
+    cache: CurtailmentCache,
+    engine: str,
+    analyze_units: Callable[[pd.DataFrame, pd.DataFrame, pd.DataFrame], pd.DataFrame],
+    start_time=None,
+    end_time=None,
+) -> pd.DataFrame:
+    """
+    Incremental version of `analyze_units`, which produces one row per (Unit, Time) settlement period.
+
+    Only periods whose fingerprint differs from the cached one are recomputed. The new results are
+    written to the cache and merged with the unchanged cached ones.
+
+    Only the periods from `start_time` up to `end_time` are cached and returned. The periods at the edges of the
+    data loaded for that range also depend on data outside of it, e.g. the minute engine interpolates across
+    them, so their results are not complete and must not be cached.
+    """
+
+    df_fingerprints = fingerprint_inputs(df_fpn=df_fpn, df_boal=df_boal, df_bod=df_bod)
+    if start_time is not None:
+        start_seconds = add_utc_timezone(pd.Timestamp(start_time)).timestamp()
+        df_fingerprints = df_fingerprints[df_fingerprints["Time"] >= start_seconds]
+    if end_time is not None:
+        end_seconds = add_utc_timezone(pd.Timestamp(end_time)).timestamp()
+        df_fingerprints = df_fingerprints[df_fingerprints["Time"] < end_seconds]
+    if len(df_fingerprints) == 0:
+        return analyze_units(df_fpn, df_boal, df_bod)
+
+    df_cached = cache.get(engine, df_fingerprints["Time"].min(), df_fingerprints["Time"].max())
+    df = df_fingerprints.merge(df_cached, on=["Unit", "Time"], how="left", suffixes=("", "_cached"))
+
+    changed = (df["fingerprint"] != df["fingerprint_cached"]).to_numpy()
+    df_changed = df.loc[changed, ["Unit", "Time", "fingerprint"]]
+    df_unchanged = df.loc[~changed].drop(columns=["fingerprint_cached"])
+    logger.info(f"Recomputing curtailment for {len(df_changed)} of {len(df)} unit settlement periods")
+
+    if len(df_changed) > 0:
+        df_recomputed = analyze_units(*select_inputs_for_periods(df_fpn, df_boal, df_bod, df_changed))
+        df_recomputed["Time"] = to_epoch_seconds(df_recomputed["Time"])
+
+        df_changed = df_changed.merge(df_recomputed, on=["Unit", "Time"], how="left")
+        df_changed["has_output"] = df_changed["delta"].notna()
+        df_changed[RESULT_COLUMNS] = df_changed[RESULT_COLUMNS].fillna(0.0)
+
+        cache.put(engine, df_changed)
+
+    df = pd.concat([df_unchanged, df_changed])
+    df = df[df["has_output"].astype(bool)]
+    df = df.sort_values(["Unit", "Time"]).reset_index(drop=True)
+    df["Time"] = from_epoch_seconds(df["Time"])
+
+    return df[["Unit", "Time"] + RESULT_COLUMNS]
@@ -0,0 +1,346 @@
+"""
+Exact curtailment engine.
+
+Instead of upsampling every unit to one row per minute, the FPN and BOAL segments are treated as
+piecewise-linear functions of time. All breakpoints (FPN, BOAL, BOD price changes and settlement period
+boundaries) are merged per unit, and each interval between consecutive breakpoints is integrated exactly
+with the trapezoid rule. Memory and CPU scale with the number of segments, not the number of minutes,
+and second-level times are not rounded.
+
+Compared to the minute engine:
+- BOAL ramps are linear between `levelFrom` and `levelTo`, rather than held at `levelFrom` until the next minute
+- an acceptance is active from its first `timeFrom` to its last `timeTo`, and the last "Accept ID" wins
+- the bid price (pair -1) at any time is the latest one with `timeFrom` before that time. With ladder costing,
+  each interval's average turn down is split across the bid ladder
+"""
+import logging
+from typing import Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from lib.bid_prices import BidPriceIndex
+from lib.curtailment_acceptances import sum_acceptance_periods
+from lib.settlement_periods import SETTLEMENT_PERIOD_SECONDS, from_epoch_seconds, to_epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+SECONDS_TO_HOURS = 1 / 3600
+
+
+def _evaluate_line(time_from, time_to, level_from, level_to, times):
+    """Evaluate the straight line through (time_from, level_from) and (time_to, level_to) at `times`"""
+    duration = (time_to - time_from).astype(float)
+    slope = np.divide(level_to - level_from, duration, out=np.zeros_like(duration), where=duration > 0)
+    return level_from + slope * (times - time_from)
+
+
+def _sort_segments(keys, time_from, *columns):
+    """Sort segments by (key, time_from), keeping the original order for ties"""
+    order = np.lexsort((np.arange(len(keys)), time_from, keys))
+    return (keys[order], time_from[order]) + tuple(column[order] for column in columns)
+
+
+def _fill_fpn_gaps(units, time_from, time_to, level_from, level_to):
+    """Add segments interpolating linearly across gaps between consecutive FPNs of the same unit,
+    like the `interpolate()` in the minute engine"""
+    units, time_from, time_to, level_from, level_to = _sort_segments(units, time_from, time_to, level_from, level_to)
+
+    gap = (units[1:] == units[:-1]) & (time_from[1:] > time_to[:-1])
+    before, after = np.flatnonzero(gap), np.flatnonzero(gap) + 1
+
+    return _sort_segments(
+        np.concatenate([units, units[after]]),
+        np.concatenate([time_from, time_to[before]]),
+        np.concatenate([time_to, time_from[after]]),
+        np.concatenate([level_from, level_to[before]]),
+        np.concatenate([level_to, level_from[after]]),
+    )
+
+
+def _period_boundaries(units, time_from, time_to, period_seconds):
+    """Every period boundary inside each unit's [first time_from, last time_to] range"""
+    unit_keys, first = np.unique(units, return_index=True)
+    start = np.minimum.reduceat(time_from, first)
+    end = np.maximum.reduceat(time_to, first)
+
+    start = -(-start // period_seconds) * period_seconds
+    counts = np.maximum((end - start) // period_seconds + 1, 0)
+    offsets = np.r_[0, np.cumsum(counts)[:-1]]
+    repeated = np.repeat(np.arange(len(unit_keys)), counts)
+    times = start[repeated] + (np.arange(counts.sum()) - offsets[repeated]) * period_seconds
+
+    return unit_keys[repeated], times
+
+
+def build_curtailment_segments(
+    df_fpn: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    df_bod: pd.DataFrame,
+    period_seconds: int = SETTLEMENT_PERIOD_SECONDS,
+    costing: str = "pair",
+) -> pd.DataFrame:
+    """
+    Merge the FPN, BOAL and BOD breakpoints of all units into intervals on which FPN and BOAL levels
+    are linear and the bid price is constant. Intervals never cross a `period_seconds` boundary.
+
+    The inputs are indexed by unit, as returned by `DbRepository.get_data_for_time_range`.
+    Returns one row per interval, with the unit, the start and end in seconds since the epoch,
+    the FPN and BOAL levels at both ends, the winning "Accept ID" and the bid price for `costing`,
+    see `BidPriceIndex.lookup_for_costing`.
+    """
+
+    columns = [
+        "Unit",
+        "time_from",
+        "time_to",
+        "fpn_from",
+        "fpn_to",
+        "boal_from",
+        "boal_to",
+        "Accept ID",
+        "bidPrice",
+    ]
+
+    df_fpn = df_fpn[df_fpn["timeTo"] > df_fpn["timeFrom"]]
+    if len(df_fpn) == 0:
+        return pd.DataFrame(columns=columns)
+
+    df_boal = df_boal[(df_boal["timeTo"] > df_boal["timeFrom"]) & df_boal["Accept ID"].notna()]
+
+    # one integer code per unit, shared by all three tables
+    unit_names = pd.Index(df_fpn.index.unique()).union(df_boal.index.unique()).union(df_bod.index.unique())
+    unit_names = unit_names.sort_values()
+    fpn_units = unit_names.get_indexer(df_fpn.index).astype(np.int64)
+    boal_units = unit_names.get_indexer(df_boal.index).astype(np.int64)
+    bod_units = unit_names.get_indexer(df_bod.index).astype(np.int64)
+
+    fpn_from, fpn_to = to_epoch_seconds(df_fpn["timeFrom"]), to_epoch_seconds(df_fpn["timeTo"])
+    boal_from, boal_to = to_epoch_seconds(df_boal["timeFrom"]), to_epoch_seconds(df_boal["timeTo"])
+    bod_from = to_epoch_seconds(df_bod["timeFrom"])
+
+    # Times are offset so every unit gets its own range of keys: key = unit * span + time.
+    # Keys are doubled, so interval midpoints are integers too.
+    origin = min(fpn_from.min(), boal_from.min(initial=fpn_from.min()), bod_from.min(initial=fpn_from.min()))
+    origin = origin // period_seconds * period_seconds
+    span = max(fpn_to.max(), boal_to.max(initial=0), bod_from.max(initial=0)) - origin + 1
+
+    def key(units, times):
+        return 2 * (units * span + times - origin)
+
+    # FPN as a continuous piecewise-linear function per unit
+    (fpn_units, fpn_from, fpn_to, fpn_level_from, fpn_level_to) = _fill_fpn_gaps(
+        fpn_units,
+        fpn_from,
+        fpn_to,
+        df_fpn["levelFrom"].to_numpy(float),
+        df_fpn["levelTo"].to_numpy(float),
+    )
+
+    # all breakpoints, per unit
+    boundary_units, boundary_times = _period_boundaries(fpn_units, fpn_from, fpn_to, period_seconds)
+    breakpoints = np.unique(
+        np.concatenate(
+            [
+                key(fpn_units, fpn_from),
+                key(fpn_units, fpn_to),
+                key(boal_units, boal_from),
+                key(boal_units, boal_to),
+                key(bod_units, bod_from),
+                key(boundary_units, boundary_times),
+            ]
+        )
+    )
+    interval_units = breakpoints // (2 * span)
+    same_unit = interval_units[1:] == interval_units[:-1]
+    interval_from, interval_to = breakpoints[:-1], breakpoints[1:]
+    interval_midpoint = (interval_from + interval_to) // 2
+
+    # keep intervals covered by an FPN
+    fpn_from_keys, fpn_to_keys = key(fpn_units, fpn_from), key(fpn_units, fpn_to)
+    fpn_index = np.searchsorted(fpn_from_keys, interval_midpoint, side="right") - 1
+    covered = same_unit & (fpn_index >= 0)
+    covered[covered] = interval_midpoint[covered] < fpn_to_keys[fpn_index[covered]]
+
+    interval_index = np.flatnonzero(covered)
+    interval_from, interval_to = interval_from[interval_index], interval_to[interval_index]
+    interval_midpoint, fpn_index = interval_midpoint[interval_index], fpn_index[interval_index]
+    interval_units = interval_units[interval_index]
+
+    def time_of(keys):
+        return keys // 2 - interval_units * span + origin
+
+    seconds_from, seconds_to = time_of(interval_from), time_of(interval_to)
+
+    fpn_args = (fpn_from[fpn_index], fpn_to[fpn_index], fpn_level_from[fpn_index], fpn_level_to[fpn_index])
+    fpn_at_from = _evaluate_line(*fpn_args, seconds_from)
+    fpn_at_to = _evaluate_line(*fpn_args, seconds_to)
+
+    # BOAL: one group per (unit, acceptance), active from its first timeFrom to its last timeTo
+    boal_at_from = np.full(len(interval_index), np.nan)
+    boal_at_to = np.full(len(interval_index), np.nan)
+    accept_ids = np.full(len(interval_index), None, dtype=object)
+
+    if len(df_boal) > 0:
+        accept_ranks, accept_names = pd.factorize(df_boal["Accept ID"], sort=True)
+        group_keys = boal_units * len(accept_names) + accept_ranks.astype(np.int64)
+
+        (group_keys, boal_from, boal_to, boal_level_from, boal_level_to) = _sort_segments(
+            group_keys,
+            boal_from,
+            boal_to,
+            df_boal["levelFrom"].to_numpy(float),
+            df_boal["levelTo"].to_numpy(float),
+        )
+        groups, first = np.unique(group_keys, return_index=True)
+        group_units = groups // len(accept_names)
+        group_start = key(group_units, np.minimum.reduceat(boal_from, first))
+        group_end = key(group_units, np.maximum.reduceat(boal_to, first))
+
+        # expand every acceptance over the intervals it covers and keep the latest one
+        low = np.searchsorted(interval_from, group_start, side="left")
+        high = np.searchsorted(interval_from, group_end, side="left")
+        counts = high - low
+        offsets = np.r_[0, np.cumsum(counts)[:-1]]
+        covering_group = np.repeat(np.arange(len(groups)), counts)
+        covered_interval = low[covering_group] + np.arange(counts.sum()) - offsets[covering_group]
+
+        winner = np.full(len(interval_index), -1)
+        np.maximum.at(winner, covered_interval, covering_group)
+        active = winner >= 0
+
+        # the winning acceptance's segment at each interval, holding its last level across any gaps
+        segment_keys = np.searchsorted(groups, group_keys) * span + boal_from - origin
+        segment_index = (
+            np.searchsorted(
+                segment_keys, winner[active] * span + time_of(interval_midpoint)[active] - origin, side="right"
+            )
+            - 1
+        )
+        segment_args = (
+            boal_from[segment_index],
+            boal_to[segment_index],
+            boal_level_from[segment_index],
+            boal_level_to[segment_index],
+        )
+        in_gap = seconds_to[active] > boal_to[segment_index]
+        boal_at_from[active] = np.where(
+            in_gap, boal_level_to[segment_index], _evaluate_line(*segment_args, seconds_from[active])
+        )
+        boal_at_to[active] = np.where(
+            in_gap, boal_level_to[segment_index], _evaluate_line(*segment_args, seconds_to[active])
+        )
+        accept_ids[active] = np.asarray(accept_names)[groups[winner[active]] % len(accept_names)]
+
+    # bid price, as-of the start of each interval, for the average turn down over the interval
+    mean_delta = np.nan_to_num(0.5 * (fpn_at_from + fpn_at_to - boal_at_from - boal_at_to))
+    bid_prices = BidPriceIndex(df_bod).lookup_for_costing(
+        np.asarray(unit_names)[interval_units], seconds_from, mean_delta, costing=costing
+    )
+
+    return pd.DataFrame(
+        {
+            "Unit": np.asarray(unit_names)[interval_units],
+            "time_from": seconds_from,
+            "time_to": seconds_to,
+            "fpn_from": fpn_at_from,
+            "fpn_to": fpn_at_to,
+            "boal_from": boal_at_from,
+            "boal_to": boal_at_to,
+            "Accept ID": accept_ids,
+            "bidPrice": bid_prices,
+        },
+        columns=columns,
+    )
+
+
+def _integrate_segments(df_segments: pd.DataFrame, period_seconds: int) -> pd.DataFrame:
+    """MWh of every segment with the trapezoid rule, and the period it is in"""
+
+    hours = (df_segments["time_to"] - df_segments["time_from"]).to_numpy(float) * SECONDS_TO_HOURS
+
+    fpn_mwh = 0.5 * (df_segments["fpn_from"] + df_segments["fpn_to"]).to_numpy(float) * hours
+    boal_mwh = 0.5 * (df_segments["boal_from"] + df_segments["boal_to"]).to_numpy(float) * hours
+    active = ~np.isnan(boal_mwh)
+
+    # If there is no BOALF, then the level after the BOAL is the same as the FPN!
+    after_boal_mwh = np.where(active, boal_mwh, fpn_mwh)
+    delta_mwh = fpn_mwh - after_boal_mwh
+
+    # bid price is negative
+    cost_gbp = np.nan_to_num(-df_segments["bidPrice"].to_numpy(float) * delta_mwh)
+
+    return pd.DataFrame(
+        {
+            "Unit": df_segments["Unit"].to_numpy(),
+            "Time": df_segments["time_from"].to_numpy(np.int64) // period_seconds * period_seconds,
+            "Level_FPN": fpn_mwh,
+            "Level_BOAL": np.where(active, boal_mwh, 0.0),
+            "Level_After_BOAL": after_boal_mwh,
+            "delta": delta_mwh,
+            "energy_mwh": delta_mwh,
+            "cost_gbp": cost_gbp,
+        }
+    )
+
+
+def integrate_curtailment_segments(
+    df_segments: pd.DataFrame, period_seconds: int = SETTLEMENT_PERIOD_SECONDS
+) -> pd.DataFrame:
+    """
+    Integrate the intervals from `build_curtailment_segments` with the trapezoid rule and sum them into
+    periods of `period_seconds`. Levels are averages in MW over the period, energy is in MWh.
+    """
+
+    df = _integrate_segments(df_segments, period_seconds)
+    df = df.groupby(["Unit", "Time"], sort=True).sum().reset_index()
+
+    # MWh in each period to average MW
+    period_hours = period_seconds * SECONDS_TO_HOURS
+    for column in ["Level_FPN", "Level_BOAL", "Level_After_BOAL", "delta"]:
+        df[column] = df[column] / period_hours
+
+    return df
+
+
+def integrate_acceptance_segments(
+    df_segments: pd.DataFrame, period_seconds: int = SETTLEMENT_PERIOD_SECONDS
+) -> pd.DataFrame:
+    """Energy and cost of the intervals from `build_curtailment_segments`, summed by (Unit, Accept ID, period).
+    Times are in seconds since the epoch."""
+
+    df = _integrate_segments(df_segments, period_seconds)[["Unit", "Time", "energy_mwh", "cost_gbp"]]
+    df["Accept ID"] = df_segments["Accept ID"].to_numpy()
+    df["time_from"] = df_segments["time_from"].to_numpy(np.int64)
+    df["time_to"] = df_segments["time_to"].to_numpy(np.int64)
+
+    return sum_acceptance_periods(df)
+
+
+def analyze_units_exact(
+    df_fpn: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    df_bod: pd.DataFrame,
+    costing: str = "pair",
+    acceptances: bool = False,
+    period_seconds: int = SETTLEMENT_PERIOD_SECONDS,
+) -> Union[pd.DataFrame, Tuple[pd.DataFrame, pd.DataFrame]]:
+    """Exact equivalent of `analyze_units_by_minute`: one row per (Unit, Time) settlement period, or period
+    of `period_seconds`, with Time in Europe/London, and with `acceptances` the (Unit, Accept ID, Time) sums
+    as well"""
+
+    df_segments = build_curtailment_segments(
+        df_fpn=df_fpn, df_boal=df_boal, df_bod=df_bod, period_seconds=period_seconds, costing=costing
+    )
+    logger.info(f"Integrating {len(df_segments)} segments for {df_segments['Unit'].nunique()} units")
+
+    df = integrate_curtailment_segments(df_segments, period_seconds=period_seconds)
+    df["Time"] = from_epoch_seconds(df["Time"])
+
+    if acceptances:
+        df_acceptance_periods = integrate_acceptance_segments(df_segments, period_seconds=period_seconds)
+        for column in ["Time", "time_from", "time_to"]:
+            df_acceptance_periods[column] = from_epoch_seconds(df_acceptance_periods[column])
+        return df, df_acceptance_periods
+
+    return df
@@ -0,0 +1,265 @@
+"""
+Golden equivalence of curtailment engines against the reference implementation.
+
+The published numbers come from the original per-unit pandas implementation: `analyze_one_unit` for every unit,
+resolving overlapping BOALs with `resolve_applied_bid_offer_level`, and averaging every unit into settlement
+periods. The engines share and have since rewritten those functions, so a frozen copy of them as they were is
+kept here (`_reference_analyze_one_unit` and its helpers), and must not be changed along with the engines.
+`reference_analyze_units` runs that copy, and `compare_to_reference` diffs any engine against it, per unit and
+settlement period, so faster engines can be checked for methodology drift.
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from lib.curtailment import CURTAILMENT_COLUMNS, _analyze_units
+from lib.db_utils import UnitPartition
+from lib.settlement_periods import to_local, to_utc
+
+logger = logging.getLogger(__name__)
+
+# columns compared, and the absolute tolerance of each: MW for levels and delta, £ for cost
+GOLDEN_TOLERANCES = {
+    "delta": 1e-6,
+    "Level_FPN": 1e-6,
+    "Level_After_BOAL": 1e-6,
+    "Level_BOAL": 1e-6,
+    "cost_gbp": 1e-4,
+}
+# relative tolerance, on top of the absolute tolerances
+GOLDEN_RTOL = 1e-9
+
+
+def _reference_resolve_applied_bid_offer_level(df_linear: pd.DataFrame):
+    """Frozen copy of the original `resolve_applied_bid_offer_level`: the latest acceptance for every minute"""
+
+    if len(df_linear) == 0:
+        return df_linear
+
+    out = []
+
+    for accept_id, data in df_linear.groupby("Accept ID"):
+        high_freq = data.reset_index().rename(columns={"index": "Unit"}).set_index("Time").resample("T").first()
+        out.append(high_freq.interpolate("ffill").fillna(method="ffill"))
+
+    recombined = pd.concat(out)
+
+    # Select the latest commitment for every timepoint
+    resolved = recombined.reset_index().groupby("Time").last()
+
+    return resolved
+
+
+def _reference_linearize_physical_data(df: pd.DataFrame):
+    """Frozen copy of the original `linearize_physical_data`: From/To rows as one row per point in time"""
+
+    df = df.copy()
+    from_columns = ["levelFrom", "timeFrom"]
+    to_columns = ["levelTo", "timeTo"]
+
+    if type(df) == pd.Series:
+        # this sometime happens if there is only one data point
+        df = pd.DataFrame(df).T
+
+    base_columns = [x for x in df.columns.copy() if x not in from_columns + to_columns]
+
+    if len(df) == 0:
+        return pd.DataFrame(columns=base_columns + ["Level", "Time"])
+
+    df = pd.concat(
+        (
+            df[base_columns + from_columns].rename(columns={"levelFrom": "Level", "timeFrom": "Time"}),
+            df[base_columns + to_columns].rename(columns={"levelTo": "Level", "timeTo": "Time"}),
+        )
+    )
+
+    df["Level"] = df["Level"].astype(float)
+    return df
+
+
+def _reference_analyze_one_unit(
+    df_boal_unit: pd.DataFrame,
+    df_fpn_unit: pd.DataFrame,
+    df_bod_unit: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """Frozen copy of the original `analyze_one_unit`: FPN and BOAL levels of one unit per minute, with the
+    delta between them costed at the latest bid price of bid-offer pair -1"""
+
+    if isinstance(df_boal_unit, pd.Series):
+        df_boal_unit = pd.DataFrame(df_boal_unit).T
+
+    if type(df_fpn_unit) == pd.Series:
+        df_fpn_unit = pd.DataFrame(df_fpn_unit).T
+
+    # Make time linear
+    df_boal_linear = _reference_linearize_physical_data(df_boal_unit)
+    df_boal_linear["Accept Time str"] = df_boal_linear["Accept Time"].astype(str)
+
+    # resolve boa data
+    unit_boal_resolved = _reference_resolve_applied_bid_offer_level(df_boal_linear)
+
+    unit_fpn_resolved = (
+        _reference_linearize_physical_data(df_fpn_unit)
+        .set_index("Time")
+        .resample("T")
+        .mean(numeric_only=True)
+        .interpolate()
+    )
+    unit_fpn_resolved["Notification Type"] = "FPN"
+
+    # remove last time valye as we dont want to incluce the first minute in the next 30 mins
+    unit_fpn_resolved = unit_fpn_resolved.iloc[:-1]
+
+    # We merge BOAL to FPN, so all FPN data is preserved. We want to include
+    # units with an FPN but not BOAL
+    df_merged = unit_fpn_resolved.join(unit_boal_resolved["Level"], lsuffix="_FPN", rsuffix="_BOAL")
+
+    # If there is no BOALF, then the level after the BOAL is the same as the FPN!
+    df_merged["Level_After_BOAL"] = df_merged["Level_BOAL"].fillna(df_merged["Level_FPN"])
+    df_merged["delta"] = df_merged["Level_FPN"] - df_merged["Level_After_BOAL"]
+
+    if df_bod_unit is not None:
+        df_bod_unit = df_bod_unit.copy()
+        df_bod_unit.reset_index(inplace=True)
+        df_bod_unit["bidOfferPairNumber"] = df_bod_unit["bidOfferPairNumber"].astype(float)
+        mask = df_bod_unit["bidOfferPairNumber"] == -1.0
+        df_bod_unit = df_bod_unit.loc[mask]
+        df_bod_unit["bidPrice"] = df_bod_unit["bidPrice"].astype(float)
+
+        # put bid Price into returned dat
+        df_bod_unit["Time"] = pd.to_datetime(df_bod_unit.loc[:, "timeFrom"])
+
+        df_merged = df_merged.merge(df_bod_unit[["bidPrice", "Time"]], on=["Time"], how="outer")
+        df_merged["bidPrice"].ffill(inplace=True)
+
+        # bid price is negative
+        df_merged["energy_mwh"] = df_merged["delta"] * 1 / 60
+        df_merged["cost_gbp"] = -df_merged["bidPrice"] * df_merged["energy_mwh"]
+
+    # change Time from UTC to Europe/London, this is because Time is made from timeFrom which is in UTC
+    df_merged["Time"] = pd.to_datetime(df_merged["Time"].dt.tz_localize("UTC")).dt.tz_convert("Europe/London")
+
+    return df_merged
+
+
+def reference_analyze_units(df_fpn: pd.DataFrame, df_boal: pd.DataFrame, df_bod: pd.DataFrame) -> pd.DataFrame:
+    """The reference implementation, one row per (Unit, Time) settlement period with `CURTAILMENT_COLUMNS`.
+
+    Every unit is analyzed on its own by the frozen copy of the original `analyze_one_unit`, with its own BOAL
+    resolution and bid prices. This is slow, and only meant for checking other engines.
+    """
+
+    fpn_by_unit, boal_by_unit, bod_by_unit = UnitPartition(df_fpn), UnitPartition(df_boal), UnitPartition(df_bod)
+    units = sorted(set(fpn_by_unit.units) | set(boal_by_unit.units) | set(bod_by_unit.units))
+
+    curtailment_dfs = []
+    for unit in units:
+        df_curtailment_unit = _reference_analyze_one_unit(
+            df_boal_unit=boal_by_unit[unit], df_fpn_unit=fpn_by_unit[unit], df_bod_unit=bod_by_unit[unit]
+        )
+        df_curtailment_unit["Unit"] = unit
+        curtailment_dfs.append(df_curtailment_unit[["Unit", "Time"] + CURTAILMENT_COLUMNS])
+
+    df = pd.concat(curtailment_dfs)
+    df["Level_BOAL"] = df["Level_BOAL"].fillna(0.0)
+    df["cost_gbp"] = df["cost_gbp"].fillna(0.0)
+
+    # floor in UTC, as local times are ambiguous when the clocks go back
+    df["Time"] = to_local(to_utc(df["Time"]).dt.floor("30min"))
+    df = df.groupby(["Unit", "Time"])[CURTAILMENT_COLUMNS].sum().reset_index()
+
+    for column in ["delta", "Level_After_BOAL", "Level_BOAL", "Level_FPN"]:
+        df[column] = df[column] / 30
+
+    return df
+
+
+@dataclass
+class GoldenReport:
+    """Differences between an engine and the reference.
+
+    `differences` has one row per (Unit, Time) where any column is out of tolerance, or that only one of
+    them has, with the value of both and the absolute difference of every column. `units` summarizes
+    these per unit: the number of periods that differ, and the largest absolute difference of every column.
+    """
+
+    differences: pd.DataFrame
+    units: pd.DataFrame
+    tolerances: Dict[str, float] = field(default_factory=lambda: dict(GOLDEN_TOLERANCES))
+
+    @property
+    def passed(self) -> bool:
+        return len(self.differences) == 0
+
+    def summary(self) -> str:
+        if self.passed:
+            return "Engine matches the reference for all units and periods"
+
+        return (
+            f"{len(self.differences)} periods of {len(self.units)} units differ from the reference\n"
+            f"{self.units.to_string()}"
+        )
+
+
+def compare_to_reference(
+    df_reference: pd.DataFrame,
+    df_engine: pd.DataFrame,
+    tolerances: Dict[str, float] = GOLDEN_TOLERANCES,
+    rtol: float = GOLDEN_RTOL,
+) -> GoldenReport:
+    """Diff the per (Unit, Time) results of an engine against the reference, see `GoldenReport`"""
+
+    columns = list(tolerances)
+    df = pd.merge(
+        df_reference[["Unit", "Time"] + columns],
+        df_engine[["Unit", "Time"] + columns],
+        on=["Unit", "Time"],
+        how="outer",
+        suffixes=("_reference", "_engine"),
+        indicator=True,
+    )
+
+    out_of_tolerance = df["_merge"] != "both"
+    for column in columns:
+        reference, engine = df[f"{column}_reference"].to_numpy(float), df[f"{column}_engine"].to_numpy(float)
+        df[f"{column}_diff"] = np.abs(engine - reference)
+        out_of_tolerance |= ~np.isclose(engine, reference, rtol=rtol, atol=tolerances[column])
+
+    df = df.rename(columns={"_merge": "found_in"})
+    df["found_in"] = df["found_in"].map({"both": "both", "left_only": "reference", "right_only": "engine"})
+    differences = df[out_of_tolerance].sort_values(["Unit", "Time"]).reset_index(drop=True)
+
+    units = differences.groupby("Unit").agg(
+        periods=("Time", "size"), **{f"max_{column}_diff": (f"{column}_diff", "max") for column in columns}
+    )
+
+    return GoldenReport(differences=differences, units=units, tolerances=dict(tolerances))
+
+
+def check_engine(
+    df_fpn: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    df_bod: pd.DataFrame,
+    engine: Union[str, Callable[[pd.DataFrame, pd.DataFrame, pd.DataFrame], pd.DataFrame]],
+    tolerances: Dict[str, float] = GOLDEN_TOLERANCES,
+    rtol: float = GOLDEN_RTOL,
+) -> GoldenReport:
+    """Run the reference and `engine` on the same inputs, and diff them.
+
+    `engine` is the name of an `analyze_curtailment` engine, or a function of the FPN, BOAL and BOD data that
+    returns one row per (Unit, Time) settlement period, like the engines.
+    """
+
+    df_reference = reference_analyze_units(df_fpn, df_boal, df_bod)
+    if isinstance(engine, str):
+        df_engine = _analyze_units(df_fpn, df_boal, df_bod, engine=engine)
+    else:
+        df_engine = engine(df_fpn, df_boal, df_bod)
+
+    report = compare_to_reference(df_reference, df_engine, tolerances=tolerances, rtol=rtol)
+    logger.info(report.summary())
+
+    return report
@@ -0,0 +1,70 @@
+"""
+Per-unit curtailment, as a compact unit x settlement period matrix.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# matrix field -> column of the per-unit curtailment frame
+MATRIX_COLUMNS = {
+    "delta": "delta",
+    "level_fpn": "Level_FPN",
+    "level_after_boal": "Level_After_BOAL",
+    "cost_gbp": "cost_gbp",
+}
+
+
+@dataclass
+class CurtailmentMatrix:
+    """
+    Curtailment per unit and settlement period. Every value array has shape (len(units), len(times)),
+    with NaN where a unit has no data for a period.
+
+    delta, level_fpn and level_after_boal are average MW over the period, cost_gbp is in £.
+    """
+
+    units: np.ndarray
+    times: pd.DatetimeIndex
+    delta: np.ndarray
+    level_fpn: np.ndarray
+    level_after_boal: np.ndarray
+    cost_gbp: np.ndarray
+
+    @classmethod
+    def from_unit_frame(cls, df: pd.DataFrame) -> "CurtailmentMatrix":
+        """Build the matrix from the one row per (Unit, Time) frame the curtailment engines produce"""
+
+        unit_codes, units = pd.factorize(df["Unit"], sort=True)
+        time_codes, times = pd.factorize(df["Time"], sort=True)
+
+        values = {}
+        for field, column in MATRIX_COLUMNS.items():
+            matrix = np.full((len(units), len(times)), np.nan)
+            matrix[unit_codes, time_codes] = df[column].to_numpy(float)
+            values[field] = matrix
+
+        return cls(units=np.asarray(units, dtype=object), times=pd.DatetimeIndex(times), **values)
+
+    def national(self) -> pd.DataFrame:
+        """Sum over all units, for every settlement period"""
+        return pd.DataFrame(
+            {field: np.nansum(getattr(self, field), axis=0) for field in MATRIX_COLUMNS},
+            index=pd.Index(self.times, name="Time"),
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Long format, one row per (unit, time) with data"""
+        unit_index, time_index = np.nonzero(~np.isnan(self.delta))
+        return pd.DataFrame(
+            {
+                "unit": pd.Categorical.from_codes(unit_index, categories=self.units),
+                "time": self.times[time_index],
+                **{field: getattr(self, field)[unit_index, time_index] for field in MATRIX_COLUMNS},
+            }
+        )
+
+    def to_arrow(self) -> pa.Table:
+        """Long format Arrow table, with the unit dictionary encoded"""
+        return pa.Table.from_pandas(self.to_frame(), preserve_index=False)
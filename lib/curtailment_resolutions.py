@@ -0,0 +1,84 @@
+"""
+Curtailment at several time resolutions, from one engine pass.
+
+The engines integrate every unit into periods of the finest resolution asked for (at most a settlement
+period). Coarser resolutions are rolled up from those periods in memory, as every coarser period is a
+whole number of finer ones, including days and months in Europe/London.
+
+In every resolution the level and delta columns are average MW over the whole period, i.e. its MWh divided
+by its length in hours (so 23 or 25 hours on clock change days), and energy_mwh and cost_gbp are sums.
+As averages are over the whole period, rows for the same unit and period computed from separate parts of
+the data (e.g. separate windows of `analyze_curtailment_in_windows`) can be added up.
+"""
+from typing import Dict, List
+
+import pandas as pd
+
+# resolution -> seconds, for the resolutions the engines can integrate into directly
+ENGINE_RESOLUTIONS = {"1min": 60, "5min": 300, "30min": 1800}
+CALENDAR_RESOLUTIONS = ["day", "month"]
+RESOLUTIONS = list(ENGINE_RESOLUTIONS) + CALENDAR_RESOLUTIONS
+
+MW_AVERAGE_COLUMNS = ["Level_FPN", "Level_BOAL", "Level_After_BOAL", "delta"]
+SUM_COLUMNS = ["energy_mwh", "cost_gbp"]
+
+
+def check_resolutions(resolutions: List[str]):
+    unknown = [resolution for resolution in resolutions if resolution not in RESOLUTIONS]
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown resolutions {unknown}, should be in {RESOLUTIONS}")
+
+
+def engine_period_seconds(resolutions: List[str]) -> int:
+    """Length of the periods the engines need to integrate into, to produce all of `resolutions`"""
+    seconds = [ENGINE_RESOLUTIONS[resolution] for resolution in resolutions if resolution in ENGINE_RESOLUTIONS]
+    return min(seconds + [ENGINE_RESOLUTIONS["30min"]])
+
+
+def period_starts(times: pd.Series, resolution: str) -> pd.Series:
+    """Start of the `resolution` period that each of `times` (in Europe/London) is in"""
+    if resolution in ENGINE_RESOLUTIONS:
+        # in UTC, as local times are ambiguous when the clocks go back
+        return times.dt.tz_convert("UTC").dt.floor(f"{ENGINE_RESOLUTIONS[resolution]}s").dt.tz_convert(times.dt.tz)
+
+    local = times.dt.tz_localize(None)
+    if resolution == "day":
+        local = local.dt.normalize()
+    else:
+        local = local.dt.to_period("M").dt.to_timestamp()
+
+    return local.dt.tz_localize(times.dt.tz)
+
+
+def period_hours(starts: pd.Series, resolution: str) -> pd.Series:
+    """Length in hours of the `resolution` periods starting at `starts`, allowing for clock changes"""
+    if resolution in ENGINE_RESOLUTIONS:
+        return pd.Series(ENGINE_RESOLUTIONS[resolution] / 3600, index=starts.index)
+
+    local = starts.dt.tz_localize(None)
+    ends = local + (pd.DateOffset(days=1) if resolution == "day" else pd.DateOffset(months=1))
+    ends = ends.dt.tz_localize(starts.dt.tz)
+
+    return (ends - starts).dt.total_seconds() / 3600
+
+
+def roll_up(df: pd.DataFrame, period_seconds: int, resolution: str) -> pd.DataFrame:
+    """Roll up a per-unit frame of `period_seconds` periods, as produced by the engines, to `resolution`"""
+
+    if resolution in ENGINE_RESOLUTIONS and ENGINE_RESOLUTIONS[resolution] == period_seconds:
+        return df
+
+    # average MW to MWh, and back again over the new periods
+    df = df.copy()
+    df[MW_AVERAGE_COLUMNS] = df[MW_AVERAGE_COLUMNS] * (period_seconds / 3600)
+    df["Time"] = period_starts(df["Time"], resolution)
+
+    df = df.groupby(["Unit", "Time"], sort=True)[MW_AVERAGE_COLUMNS + SUM_COLUMNS].sum().reset_index()
+    df[MW_AVERAGE_COLUMNS] = df[MW_AVERAGE_COLUMNS].div(period_hours(df["Time"], resolution), axis=0)
+
+    return df
+
+
+def roll_up_all(df: pd.DataFrame, period_seconds: int, resolutions: List[str]) -> Dict[str, pd.DataFrame]:
+    """`roll_up` to every one of `resolutions`"""
+    return {resolution: roll_up(df, period_seconds, resolution) for resolution in resolutions}
@@ -0,0 +1,112 @@
+"""
+Re-pricing curtailment under different price assumptions, without recomputing it.
+
+The curtailed volumes of every unit and settlement period are computed once, e.g. into a `CurtailmentCache`,
+and read back as a `CurtailmentMatrix`. Each `Scenario` then only changes prices:
+- the turn down of the wind units is paid their bid price, for a chosen bid-offer pair
+- the replacement turn up is paid a fixed gas price per year, or the system buy price (SBP)
+
+All scenarios are priced together: bid prices for every (unit, period, pair) come from one lookup, and the
+costs of every scenario and period from one matrix product.
+"""
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from lib.bid_prices import BidPriceIndex
+from lib.constants import MW_30m_TO_MWH
+from lib.curtailment_matrix import CurtailmentMatrix
+from lib.settlement_periods import to_epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+SCENARIO_COLUMNS = ["scenario", "energy_mwh", "turndown_cost_gbp", "turnup_cost_gbp", "total_cost_gbp"]
+
+
+@dataclass
+class Scenario:
+    """Price assumptions for one scenario. Prices are in £/MWh."""
+
+    name: str
+    # turn up price, in years that are not in `gas_prices_by_year`
+    gas_price: float = 100.0
+    gas_prices_by_year: Dict[int, float] = field(default_factory=dict)
+    # turn up at the system buy price instead of the gas price
+    system_buy_price: bool = False
+    # the bid-offer pair turn downs are priced at
+    bid_pair: float = -1.0
+
+
+# the turn up cost in sql/read_data.sql
+READ_DATA_SCENARIO = Scenario(name="read_data.sql", gas_price=100.0, gas_prices_by_year={2022: 200.0})
+
+
+def _turn_up_prices(
+    scenarios: List[Scenario], times: pd.DatetimeIndex, system_buy_prices: Optional[pd.Series]
+) -> np.ndarray:
+    """Turn up price of every scenario (rows) in every period (columns)"""
+
+    years = pd.Series(times.year)
+    if system_buy_prices is not None:
+        if system_buy_prices.index.tz is None:
+            system_buy_prices = system_buy_prices.tz_localize("UTC")
+        system_buy_prices = system_buy_prices.reindex(times).to_numpy(float)
+
+    prices = np.zeros((len(scenarios), len(times)))
+    for i, scenario in enumerate(scenarios):
+        if scenario.system_buy_price:
+            if system_buy_prices is None:
+                raise ValueError(f"Scenario {scenario.name} needs system buy prices")
+            missing = np.isnan(system_buy_prices)
+            if missing.any():
+                logger.warning(f"No system buy price for {missing.sum()} periods, these have no turn up cost")
+            prices[i] = np.nan_to_num(system_buy_prices)
+        else:
+            prices[i] = years.map(scenario.gas_prices_by_year).fillna(scenario.gas_price).to_numpy(float)
+
+    return prices
+
+
+def reprice_curtailment(
+    matrix: CurtailmentMatrix,
+    scenarios: List[Scenario],
+    df_bod: pd.DataFrame,
+    system_buy_prices: Optional[pd.Series] = None,
+) -> pd.DataFrame:
+    """Total curtailed energy and costs of each of `scenarios`, one row per scenario.
+
+    `matrix` holds the curtailment per unit and settlement period, `df_bod` the BOD data of the same time
+    range (as returned by `DbRepository.get_data_for_time_range`), and `system_buy_prices` the SBP by
+    settlement period start, which is only needed for scenarios that turn up at SBP.
+    """
+
+    # MWh curtailed per unit and period
+    energy = np.nan_to_num(matrix.delta) * MW_30m_TO_MWH
+    n_units, n_periods = energy.shape
+
+    # bid prices of every pair the scenarios use, for every (unit, period)
+    pairs = np.unique([scenario.bid_pair for scenario in scenarios])
+    bid_prices = BidPriceIndex(df_bod).lookup(
+        np.repeat(matrix.units, n_periods), np.tile(to_epoch_seconds(matrix.times), n_units), pair=pairs
+    )
+    bid_prices = np.nan_to_num(bid_prices).reshape(n_units, n_periods, len(pairs))
+
+    # bid prices are negative
+    turndown_by_pair = -np.einsum("up,upk->k", energy, bid_prices)
+    turndown = turndown_by_pair[np.searchsorted(pairs, [scenario.bid_pair for scenario in scenarios])]
+
+    turnup = _turn_up_prices(scenarios, matrix.times, system_buy_prices) @ energy.sum(axis=0)
+
+    return pd.DataFrame(
+        {
+            "scenario": [scenario.name for scenario in scenarios],
+            "energy_mwh": energy.sum(),
+            "turndown_cost_gbp": turndown,
+            "turnup_cost_gbp": turnup,
+            "total_cost_gbp": turndown + turnup,
+        },
+        columns=SCENARIO_COLUMNS,
+    )
@@ -2,27 +2,33 @@ import concurrent.futures
 import logging
 import os
 import sqlite3
-import requests
 import time
 from pathlib import Path
+from typing import Optional, Tuple
 
 import numpy as np
 import pandas as pd
 from sqlalchemy import create_engine
 from sqlalchemy.exc import OperationalError, IntegrityError
-from sp2ts import dt2sp
 
 from lib.constants import SAVE_DIR, df_bm_units
+from lib.data.fetch_pooled import fetch_all, get_data
+from lib.data.fetch_stream import stream_physical_rows
+from lib.data.request_planner import RequestPlan, boalf_urls, fetch_per_unit, plan_requests, pn_urls
+from lib.data.response_cache import ResponseCache, open_response_cache
 from lib.data.utils import (
     add_bm_unit_type,
     parse_boal_from_physical_data,
-    parse_fpn_from_physical_data, logger, N_POOL_INSTANCES, add_utc_timezone,
+    parse_fpn_from_physical_data, logger, N_POOL_INSTANCES,
 )
+from lib.db_utils import GAS_TABLE_PREFIX, to_stored_times
+from lib.spans import frame_bytes, span
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 MAX_RETRIES = 1
+FETCH_ENGINES = ("threads", "pooled", "stream")
 
 
 def run_boa(
@@ -33,13 +39,17 @@ def run_boa(
     database_engine=None,
     cache=True,
     multiprocess=True,
-    pull_data_once=False,
+    pull_data_once=None,
+    gas=False,
+    fetch_engine="threads",
 ):
     """
-    Collects data from the ElexonAPI, saved as a local feather file, does some preprocessing and then places in
+    Collects data from the ElexonAPI, with the responses cached locally, does some preprocessing and then places in
     an SQLite DB.
 
     Only collects data for specified units, to keep things fast. Uses multiprocessing to grab all units in parallel.
+    With `gas`, the data of CCGT units in `units` is written to the gas tables as well, see `fetch_and_load_one_chunk`.
+    `fetch_engine` selects how the API is called, see `fetch_physical_data`.
     """
 
     if database_engine is None:
@@ -61,6 +71,8 @@ def run_boa(
             cache=cache,
             multiprocess=multiprocess,
             pull_data_once=pull_data_once,
+            gas=gas,
+            fetch_engine=fetch_engine,
         )
         t2 = time.time()
         logger.info(f"{(t2 - t1) / 60} minutes for {interval}")
@@ -68,21 +80,23 @@ def run_boa(
         chunk_end += interval
 
 
-def write_fpn_to_db(df_fpn, database_engine) -> bool:
-    """Write the FPN df to DB"""
+def write_fpn_to_db(df_fpn, database_engine, table: str = "fpn") -> bool:
+    """Write the FPN df to the `table` of the DB"""
 
     logger.info(f"Writing {len(df_fpn)} to FPN database")
 
+    df_fpn = to_stored_times(df_fpn)
     try:
-        with database_engine.connect() as connection:
-            df_fpn.to_sql("fpn", connection, if_exists="append", index_label="unit")
+        with span("sqlite_write", rows_in=len(df_fpn), bytes=frame_bytes(df_fpn)):
+            with database_engine.connect() as connection:
+                df_fpn.to_sql(table, connection, if_exists="append", index_label="unit")
         return True
     except OperationalError:
         return False
 
 
-def write_boal_to_db(df_boal, database_engine) -> bool:
-    """Write the BOAL df to DB, falling back to a row-by-row load if the load of the whole df fails.
+def write_boal_to_db(df_boal, database_engine, table: str = "boal") -> bool:
+    """Write the BOAL df to the `table` of the DB, falling back to a row-by-row load if the load of the whole df fails.
 
     This can happen because at boundaries between SPs, the same BOAL can be reported in multiple SP's. For instance,
     if the BOAL is 00:40 -> 01.05, it will be reported in two SPs, and so we can end up trying to load the same
@@ -91,26 +105,28 @@ def write_boal_to_db(df_boal, database_engine) -> bool:
 
     logger.info(f"Writing {len(df_boal)} to BOA database")
 
+    df_boal = to_stored_times(df_boal)
     try:
-        with database_engine.connect() as connection:
-            # Potential issue here with duplicate BOALs nuking the whole write. This can happen because
-            # BOALs are extended across SPs
-            try:
-                df_boal.to_sql("boal", connection, if_exists="append", index_label="unit")
-            except (sqlite3.IntegrityError, IntegrityError) as e:
-                logging.warning(e)
-                # Try and write them one at at time
-                for i in range(len(df_boal)):
-                    try:
-                        df_boal.iloc[i].to_sql(
-                            "boal",
-                            con=connection,
-                            if_exists="append",
-                            index_label="unit",
-                        )
-                    except IntegrityError as e:
-                        logging.warning(e)
-                        pass
+        with span("sqlite_write", rows_in=len(df_boal), bytes=frame_bytes(df_boal)):
+            with database_engine.connect() as connection:
+                # Potential issue here with duplicate BOALs nuking the whole write. This can happen because
+                # BOALs are extended across SPs
+                try:
+                    df_boal.to_sql(table, connection, if_exists="append", index_label="unit")
+                except (sqlite3.IntegrityError, IntegrityError) as e:
+                    logging.warning(e)
+                    # Try and write them one at at time
+                    for i in range(len(df_boal)):
+                        try:
+                            df_boal.iloc[i].to_sql(
+                                table,
+                                con=connection,
+                                if_exists="append",
+                                index_label="unit",
+                            )
+                        except IntegrityError as e:
+                            logging.warning(e)
+                            pass
         return True
     except OperationalError:
         return False
@@ -123,9 +139,15 @@ def fetch_and_load_one_chunk(
     database_engine,
     cache=True,
     multiprocess=True,
-    pull_data_once=False,
+    pull_data_once=None,
+    gas=False,
+    fetch_engine="threads",
 ):
-    """Fetch and load FPN and BOAL data for `start_date` to `end_date` for units in `unit_ids"""
+    """Fetch and load FPN and BOAL data for `start_date` to `end_date` for units in `unit_ids`.
+
+    The data of wind units goes to the "fpn" and "boal" tables. With `gas`, the data of CCGT units goes to
+    the "gas_fpn" and "gas_boal" tables too, for `lib.gas_turn_up`.
+    """
     # TODO clean up the preprocessing of data here
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.DEBUG)
@@ -140,102 +162,88 @@ def fetch_and_load_one_chunk(
         unit_ids=unit_ids,
         multiprocess=multiprocess,
         pull_data_once=pull_data_once,
+        fetch_engine=fetch_engine,
     )
 
+    fuel_types = [("WIND", "")] + ([("CCGT", GAS_TABLE_PREFIX)] if gas else [])
+    for fuel_type, table_prefix in fuel_types:
+        df_fpn, df_boal = process_physical_data(df, fuel_type=fuel_type)
+        fpn_table, boal_table = f"{table_prefix}fpn", f"{table_prefix}boal"
+
+        # DB Locking collisions between processes necessitate a retry loop
+        fpn_success = write_fpn_to_db(df_fpn, database_engine, table=fpn_table)
+        retries = 0
+        while not fpn_success and retries < MAX_RETRIES:
+            logger.info("Retrying FPN after sleep")
+            time.sleep(np.random.randint(1, 20))
+            fpn_success = write_fpn_to_db(df_fpn, database_engine, table=fpn_table)
+            retries += 1
+
+        # Separated these because pandas autocommits, so FPN could end up being retried unecessarily
+        # if subsequent BOAL write has failed!
+        boal_success = write_boal_to_db(df_boal, database_engine, table=boal_table)
+        retries = 0
+        while not boal_success and retries < MAX_RETRIES:
+            logger.info("Retrying BOAL after sleep")
+            time.sleep(np.random.randint(1, 20))
+            boal_success = write_boal_to_db(df_boal, database_engine, table=boal_table)
+            retries += 1
+
+
+def process_physical_data(df: pd.DataFrame, fuel_type: str = "WIND") -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Split physical data, as returned by `fetch_physical_data`, into FPN and BOAL data of the units of
+    `fuel_type` (e.g. "WIND" or "CCGT"), ready to be written to the DB"""
+
     df = df.rename(columns={"bmUnitID": "Unit"})
-    df["timeFrom"], df["timeTo"] = df["timeFrom"].apply(pd.to_datetime), df["timeTo"].apply(
-        pd.to_datetime
-    )
+    df["timeFrom"], df["timeTo"] = pd.to_datetime(df["timeFrom"]), pd.to_datetime(df["timeTo"])
 
-    df = add_bm_unit_type(df, df_bm_units=df_bm_units)
+    with span("fuel_type_join", rows_in=len(df)) as join:
+        df = add_bm_unit_type(df, df_bm_units=df_bm_units)
+        join.rows_out = len(df)
 
     df_fpn, df_boal = parse_fpn_from_physical_data(df), parse_boal_from_physical_data(df)
 
     logger.debug(f"there are {len(df_fpn)} FPNS")
     logger.debug(f"there are {len(df_boal)} BOAs")
 
-    logger.debug(f"Selecting wind units only")
-    if len(df_boal) > 0:
-        df_boal = df_boal[df_boal["Fuel Type"] == "WIND"]
-    if len(df_fpn) > 0:
-        df_fpn = df_fpn[df_fpn["Fuel Type"] == "WIND"]
-
-    logger.debug(f'Selecting wind units only')
-
+    logger.debug(f"Selecting {fuel_type} units only")
     if len(df_boal) > 0:
-        df_boal = df_boal[df_boal["Fuel Type"] == "WIND"]
+        df_boal = df_boal[df_boal["Fuel Type"] == fuel_type]
     if len(df_fpn) > 0:
-        df_fpn = df_fpn[df_fpn["Fuel Type"] == "WIND"]
+        df_fpn = df_fpn[df_fpn["Fuel Type"] == fuel_type]
 
     # Duplicates can occur from multiple SP's reporting the same BOAL
     df_boal = df_boal.drop_duplicates(
         subset=["timeFrom", "timeTo", "Accept ID", "levelFrom", "levelTo"]
     )
 
-    # DB Locking collisions between processes necessitate a retry loop
-    fpn_success = write_fpn_to_db(df_fpn, database_engine)
-    retries = 0
-    while not fpn_success and retries < MAX_RETRIES:
-        logger.info("Retrying FPN after sleep")
-        time.sleep(np.random.randint(1, 20))
-        fpn_success = write_fpn_to_db(df_fpn, database_engine)
-        retries += 1
-
-    # Separated these because pandas autocommits, so FPN could end up being retried unecessarily
-    # if subsequent BOAL write has failed!
-    boal_success = write_boal_to_db(df_boal, database_engine)
-    retries = 0
-    while not boal_success and retries < MAX_RETRIES:
-        logger.info("Retrying BOAL after sleep")
-        time.sleep(np.random.randint(1, 20))
-        boal_success = write_boal_to_db(df_boal, database_engine)
-        retries += 1
-
-
-def call_physbm_api(start_date, end_date, unit=None):
+    return df_fpn, df_boal
+
+
+def call_physbm_api(start_date, end_date, unit=None, cache: Optional[ResponseCache] = None):
     """Thin wrapper to allow kwarg passing with starmap"""
     logger.info(f"Calling BOAS API for {unit}")
 
     # Nedd to call PNs and BOALs separately in new API
+    data_pn_df = pd.concat([get_data(url, cache=cache) for url in pn_urls(start_date, end_date, unit)])
+    data_boa_df = pd.concat([get_data(url, cache=cache) for url in boalf_urls(start_date, end_date, unit)])
 
-    # "https://data.elexon.co.uk/bmrs/api/v1/balancing/physical/all?dataset={dataset}&settlementDate={settlementDate}&settlementPeriod={settlementPeriod}&format=json"
-    datetimes = pd.date_range(start_date, end_date, freq="30min")
-    data_df = []
-    for datetime in datetimes:
-        logger.info(f"Getting PN from {datetime}")
-
-        datetime = add_utc_timezone(datetime)
-
-        date, sp = dt2sp(datetime)
-        url = f"https://data.elexon.co.uk/bmrs/api/v1/balancing/physical/all?dataset=PN&settlementDate={date}&settlementPeriod={sp}"
-        if unit is not None:
-            url = url + f"&bmUnit={unit}"
-        url = url + "&format=json"
-
-        r = requests.get(url)
-
-        data_one_settlement_period_df = pd.DataFrame(r.json()["data"])
-        data_df.append(data_one_settlement_period_df)
+    return format_physbm_data(data_pn_df, data_boa_df, end_date)
 
-    data_pn_df = pd.concat(data_df)
 
-    datetimes = pd.date_range(start_date, end_date, freq="30min")
-    data_df = []
-    for datetime in datetimes:
-        logger.info(f"Getting BOALF from {datetime}")
-        boalf_end_datetime = (datetime + pd.Timedelta(minutes=30)).tz_localize(None)
-        boalf_start_datetime = (datetime - pd.Timedelta(minutes=30)).tz_localize(None)
-        url = f"https://data.elexon.co.uk/bmrs/api/v1/datasets/BOALF?from={boalf_start_datetime}&to={boalf_end_datetime}"
-        if unit is not None:
-            url = url + f"&bmUnit={unit}"
-        url = url + "&format=json"
+def call_physbm_api_pooled(
+    start_date, end_date, plan: RequestPlan, cache: Optional[ResponseCache] = None
+) -> pd.DataFrame:
+    """The data `call_physbm_api` returns for the calls of `plan`, with all of them made concurrently,
+    see `lib.data.fetch_pooled`"""
 
-        r = requests.get(url)
+    dfs = fetch_all(plan.urls["PN"] + plan.urls["BOALF"], cache=cache)
+    n_pn = len(plan.urls["PN"])
+    return format_physbm_data(pd.concat(dfs[:n_pn]), pd.concat(dfs[n_pn:]), end_date)
 
-        data_one_settlement_period_df = pd.DataFrame(r.json()["data"])
-        data_df.append(data_one_settlement_period_df)
 
-    data_boa_df = pd.concat(data_df)
+def format_physbm_data(data_pn_df: pd.DataFrame, data_boa_df: pd.DataFrame, end_date) -> pd.DataFrame:
+    """PN and BOALF data, as returned by the API, in one dataframe with the columns of the old PHYBMDATA API"""
 
     # rename bmUnit to bmUnitID
     data_pn_df.rename(columns={"bmUnit": "bmUnitID"}, inplace=True)
@@ -266,22 +274,54 @@ def call_physbm_api(start_date, end_date, unit=None):
 
 
 def fetch_physical_data(
-    start_date, end_date, save_dir: Path, cache=True, unit_ids=None, multiprocess=False, pull_data_once: bool = False
+    start_date,
+    end_date,
+    save_dir: Path,
+    cache=True,
+    unit_ids=None,
+    multiprocess=False,
+    pull_data_once: Optional[bool] = None,
+    fetch_engine: str = "threads",
 ):
-    """From a brief visual inspection, this returns data that looks the same as the stuff I downloaded manually"""
-    if cache:
-        file_name = save_dir / f"{start_date}-{end_date}.fthr"
-        if file_name.exists():
-            return pd.read_feather(file_name)
+    """From a brief visual inspection, this returns data that looks the same as the stuff I downloaded manually
+
+    With `pull_data_once`, the data of all units is fetched at once and then filtered to `unit_ids`, and without
+    it the data of each unit is fetched separately. By default this is picked by `fetch_per_unit`.
+
+    `fetch_engine` selects how the API is called:
+    - "threads": one unit at a time per thread, with `multiprocess`, and one call at a time per unit
+    - "pooled": every call of every unit mapped over one pool of threads with kept-alive connections, see
+      `lib.data.fetch_pooled`
+    - "stream": the rows of all units sliced out of day long pages of the stream endpoints, for backfills, see
+      `lib.data.fetch_stream`
+
+    With `cache`, the response of every API call is cached in `save_dir`, per dataset, settlement period and
+    unit, see `lib.data.response_cache`.
+    """
+    if fetch_engine not in FETCH_ENGINES:
+        raise ValueError(f"Unknown fetch engine {fetch_engine}, should be one of {FETCH_ENGINES}")
 
-    if (unit_ids is not None) and (not pull_data_once):
+    response_cache = open_response_cache(save_dir) if cache else None
+
+    if fetch_engine == "stream":
+        df = format_physbm_data(*stream_physical_rows(start_date, end_date, cache=response_cache), end_date)
+        if unit_ids is not None:
+            df = df[df["bmUnitID"].isin(unit_ids)]
+    elif fetch_engine == "pooled":
+        plan = plan_requests(start_date, end_date, ["PN", "BOALF"], unit_ids=unit_ids, pull_data_once=pull_data_once)
+        df = call_physbm_api_pooled(start_date, end_date, plan, cache=response_cache)
+        if unit_ids is not None:
+            df = df[df["bmUnitID"].isin(unit_ids)]
+    elif fetch_per_unit(unit_ids, ["PN", "BOALF"], pull_data_once=pull_data_once):
         if multiprocess:
             unit_dfs = []
             with concurrent.futures.ThreadPoolExecutor(
                 max_workers=int(os.getenv("N_POOL_INSTANCES", N_POOL_INSTANCES))
             ) as executor:
 
-                tasks = [executor.submit(call_physbm_api, start_date, end_date, unit) for unit in unit_ids]
+                tasks = [
+                    executor.submit(call_physbm_api, start_date, end_date, unit, response_cache) for unit in unit_ids
+                ]
 
                 for future in concurrent.futures.as_completed(tasks):
                     data = future.result()
@@ -291,15 +331,12 @@ def fetch_physical_data(
             unit_dfs = []
             for i, unit in enumerate(unit_ids):
                 logger.info(f"Calling API PHYBMDATA for {unit} ({i}/{len(unit_ids)}) " f"{start_date=} {end_date=}")
-                unit_dfs.append(call_physbm_api(start_date, end_date, unit))
+                unit_dfs.append(call_physbm_api(start_date, end_date, unit, cache=response_cache))
 
         df = pd.concat(unit_dfs)
     else:
-        df = call_physbm_api(start_date=start_date, end_date=end_date)
+        df = call_physbm_api(start_date=start_date, end_date=end_date, cache=response_cache)
         if unit_ids is not None:
             df = df[df["bmUnitID"].isin(unit_ids)]
 
-    if cache:
-        df.reset_index(drop=True).to_feather(file_name)
-
     return df
\ No newline at end of file
@@ -3,7 +3,7 @@ import logging
 import os
 import time
 from pathlib import Path
-import requests
+from typing import Optional
 
 import numpy as np
 import pandas as pd
@@ -11,9 +11,16 @@ from sqlalchemy import create_engine
 from sqlalchemy.exc import OperationalError
 
 from lib.constants import SAVE_DIR, df_bm_units
+from lib.data.fetch_pooled import fetch_all, get_data
+from lib.data.fetch_boa_data import FETCH_ENGINES
+from lib.data.fetch_stream import stream_bod_rows
+from lib.data.request_planner import RequestPlan, bod_urls, fetch_per_unit, plan_requests
+from lib.data.response_cache import ResponseCache, open_response_cache
 from lib.data.utils import (
     add_bm_unit_type, logger, N_POOL_INSTANCES,
 )
+from lib.db_utils import GAS_TABLE_PREFIX, to_stored_times
+from lib.spans import frame_bytes, span
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -29,13 +36,17 @@ def run_bod(
     database_engine=None,
     cache=True,
     multiprocess=True,
-    pull_data_once=False,
+    pull_data_once=None,
+    gas=False,
+    fetch_engine="threads",
 ):
     """
-    Collects data from the ElexonAPI, saved as a local feather file, does some preprocessing and then places in
+    Collects data from the ElexonAPI, with the responses cached locally, does some preprocessing and then places in
     an SQLite DB.
 
     Only collects data for specified units, to keep things fast. Uses multiprocessing to grab all units in parallel.
+    With `gas`, the BODs of CCGT units in `units` are written to the "gas_bod" table as well.
+    `fetch_engine` selects how the API is called, see `fetch_bod_data`.
     """
 
     if database_engine is None:
@@ -57,6 +68,8 @@ def run_bod(
             cache=cache,
             multiprocess=multiprocess,
             pull_data_once=pull_data_once,
+            gas=gas,
+            fetch_engine=fetch_engine,
         )
         t2 = time.time()
         logger.info(f"{(t2 - t1) / 60} minutes for {interval}")
@@ -64,16 +77,18 @@ def run_bod(
         chunk_end += interval
 
 
-def write_bod_to_db(df_fpn, database_engine) -> bool:
-    """Write the BOD df to DB"""
+def write_bod_to_db(df_fpn, database_engine, table: str = "bod") -> bool:
+    """Write the BOD df to the `table` of the DB"""
 
     logger.info("Writing BODs to db")
 
+    df_fpn = to_stored_times(df_fpn)
     try:
-        with database_engine.connect() as connection:
-            logger.debug(f"Writing {len(df_fpn)} to database")
-            df_fpn.to_sql("bod", connection, if_exists="append", index_label="bmUnitID")
-            logger.debug(f"Writing to database: Done")
+        with span("sqlite_write", rows_in=len(df_fpn), bytes=frame_bytes(df_fpn)):
+            with database_engine.connect() as connection:
+                logger.debug(f"Writing {len(df_fpn)} to database")
+                df_fpn.to_sql(table, connection, if_exists="append", index_label="bmUnitID")
+                logger.debug(f"Writing to database: Done")
         return True
     except OperationalError as e:
         logger.warning(e)
@@ -87,9 +102,14 @@ def fetch_and_load_one_chunk(
     database_engine,
     cache=True,
     multiprocess=True,
-    pull_data_once=False,
+    pull_data_once=None,
+    gas=False,
+    fetch_engine="threads",
 ):
-    """Fetch and load FPN and BOAL data for `start_date` to `end_date` for units in `unit_ids"""
+    """Fetch and load BOD data for `start_date` to `end_date` for units in `unit_ids`.
+
+    The BODs of wind units go to the "bod" table, and with `gas` the BODs of CCGT units go to "gas_bod" too.
+    """
     # TODO clean up the preprocessing of data here
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.DEBUG)
@@ -104,52 +124,59 @@ def fetch_and_load_one_chunk(
         unit_ids=unit_ids,
         multiprocess=multiprocess,
         pull_data_once=pull_data_once,
+        fetch_engine=fetch_engine,
     )
 
-    df["timeFrom"], df["timeTo"] = df["timeFrom"].apply(pd.to_datetime), df["timeTo"].apply(
-        pd.to_datetime
-    )
+    fuel_types = [("WIND", "")] + ([("CCGT", GAS_TABLE_PREFIX)] if gas else [])
+    for fuel_type, table_prefix in fuel_types:
+        df_bod = process_bod_data(df, fuel_type=fuel_type)
+
+        # Duplicates can occur from multiple SP's reporting the same BOAL
+        # df_boal = df_boal.drop_duplicates(subset=["timeFrom", "timeTo", "Accept ID", "levelFrom", "levelTo"])
+
+        # DB Locking collisions between processes necessitate a retry loop
+        bod_success = write_bod_to_db(df_bod, database_engine, table=f"{table_prefix}bod")
+        retries = 0
+        while not bod_success and retries < MAX_RETRIES:
+            logger.info("Retrying FPN after sleep")
+            time.sleep(np.random.randint(1, 20))
+            bod_success = write_bod_to_db(df_bod, database_engine, table=f"{table_prefix}bod")
+            retries += 1
 
-    df = add_bm_unit_type(df, df_bm_units=df_bm_units, index_name="bmUnitID")
 
-    df = df[df["Fuel Type"] == "WIND"]
-    df.drop(columns=["Fuel Type"], inplace=True)
+def process_bod_data(df: pd.DataFrame, fuel_type: str = "WIND") -> pd.DataFrame:
+    """BOD data of the units of `fuel_type` (e.g. "WIND" or "CCGT"), as returned by `fetch_bod_data`, ready to
+    be written to the DB"""
 
-    # Duplicates can occur from multiple SP's reporting the same BOAL
-    # df_boal = df_boal.drop_duplicates(subset=["timeFrom", "timeTo", "Accept ID", "levelFrom", "levelTo"])
+    df = df.copy()
+    df["timeFrom"], df["timeTo"] = pd.to_datetime(df["timeFrom"]), pd.to_datetime(df["timeTo"])
 
-    # DB Locking collisions between processes necessitate a retry loop
-    bod_success = write_bod_to_db(df, database_engine)
-    retries = 0
-    while not bod_success and retries < MAX_RETRIES:
-        logger.info("Retrying FPN after sleep")
-        time.sleep(np.random.randint(1, 20))
-        bod_success = write_bod_to_db(df,database_engine)
+    with span("fuel_type_join", rows_in=len(df)) as join:
+        df = add_bm_unit_type(df, df_bm_units=df_bm_units, index_name="bmUnitID")
+        join.rows_out = len(df)
 
+    df = df[df["Fuel Type"] == fuel_type]
+    return df.drop(columns=["Fuel Type"])
 
-def call_api_bod(start_date, end_date, unit = None):
+
+def call_api_bod(start_date, end_date, unit = None, cache: Optional[ResponseCache] = None):
     """Thin wrapper to allow kwarg passing with starmap"""
     logger.info(f"Calling BOD API for {unit}")
 
-    # "https://data.elexon.co.uk/bmrs/api/v1/datasets/BOD?from=2024-03-01&to=2024-03-01&bmUnit=T_ACHRW-1&format=json"
-    datetimes = pd.date_range(start_date, end_date, freq="30min")
-    data_df = []
-    for datetime in datetimes:
-        logger.info(f"Getting BOD from {datetime}")
-
-        datetime_no_timezone = datetime.tz_localize(None)
+    data_df = pd.concat([get_data(url, cache=cache) for url in bod_urls(start_date, end_date, unit)])
+    return format_bod_data(data_df, end_date)
 
-        url = f"https://data.elexon.co.uk/bmrs/api/v1/datasets/BOD?from={datetime_no_timezone}&to={datetime_no_timezone}"
-        if unit is not None:
-            url = url+f"&bmUnit={unit}"
-        url = url+"&format=json"
 
-        r = requests.get(url)
+def call_api_bod_pooled(
+    start_date, end_date, plan: RequestPlan, cache: Optional[ResponseCache] = None
+) -> pd.DataFrame:
+    """The data `call_api_bod` returns for the calls of `plan`, with all of them made concurrently,
+    see `lib.data.fetch_pooled`"""
+    return format_bod_data(pd.concat(fetch_all(plan.urls["BOD"], cache=cache)), end_date)
 
-        data_one_settlement_period_df = pd.DataFrame(r.json()["data"])
-        data_df.append(data_one_settlement_period_df)
 
-    data_df = pd.concat(data_df)
+def format_bod_data(data_df: pd.DataFrame, end_date) -> pd.DataFrame:
+    """BOD data, as returned by the API, with the columns of the old BOD API"""
 
     # rename bmUnit to bmUnitID
     data_df.rename(columns={"bmUnit": "bmUnitID"}, inplace=True)
@@ -173,17 +200,34 @@ def call_api_bod(start_date, end_date, unit = None):
 
 
 def fetch_bod_data(
-    start_date, end_date, save_dir: Path, cache=True, unit_ids=None, multiprocess=False, pull_data_once: bool = False
+    start_date,
+    end_date,
+    save_dir: Path,
+    cache=True,
+    unit_ids=None,
+    multiprocess=False,
+    pull_data_once: Optional[bool] = None,
+    fetch_engine: str = "threads",
 ):
-    """From a brief visual inspection, this returns data that looks the same as the stuff I downloaded manually"""
+    """From a brief visual inspection, this returns data that looks the same as the stuff I downloaded manually
+
+    `pull_data_once`, `fetch_engine` and `cache` are as in `lib.data.fetch_boa_data.fetch_physical_data`.
+    """
+    if fetch_engine not in FETCH_ENGINES:
+        raise ValueError(f"Unknown fetch engine {fetch_engine}, should be one of {FETCH_ENGINES}")
 
-    if cache:
-        logger.info('Loading BOD data from cache')
-        file_name = save_dir / f"BOD_{start_date}-{end_date}.feather"
-        if file_name.exists():
-            return pd.read_feather(file_name)
+    response_cache = open_response_cache(save_dir) if cache else None
 
-    if (unit_ids is not None) and (not pull_data_once):
+    if fetch_engine == "stream":
+        df = format_bod_data(stream_bod_rows(start_date, end_date, cache=response_cache), end_date)
+        if unit_ids is not None:
+            df = df[df["bmUnitID"].isin(unit_ids)]
+    elif fetch_engine == "pooled":
+        plan = plan_requests(start_date, end_date, ["BOD"], unit_ids=unit_ids, pull_data_once=pull_data_once)
+        df = call_api_bod_pooled(start_date, end_date, plan, cache=response_cache)
+        if unit_ids is not None:
+            df = df[df["bmUnitID"].isin(unit_ids)]
+    elif fetch_per_unit(unit_ids, ["BOD"], pull_data_once=pull_data_once):
         if multiprocess:
 
             unit_dfs = []
@@ -191,7 +235,7 @@ def fetch_bod_data(
                 max_workers=int(os.getenv("N_POOL_INSTANCES", N_POOL_INSTANCES))
             ) as executor:
 
-                tasks = [executor.submit(call_api_bod, start_date, end_date, unit) for unit in unit_ids]
+                tasks = [executor.submit(call_api_bod, start_date, end_date, unit, response_cache) for unit in unit_ids]
 
                 for future in concurrent.futures.as_completed(tasks):
                     data = future.result()
@@ -201,15 +245,12 @@ def fetch_bod_data(
             unit_dfs = []
             for i, unit in enumerate(unit_ids):
                 logger.info(f"Calling API BOD for {unit} ({i}/{len(unit_ids)}) " f"{start_date=} {end_date=}")
-                unit_dfs.append(call_api_bod(start_date, end_date, unit))
+                unit_dfs.append(call_api_bod(start_date, end_date, unit, cache=response_cache))
         df = pd.concat(unit_dfs)
     else:
 
-        df = call_api_bod(start_date=start_date, end_date=end_date)
+        df = call_api_bod(start_date=start_date, end_date=end_date, cache=response_cache)
         if unit_ids is not None:
             df = df[df["bmUnitID"].isin(unit_ids)]
 
-    if cache:
-        df.reset_index(drop=True).to_feather(file_name)
-
     return df
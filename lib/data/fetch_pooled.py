@@ -0,0 +1,87 @@
+"""
+Concurrent fetch engine for the Elexon API, the "pooled" fetch engine of `fetch_physical_data` and `fetch_bod_data`.
+
+The threaded fetchers call `requests.get` once per settlement period, in a pool of threads with one unit each,
+so every call opens a new connection. Here all the calls of a chunk (every dataset, settlement period and unit)
+are mapped over one pool of `concurrency` threads, so at most `concurrency` are in flight. A `requests.Session`
+is not thread safe, so each thread of the pool has a session of its own, which keeps its connection alive
+between the calls of that thread.
+
+Every call goes through the shared rate limiter, see `lib.data.rate_limit`, which paces and retries them, unless
+its response is in the response cache, see `lib.data.response_cache`.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from lib.data.rate_limit import concurrent_requests, shared_limiter
+from lib.data.response_cache import ResponseCache, response_key
+from lib.spans import span
+
+
+def make_session(pool_size: int) -> requests.Session:
+    """A session keeping up to `pool_size` connections alive, so the calls made through it reuse them"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_data(
+    url: str, session: Optional[requests.Session] = None, cache: Optional[ResponseCache] = None
+) -> pd.DataFrame:
+    """The "data" of one API call, as a dataframe. The call is paced and retried by the shared limiter, and with a
+    `cache`, its response is taken from and kept in the cache.
+
+    The stream endpoints return the rows as a bare list rather than under "data", so both are accepted.
+    """
+
+    key = response_key(url) if cache is not None else None
+    content = None
+    if key is not None:
+        with span("cache_read") as read:
+            content = cache.get(key)
+            read.bytes = None if content is None else len(content)
+
+    if content is None:
+        with span("http_fetch") as fetch:
+            content = shared_limiter().get(url, session=session).content
+            fetch.bytes = len(content)
+        if key is not None:
+            cache.put(key, content)
+
+    with span("json_parse", bytes=len(content)) as parse:
+        payload = json.loads(content)
+        df = pd.DataFrame(payload if isinstance(payload, list) else payload["data"])
+        parse.rows_out = len(df)
+
+    return df
+
+
+def fetch_all(
+    urls: List[str], concurrency: Optional[int] = None, cache: Optional[ResponseCache] = None
+) -> List[pd.DataFrame]:
+    """The "data" of every one of `urls`, in the same order, with all of them fetched concurrently, see `get_data`"""
+
+    concurrency = concurrent_requests() if concurrency is None else concurrency
+    local = threading.local()
+    sessions: List[requests.Session] = []
+
+    def fetch(url: str) -> pd.DataFrame:
+        if not hasattr(local, "session"):
+            local.session = make_session(1)
+            sessions.append(local.session)
+        return get_data(url, session=local.session, cache=cache)
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(fetch, urls))
+    finally:
+        for session in sessions:
+            session.close()
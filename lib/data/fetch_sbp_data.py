@@ -2,7 +2,9 @@ import logging
 from datetime import datetime
 
 import pandas as pd
-import requests
+
+from lib.data.fetch_pooled import get_data
+from lib.settlement_periods import to_local, to_utc
 
 logger = logging.getLogger(__name__)
 
@@ -34,10 +36,7 @@ def call_sbp_api(start_date: str, end_date: str):
         day = day.strftime("%Y-%m-%d")
 
         url_day = f"{url}{day}?format=json"
-        r = requests.get(url_day)
-
-        data_one_day_df = pd.DataFrame(r.json()["data"])
-        data_df.append(data_one_day_df)
+        data_df.append(get_data(url_day))
 
     data_df = pd.concat(data_df)
 
@@ -47,13 +46,11 @@ def call_sbp_api(start_date: str, end_date: str):
     data_df["startTime"] = pd.to_datetime(data_df["startTime"])
 
     # change UTC to Europe/London
-    data_df["local_datetime"] = data_df["startTime"].dt.tz_convert("Europe/London")
+    data_df["local_datetime"] = to_local(data_df["startTime"])
 
     # filter on start and end date, as we sometimes get more
-    if start_date.tzinfo is None:
-        start_date = start_date.tz_localize(tz="UTC")
-    if end_date.tzinfo is None:
-        end_date = end_date.tz_localize(tz="UTC")
+    start_date = to_utc(pd.Timestamp(start_date))
+    end_date = to_utc(pd.Timestamp(end_date))
 
     data_df = data_df[data_df["local_datetime"] >= start_date]
     data_df = data_df[data_df["local_datetime"] < end_date]
@@ -0,0 +1,140 @@
+"""
+Bulk fetch from the Elexon dataset stream endpoints, for backfills.
+
+The per settlement period calls of `fetch_physical_data` and `fetch_bod_data` take thousands of round trips to
+backfill a year. The stream endpoints (e.g. /datasets/PN/stream?from=...&to=...) return the rows of every unit
+for a whole range in one call instead. `StreamPages` fetches each dataset in pages of `STREAM_PAGE`, keeps the
+latest pages in memory, and the rows the per chunk calls would have returned are sliced out of them, so all the
+chunks of a page come from one call per dataset and the code downstream sees the same frames.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+from lib.data.fetch_pooled import fetch_all
+from lib.data.request_planner import BASE_URL
+from lib.data.response_cache import ResponseCache
+from lib.settlement_periods import SETTLEMENT_PERIOD, to_utc
+
+logger = logging.getLogger(__name__)
+
+STREAM_PAGE = pd.Timedelta(days=1)
+# rows are paged by their timeFrom, so the page before a range is fetched too if it starts within this margin,
+# for the rows that start before the range and reach into it
+STREAM_MARGIN = pd.Timedelta(hours=1)
+# pages ending later than this before now may still change, so they are not kept
+STREAM_SETTLE_TIME = pd.Timedelta(hours=1)
+
+
+def stream_url(dataset: str, page_start: pd.Timestamp, page_end: pd.Timestamp) -> str:
+    """URL of the stream endpoint of `dataset` ("PN", "BOALF" or "BOD") from `page_start` to `page_end` (UTC)"""
+    return f"{BASE_URL}/datasets/{dataset}/stream?from={page_start:%Y-%m-%dT%H:%MZ}&to={page_end:%Y-%m-%dT%H:%MZ}"
+
+
+def _times(df: pd.DataFrame, column: str) -> pd.Series:
+    return pd.to_datetime(df[column], utc=True)
+
+
+class StreamPages:
+    """Pages of the stream endpoints, fetched the first time a range needs them and kept for the chunks that
+    follow. Up to `max_pages` pages are kept, dropping the least recently used. Thread safe."""
+
+    def __init__(
+        self,
+        page: pd.Timedelta = STREAM_PAGE,
+        max_pages: int = 8,
+        now: Callable[[], pd.Timestamp] = lambda: pd.Timestamp.now(tz="UTC"),
+    ):
+        self.page = page
+        self.max_pages = max_pages
+        self._now = now
+        self._pages: "OrderedDict[Tuple[str, pd.Timestamp], pd.DataFrame]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def rows(self, dataset: str, start, end, cache: Optional[ResponseCache] = None) -> pd.DataFrame:
+        """Rows of `dataset` from the pages covering `start` to `end` (naive UTC or tz-aware), with duplicates
+        across pages dropped. The rows are as the API returns them, and not filtered to the range. Pages that are
+        not in memory are fetched through the response `cache`, if given."""
+
+        start, end = to_utc(pd.Timestamp(start)), to_utc(pd.Timestamp(end))
+        page_starts = pd.date_range((start - STREAM_MARGIN).floor(self.page), end, freq=self.page)
+
+        with self._lock:
+            pages: Dict[pd.Timestamp, Optional[pd.DataFrame]] = {
+                page_start: self._pages.get((dataset, page_start)) for page_start in page_starts
+            }
+            for page_start in page_starts:
+                if pages[page_start] is not None:
+                    self._pages.move_to_end((dataset, page_start))
+
+        missing = [page_start for page_start, df in pages.items() if df is None]
+        if len(missing) > 0:
+            logger.info(f"Fetching {len(missing)} {dataset} pages from {missing[0]}")
+            urls = [stream_url(dataset, page_start, page_start + self.page) for page_start in missing]
+            dfs = fetch_all(urls, cache=cache)
+            pages.update(zip(missing, dfs))
+            self._keep(dataset, {page_start: pages[page_start] for page_start in missing})
+
+        return pd.concat(list(pages.values())).drop_duplicates().reset_index(drop=True)
+
+    def _keep(self, dataset: str, pages: Dict[pd.Timestamp, pd.DataFrame]):
+        settled = self._now() - STREAM_SETTLE_TIME
+        with self._lock:
+            for page_start, df in pages.items():
+                if page_start + self.page <= settled:
+                    self._pages[(dataset, page_start)] = df
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+
+def stream_physical_rows(
+    start_date, end_date, pages: Optional[StreamPages] = None, cache: Optional[ResponseCache] = None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """The PN and BOALF rows of all units that `call_physbm_api` gets for `start_date` to `end_date`, from the
+    stream pages: PNs of the settlement periods ending at `start_date` to `end_date`, and BOALFs overlapping
+    30 minutes either side"""
+
+    pages = stream_pages() if pages is None else pages
+    start, end = to_utc(pd.Timestamp(start_date)), to_utc(pd.Timestamp(end_date))
+
+    df_pn = pages.rows("PN", start - SETTLEMENT_PERIOD, end, cache=cache)
+    pn_from = _times(df_pn, "timeFrom")
+    df_pn = df_pn[(pn_from >= start - SETTLEMENT_PERIOD) & (pn_from < end)]
+
+    boalf_start, boalf_end = start - pd.Timedelta(minutes=30), end + pd.Timedelta(minutes=30)
+    df_boalf = pages.rows("BOALF", boalf_start, boalf_end, cache=cache)
+    df_boalf = df_boalf[(_times(df_boalf, "timeTo") >= boalf_start) & (_times(df_boalf, "timeFrom") <= boalf_end)]
+
+    return df_pn.reset_index(drop=True), df_boalf.reset_index(drop=True)
+
+
+def stream_bod_rows(
+    start_date, end_date, pages: Optional[StreamPages] = None, cache: Optional[ResponseCache] = None
+) -> pd.DataFrame:
+    """The BOD rows of all units that `call_api_bod` gets for `start_date` to `end_date`, from the stream pages:
+    the rows in effect at any time from `start_date` to `end_date`"""
+
+    pages = stream_pages() if pages is None else pages
+    start, end = to_utc(pd.Timestamp(start_date)), to_utc(pd.Timestamp(end_date))
+
+    df_bod = pages.rows("BOD", start, end, cache=cache)
+    df_bod = df_bod[(_times(df_bod, "timeTo") > start) & (_times(df_bod, "timeFrom") <= end)]
+
+    return df_bod.reset_index(drop=True)
+
+
+_stream_pages: Optional[StreamPages] = None
+_stream_pages_lock = threading.Lock()
+
+
+def stream_pages() -> StreamPages:
+    """The pages shared by all the fetchers in this process"""
+    global _stream_pages
+
+    with _stream_pages_lock:
+        if _stream_pages is None:
+            _stream_pages = StreamPages()
+        return _stream_pages
@@ -7,13 +7,22 @@ import pandas as pd
 import psutil
 from sqlalchemy import create_engine
 
-from lib.constants import df_bm_units
+from lib.constants import df_bm_units, CURTAILMENT_CACHE_PATH
 from lib.curtailment import analyze_curtailment
+from lib.curtailment_cache import CurtailmentCache
 from lib.data.fetch_boa_data import run_boa
 from lib.data.fetch_bod_data import run_bod
 from lib.data.fetch_sbp_data import call_sbp_api
-from lib.db_utils import drop_and_initialize_tables, drop_and_initialize_bod_table, DbRepository
+from lib.data.rate_limit import shared_limiter
+from lib.db_utils import (
+    drop_and_initialize_tables,
+    drop_and_initialize_bod_table,
+    drop_and_initialize_gas_tables,
+    DbRepository,
+)
+from lib.gas_turn_up import GAS_TURN_UP_COLUMNS, analyze_gas_turn_up, ccgt_units
 from lib.gcp_db_utils import load_data, write_curtailment_data, write_sbp_data
+from lib.spans import log_run_summary, start_run
 
 logger = logging.getLogger(__name__)
 
@@ -23,14 +32,28 @@ def fetch_and_load_data(
     end: Optional[str] = None,
     chunk_size_minutes: int = 60,
     multiprocess: bool = True,
-    pull_data_once: bool = True,
+    pull_data_once: Optional[bool] = None,
     save: bool = True,
+    use_curtailment_cache: bool = True,
+    fetch_engine: str = "pooled",
 ):
     """
     Entrypoint for the scheduled data refresh. Fetches data from Elexon and pushes
     to the postgres instance.
 
     Writes a CSV as intermediate step
+
+    With `use_curtailment_cache`, per unit and settlement period results are kept between chunks,
+    so only the periods whose FPN, BOAL or BOD data changed are recomputed. Results cached by another
+    `CACHE_VERSION` of the engines, or over `CURTAILMENT_CACHE_MAX_DAYS` ago, are recomputed.
+
+    The turn up of CCGT units by the system operator, and its cost, is stored alongside the curtailment,
+    see `lib.gas_turn_up`.
+
+    `fetch_engine` selects how the Elexon API is called, see `fetch_physical_data`. With "pooled", all the calls
+    of a chunk are made concurrently over kept-alive connections. By default, whether the API is called once per
+    unit or once for all units is planned from the number of units, see `lib.data.request_planner`. For backfills,
+    "stream" fetches whole days from the stream endpoints and splits them into the chunks.
     """
 
     # get a 1 hour chunk date
@@ -45,7 +68,10 @@ def fetch_and_load_data(
     start = pd.Timestamp(start)
     end = pd.Timestamp(end)
 
+    cache = CurtailmentCache(str(CURTAILMENT_CACHE_PATH)) if use_curtailment_cache else None
+
     wind_units = df_bm_units[df_bm_units["FUEL TYPE"] == "WIND"]["SETT_BMU_ID"].unique()
+    units = list(wind_units) + list(ccgt_units())
 
     logger.info(f"Fetching data from ELEXON {start} {end}")
 
@@ -58,6 +84,7 @@ def fetch_and_load_data(
 
         end_chunk = start_chunk + pd.Timedelta(f"{chunk_size_minutes}T")
         logger.info(f"Running chunk from {start_chunk=} to {end_chunk=}")
+        start_run("fetch_and_load_data")
 
         # make new SQL database
         db_url = f"phys_data_{start_chunk}_{end_chunk}.db"
@@ -66,32 +93,40 @@ def fetch_and_load_data(
         # initialize database
         drop_and_initialize_tables(db_url)
         drop_and_initialize_bod_table(db_url)
+        drop_and_initialize_gas_tables(db_url)
 
         # get BOAs and BODs
         run_boa(
             start_date=start_chunk,
             end_date=end_chunk,
-            units=wind_units,
+            units=units,
             chunk_size_in_days=chunk_size_minutes / 24 / 60,
             database_engine=engine,
             cache=True,
             multiprocess=multiprocess,
             pull_data_once=pull_data_once,
+            gas=True,
+            fetch_engine=fetch_engine,
         )
         run_bod(
             start_date=start_chunk,
             end_date=end_chunk,
-            units=wind_units,
+            units=units,
             chunk_size_in_days=chunk_size_minutes / 24 / 60,
             database_engine=engine,
             cache=True,
             multiprocess=multiprocess,
             pull_data_once=pull_data_once,
+            gas=True,
+            fetch_engine=fetch_engine,
         )
 
         logger.info("Running analysis")
         db = DbRepository(db_url)
-        df = analyze_curtailment(db, str(start_chunk), str(end_chunk))
+        df = analyze_curtailment(db, str(start_chunk), str(end_chunk), cache=cache)
+        df_gas = analyze_gas_turn_up(db, str(start_chunk), str(end_chunk))
+        df = df.merge(df_gas, on="Time", how="left")
+        df[GAS_TURN_UP_COLUMNS] = df[GAS_TURN_UP_COLUMNS].fillna(0.0)
         logger.info("Running analysis: done")
 
         logger.info("Saving results")
@@ -122,6 +157,14 @@ def fetch_and_load_data(
                 logger.warning("Writing the df_sbp failed, but going to carry on anyway")
                 logger.error(e)
 
+        # one line of JSON with the time, rows and bytes of every stage of this chunk, and the API rate it ran at
+        log_run_summary(
+            start=start_chunk,
+            end=end_chunk,
+            rss_mb=round(psutil.Process(os.getpid()).memory_info().rss / 1024 ** 2),
+            elexon_api=shared_limiter().snapshot(),
+        )
+
         # bump up the start_chunk by 30 minutes
         start_chunk = start_chunk + pd.Timedelta(f"{chunk_size_minutes}T")
         end_chunk = start_chunk + pd.Timedelta(f"{chunk_size_minutes}T")
@@ -0,0 +1,209 @@
+"""
+Shared rate limiter for the Elexon API.
+
+All the fetchers make their calls through one `RateLimiter` (see `shared_limiter`), which:
+- spaces calls with a token bucket, `rate` calls per second with bursts of up to `burst` calls
+- limits the calls in flight to `concurrency`, which adapts to the API: it grows by about one for every
+  `concurrency` calls that come back fast, shrinks a little when a call is slow compared to the usual latency,
+  and halves on errors. Throttling (HTTP 429) halves `rate` too, which then recovers slowly
+- retries throttled calls, server errors and dropped connections with jittered exponential backoff, waiting
+  at least as long as the API's Retry-After
+
+so long backfills run as fast as the API allows, without failing chunks when it pushes back.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+N_CONCURRENT_REQUESTS = 64
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+REQUEST_TIMEOUT_S = 60
+
+
+def concurrent_requests() -> int:
+    """The most API calls in flight at once, from the N_CONCURRENT_REQUESTS env var"""
+    return int(os.getenv("N_CONCURRENT_REQUESTS", N_CONCURRENT_REQUESTS))
+
+
+class TokenBucket:
+    """Calls at `rate` per second, with bursts of up to `burst`. Thread safe."""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = burst
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Take a token, waiting for one if the bucket is empty"""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+
+            # reserve the token, so callers waiting at the same time queue up behind each other
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait > 0:
+            self._sleep(wait)
+
+
+class RateLimiter:
+    """Token bucket, adaptive concurrency and retries for HTTP GETs, see the module docstring. Thread safe."""
+
+    def __init__(
+        self,
+        rate: float = 20.0,
+        max_rate: float = 100.0,
+        burst: float = 40.0,
+        concurrency: float = 16.0,
+        min_concurrency: float = 1.0,
+        max_concurrency: float = 64.0,
+        slow_latency_factor: float = 2.0,
+        max_retries: int = 5,
+        backoff_s: float = 0.5,
+        max_backoff_s: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.bucket = TokenBucket(rate=rate, burst=burst, clock=clock, sleep=sleep)
+        self.max_rate = max_rate
+        self.concurrency = min(concurrency, max_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.slow_latency_factor = slow_latency_factor
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self._clock = clock
+        self._sleep = sleep
+
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+        # moving averages of the latency of successful calls, and of the fraction of calls that fail
+        self.latency_s: Optional[float] = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.retries = 0
+
+    def _acquire(self):
+        with self._condition:
+            while self._in_flight >= max(int(self.concurrency), 1):
+                self._condition.wait()
+            self._in_flight += 1
+        self.bucket.take()
+
+    def _release(self, latency_s: float, status: Optional[int]):
+        """Adapt to the outcome of a call: its latency, and its status code (None if the connection failed)"""
+
+        with self._condition:
+            self._in_flight -= 1
+            self.calls += 1
+
+            failed = status is None or status in RETRY_STATUS_CODES
+            self.error_rate = 0.95 * self.error_rate + 0.05 * failed
+
+            if failed:
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                if status == 429:
+                    self.bucket.rate = max(1.0, self.bucket.rate / 2)
+            elif self.latency_s is not None and latency_s > self.slow_latency_factor * self.latency_s:
+                self.concurrency = max(self.min_concurrency, self.concurrency * 0.9)
+            else:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+                self.bucket.rate = min(self.max_rate, self.bucket.rate + 0.1)
+
+            if not failed:
+                self.latency_s = latency_s if self.latency_s is None else 0.9 * self.latency_s + 0.1 * latency_s
+
+            self._condition.notify_all()
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """Full jitter exponential backoff, and at least the Retry-After of the response"""
+        backoff = random.uniform(0, min(self.max_backoff_s, self.backoff_s * 2**attempt))
+
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            backoff = max(backoff, float(retry_after))
+
+        return backoff
+
+    def get(self, url: str, session: Optional[requests.Session] = None, **kwargs) -> requests.Response:
+        """GET `url` with `session` (or `requests`), retrying throttled calls, server errors and dropped
+        connections. Other client errors, and calls that fail `max_retries` times, raise."""
+
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT_S)
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            start = self._clock()
+            response, status = None, None
+            try:
+                response = (requests if session is None else session).get(url, **kwargs)
+                status = response.status_code
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"{url} failed: {e}")
+            finally:
+                self._release(self._clock() - start, status)
+
+            if status is not None and status not in RETRY_STATUS_CODES:
+                response.raise_for_status()
+                return response
+            if status is not None and attempt == self.max_retries:
+                response.raise_for_status()
+
+            backoff = self._backoff(attempt, response)
+            logger.info(f"Retrying {url} ({status=}) in {backoff:.1f}s, concurrency {self.concurrency:.1f}")
+            with self._condition:
+                self.retries += 1
+            self._sleep(backoff)
+
+    def snapshot(self) -> dict:
+        """The current state of the limiter, for logging"""
+        with self._condition:
+            return {
+                "rate": round(self.bucket.rate, 2),
+                "concurrency": round(self.concurrency, 2),
+                "in_flight": self._in_flight,
+                "latency_s": None if self.latency_s is None else round(self.latency_s, 4),
+                "error_rate": round(self.error_rate, 4),
+                "calls": self.calls,
+                "retries": self.retries,
+            }
+
+
+_shared_limiter: Optional[RateLimiter] = None
+_shared_limiter_lock = threading.Lock()
+
+
+def shared_limiter() -> RateLimiter:
+    """The limiter all the Elexon API fetchers share, with its maximum rate and concurrency from the
+    ELEXON_MAX_REQUESTS_PER_SECOND and N_CONCURRENT_REQUESTS env vars"""
+    global _shared_limiter
+
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter(
+                max_rate=float(os.getenv("ELEXON_MAX_REQUESTS_PER_SECOND", 100.0)),
+                max_concurrency=concurrent_requests(),
+            )
+        return _shared_limiter
@@ -0,0 +1,136 @@
+"""
+Plans the Elexon API calls for a (start, end, units) request.
+
+The calls per dataset are:
+- PN: one call per settlement period, from the period ending at `start` to the period ending at `end`
+- BOALF: non-overlapping windows of `BOALF_WINDOW` covering 30 minutes either side of the request. Before, every
+  30 minutes had its own hour long window, so consecutive windows overlapped by half and every BOALF was
+  downloaded twice
+- BOD: one call per 30 minutes
+
+for every unit, or once for all units. Per unit calls only return the units asked for, but every call has a
+cost of its own, so `fetch_per_unit` picks per unit calls only when there are few enough units that the extra
+calls cost less than the rows of the units that were not asked for.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from lib.settlement_periods import to_settlement_periods
+
+logger = logging.getLogger(__name__)
+
+BASE_URL = "https://data.elexon.co.uk/bmrs/api/v1"
+BOALF_WINDOW = pd.Timedelta(hours=1)
+
+# The cost of a call, as the bytes that could be downloaded in the same time, and the expected bytes of the rows
+# of one unit in one call of each dataset
+CALL_BYTES = 50_000
+UNIT_BYTES = {"PN": 600, "BOALF": 300, "BOD": 6_000}
+# roughly the number of BM units the all units calls return rows for, far more than the units in the BM unit list
+N_ALL_UNITS = 1_500
+
+
+def _with_unit(url: str, unit: Optional[str]) -> str:
+    if unit is not None:
+        url = url + f"&bmUnit={unit}"
+    return url + "&format=json"
+
+
+def pn_urls(start_date, end_date, unit=None) -> List[str]:
+    """URLs of the PN calls, one per settlement period, for `unit` or all units"""
+
+    # "https://data.elexon.co.uk/bmrs/api/v1/balancing/physical/all?dataset={dataset}&settlementDate={settlementDate}&settlementPeriod={settlementPeriod}&format=json"
+    datetimes = pd.date_range(start_date, end_date, freq="30min")
+    # the settlement period ending at each datetime
+    dates, sps = to_settlement_periods(datetimes, closed="right")
+
+    return [
+        _with_unit(f"{BASE_URL}/balancing/physical/all?dataset=PN&settlementDate={date}&settlementPeriod={sp}", unit)
+        for date, sp in zip(dates, sps)
+    ]
+
+
+def boalf_windows(start_date, end_date, window: pd.Timedelta = BOALF_WINDOW) -> List[tuple]:
+    """Non-overlapping (from, to) windows, as naive times, covering 30 minutes either side of `start_date` to
+    `end_date`"""
+
+    start = pd.Timestamp(start_date).tz_localize(None) - pd.Timedelta(minutes=30)
+    end = pd.Timestamp(end_date).tz_localize(None) + pd.Timedelta(minutes=30)
+    if end <= start:
+        return []
+
+    window_starts = pd.date_range(start, end, freq=window, inclusive="left")
+    return [(window_start, min(window_start + window, end)) for window_start in window_starts]
+
+
+def boalf_urls(start_date, end_date, unit=None, window: pd.Timedelta = BOALF_WINDOW) -> List[str]:
+    """URLs of the BOALF calls, one per window of `boalf_windows`, for `unit` or all units"""
+    return [
+        _with_unit(f"{BASE_URL}/datasets/BOALF?from={window_from}&to={window_to}", unit)
+        for window_from, window_to in boalf_windows(start_date, end_date, window=window)
+    ]
+
+
+def bod_urls(start_date, end_date, unit=None) -> List[str]:
+    """URLs of the BOD calls, one per 30 minutes, for `unit` or all units"""
+
+    # "https://data.elexon.co.uk/bmrs/api/v1/datasets/BOD?from=2024-03-01&to=2024-03-01&bmUnit=T_ACHRW-1&format=json"
+    datetimes = pd.date_range(start_date, end_date, freq="30min").tz_localize(None)
+    return [_with_unit(f"{BASE_URL}/datasets/BOD?from={datetime}&to={datetime}", unit) for datetime in datetimes]
+
+
+DATASET_URLS = {"PN": pn_urls, "BOALF": boalf_urls, "BOD": bod_urls}
+
+
+def fetch_per_unit(unit_ids: Optional[Sequence[str]], datasets: Sequence[str], pull_data_once=None) -> bool:
+    """Whether to call the API once per unit in `unit_ids`, rather than once for all units.
+
+    `pull_data_once` forces the choice, otherwise the cheaper of the two is picked.
+    """
+
+    if unit_ids is None:
+        return False
+    if pull_data_once is not None:
+        return not pull_data_once
+
+    unit_bytes = sum(UNIT_BYTES[dataset] for dataset in datasets)
+    per_unit_bytes = len(unit_ids) * (CALL_BYTES + unit_bytes)
+    all_units_bytes = CALL_BYTES + max(N_ALL_UNITS, len(unit_ids)) * unit_bytes
+
+    return per_unit_bytes < all_units_bytes
+
+
+@dataclass
+class RequestPlan:
+    """The URLs to call for each dataset, and whether they are per unit or for all units"""
+
+    per_unit: bool
+    urls: Dict[str, List[str]]
+
+    @property
+    def n_calls(self) -> int:
+        return sum(len(urls) for urls in self.urls.values())
+
+
+def plan_requests(
+    start_date, end_date, datasets: Sequence[str], unit_ids: Optional[Sequence[str]] = None, pull_data_once=None
+) -> RequestPlan:
+    """The API calls of `datasets` ("PN", "BOALF" and/or "BOD") from `start_date` to `end_date` for `unit_ids`,
+    or all units if None"""
+
+    per_unit = fetch_per_unit(unit_ids, datasets, pull_data_once=pull_data_once)
+    units = list(unit_ids) if per_unit else [None]
+
+    plan = RequestPlan(
+        per_unit=per_unit,
+        urls={
+            dataset: [url for unit in units for url in DATASET_URLS[dataset](start_date, end_date, unit)]
+            for dataset in datasets
+        },
+    )
+    logger.info(f"{plan.n_calls} calls for {'/'.join(datasets)} {'per unit' if per_unit else 'for all units'}")
+
+    return plan
@@ -0,0 +1,223 @@
+"""
+Cache of raw Elexon API responses, keyed by dataset, settlement period and unit.
+
+Every PN, BOALF and BOD call is cached on its own, under the dataset, the settlement date and period it starts
+at, the number of periods it covers and its unit (or all units), rather than whole chunks of calls. Any chunking,
+or list of units called one by one, then reuses the periods fetched before.
+
+- response bodies are stored zlib compressed, addressed by their SHA-256, so identical bodies (e.g. the empty
+  ones of units without data) are stored once
+- responses for periods that ended over `SETTLED_AFTER` ago do not change any more and never expire, while those
+  for more recent periods expire after `RECENT_TTL`, so late data is picked up
+- once the bodies take more than `max_bytes`, the least recently used responses are evicted
+"""
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+from urllib.parse import parse_qsl, urlparse
+
+import pandas as pd
+
+from lib.constants import SQL_DIR
+from lib.settlement_periods import SETTLEMENT_PERIOD, from_settlement_periods, to_settlement_periods, to_utc
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_FILE = "responses.db"
+RESPONSE_CACHE_MAX_MB = 1024
+ALL_UNITS = "all"
+SETTLED_AFTER = pd.Timedelta(days=1)
+RECENT_TTL = pd.Timedelta(minutes=15)
+# responses are evicted until the bodies take this fraction of `max_bytes`, so not every call evicts
+EVICT_TO = 0.9
+EVICT_BATCH = 100
+
+_DATASET_PATH = re.compile(r"/datasets/(PN|BOALF|BOD)(/stream)?$")
+
+
+@dataclass(frozen=True)
+class ResponseKey:
+    """A call of `dataset` for `n_periods` settlement periods from `settlement_period` of `settlement_date`, for
+    `unit`. Calls at one point in time, like those of BOD, cover 0 periods."""
+
+    dataset: str
+    settlement_date: str
+    settlement_period: int
+    n_periods: int
+    unit: str = ALL_UNITS
+
+    @property
+    def id(self) -> str:
+        return f"{self.dataset}/{self.settlement_date}/{self.settlement_period}/{self.n_periods}/{self.unit}"
+
+    @property
+    def end(self) -> pd.Timestamp:
+        """The end of the last period the call covers (UTC)"""
+        start = from_settlement_periods([self.settlement_date], [self.settlement_period])[0]
+        return start + max(self.n_periods, 1) * SETTLEMENT_PERIOD
+
+
+def response_key(url: str) -> Optional[ResponseKey]:
+    """The key of the call to `url`, or None if it is not a PN, BOALF or BOD call on settlement period boundaries"""
+
+    parsed = urlparse(url)
+    query = dict(parse_qsl(parsed.query))
+    unit = query.get("bmUnit", ALL_UNITS)
+
+    if query.get("dataset") == "PN" and "settlementDate" in query:
+        return ResponseKey("PN", query["settlementDate"], int(query["settlementPeriod"]), 1, unit)
+
+    match = _DATASET_PATH.search(parsed.path)
+    if match is None or "from" not in query or "to" not in query:
+        return None
+
+    start, end = to_utc(pd.Timestamp(query["from"])), to_utc(pd.Timestamp(query["to"]))
+    n_periods, remainder = divmod(end - start, SETTLEMENT_PERIOD)
+    if start.value % SETTLEMENT_PERIOD.value != 0 or remainder != pd.Timedelta(0) or n_periods < 0:
+        return None
+
+    dates, periods = to_settlement_periods([start])
+    dataset = match.group(1) + ("-stream" if match.group(2) else "")
+    return ResponseKey(dataset, dates[0], int(periods[0]), int(n_periods), unit)
+
+
+def initialize_response_cache_tables(path_to_db):
+    """Create the cache tables, if they do not exist yet"""
+    connection = sqlite3.connect(path_to_db)
+
+    with open(SQL_DIR / "init_response_cache_db.sql") as f:
+        query = f.read()
+
+    with connection:
+        connection.executescript(query)
+        connection.commit()
+    connection.close()
+
+
+class ResponseCache:
+    """SQLite store of compressed API response bodies, see the module docstring. Thread safe."""
+
+    def __init__(self, db_path, max_bytes: Optional[int] = None, now: Callable[[], float] = time.time):
+        self.db_path = str(db_path)
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("RESPONSE_CACHE_MAX_MB", RESPONSE_CACHE_MAX_MB)) * 1024**2)
+        self.max_bytes = max_bytes
+        self._now = now
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        initialize_response_cache_tables(self.db_path)
+        with self._connection() as connection:
+            self._bytes = connection.execute("select coalesce(sum(size), 0) from response_bodies").fetchone()[0]
+
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, key: ResponseKey) -> Optional[bytes]:
+        """The body of the response cached for `key`, or None if there is none or it has expired"""
+
+        now = self._now()
+        query = (
+            "select b.body, r.expires_at from responses r join response_bodies b on b.digest = r.digest "
+            "where r.key = ?"
+        )
+        with self._lock, self._connection() as connection:
+            row = connection.execute(query, (key.id,)).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                self.misses += 1
+                return None
+
+            connection.execute("update responses set last_used = ? where key = ?", (now, key.id))
+            self.hits += 1
+
+        return zlib.decompress(row[0])
+
+    def put(self, key: ResponseKey, body: bytes):
+        """Cache `body` as the response for `key`, immutable if its periods are settled"""
+
+        now = self._now()
+        settled = key.end.timestamp() <= now - SETTLED_AFTER.total_seconds()
+        expires_at = None if settled else now + RECENT_TTL.total_seconds()
+
+        digest = hashlib.sha256(body).hexdigest()
+        compressed = zlib.compress(body)
+
+        with self._lock, self._connection() as connection:
+            inserted = connection.execute(
+                "insert or ignore into response_bodies values (?, ?, ?)", (digest, compressed, len(compressed))
+            ).rowcount
+            self._bytes += inserted * len(compressed)
+
+            connection.execute(
+                "insert or replace into responses values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key.id,
+                    key.dataset,
+                    key.settlement_date,
+                    key.settlement_period,
+                    key.n_periods,
+                    key.unit,
+                    digest,
+                    now,
+                    expires_at,
+                    now,
+                ),
+            )
+
+            if self._bytes > self.max_bytes:
+                self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection):
+        """Drop the bodies no response points to, then the least recently used responses, until the bodies take
+        under `EVICT_TO` of `max_bytes`"""
+
+        target = EVICT_TO * self.max_bytes
+        n_evicted = 0
+        while True:
+            orphans = connection.execute(
+                "select digest, size from response_bodies where digest not in (select digest from responses)"
+            ).fetchall()
+            connection.executemany("delete from response_bodies where digest = ?", [(d,) for d, _ in orphans])
+            self._bytes -= sum(size for _, size in orphans)
+            if self._bytes <= target:
+                break
+
+            keys = connection.execute("select key from responses order by last_used limit ?", (EVICT_BATCH,))
+            keys = keys.fetchall()
+            if len(keys) == 0:
+                break
+            connection.executemany("delete from responses where key = ?", keys)
+            n_evicted += len(keys)
+
+        logger.info(f"Evicted {n_evicted} responses from the cache, {self._bytes / 1024**2:.1f} MB left")
+
+
+_response_caches: Dict[str, ResponseCache] = {}
+_response_caches_lock = threading.Lock()
+
+
+def open_response_cache(save_dir: Path) -> ResponseCache:
+    """The response cache in `save_dir`, shared by all the fetchers in this process"""
+
+    path = str(Path(save_dir) / RESPONSE_CACHE_FILE)
+    with _response_caches_lock:
+        if path not in _response_caches:
+            Path(save_dir).mkdir(parents=True, exist_ok=True)
+            _response_caches[path] = ResponseCache(path)
+        return _response_caches[path]
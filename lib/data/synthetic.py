@@ -0,0 +1,311 @@
+"""
+Synthetic Elexon market data, for stress testing the pipeline offline.
+
+`generate_physical_data` and `generate_bod_data` produce frames in the layouts `call_physbm_api` and
+`call_api_bod` return, so they go through the same processing and DB loading as data from the API
+(see `load_synthetic_data`). They cover the cases the parquet test data does not:
+- clock change days, with 46 or 50 settlement periods
+- many overlapping BOALFs per unit, which grow with `acceptances_per_day`
+- BOALFs that span settlement periods, which the API reports once for every settlement period they touch
+- missing FPNs, a random `missing_fpn_fraction` of the (unit, settlement period) PNs
+
+Everything is generated with vectorized numpy, so a year of all wind units takes seconds to minutes.
+"""
+import logging
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from lib.constants import df_bm_units
+from lib.data.fetch_boa_data import process_physical_data, write_boal_to_db, write_fpn_to_db
+from lib.data.fetch_bod_data import process_bod_data, write_bod_to_db
+from lib.settlement_periods import SETTLEMENT_PERIOD, to_settlement_periods
+
+logger = logging.getLogger(__name__)
+
+# columns of `call_physbm_api`, BOALF columns first as they are concatenated first
+PHYSICAL_DATA_COLUMNS = [
+    "recordType",
+    "settlementDate",
+    "settlementPeriod",
+    "timeFrom",
+    "timeTo",
+    "levelFrom",
+    "levelTo",
+    "Accept ID",
+    "acceptanceTime",
+    "deemedBidOfferFlag",
+    "soFlag",
+    "rrScheduleFlag",
+    "bmUnitID",
+    "local_datetime",
+]
+PN_COLUMNS = [
+    "recordType",
+    "settlementDate",
+    "settlementPeriod",
+    "timeFrom",
+    "timeTo",
+    "levelFrom",
+    "levelTo",
+    "bmUnitID",
+]
+
+# columns of `call_api_bod`
+BOD_COLUMNS = [
+    "recordType",
+    "settlementDate",
+    "settlementPeriod",
+    "timeFrom",
+    "timeTo",
+    "bidOfferLevelFrom",
+    "bidOfferLevelTo",
+    "bidOfferPairNumber",
+    "offerPrice",
+    "bidPrice",
+    "bmUnitID",
+    "local_datetime",
+]
+
+RAMP_MINUTES = 3
+
+
+def wind_units(n_units: int) -> List[str]:
+    """The first `n_units` wind units in the BM unit list, so generated data passes the wind unit filters"""
+
+    units = df_bm_units[df_bm_units["FUEL TYPE"] == "WIND"]["SETT_BMU_ID"].dropna().unique()
+    if n_units > len(units):
+        raise ValueError(f"Only {len(units)} wind units are known, can not generate {n_units}")
+    return list(units[:n_units])
+
+
+def _api_times(times) -> np.ndarray:
+    """UTC times as the API returns them, e.g. 2022-01-01T00:30:00Z"""
+    seconds = pd.DatetimeIndex(times).tz_convert("UTC").tz_localize(None).to_numpy().astype("datetime64[s]")
+    # times repeat across units, so only format the distinct ones
+    unique_seconds, index = np.unique(seconds, return_inverse=True)
+    return np.char.add(np.datetime_as_string(unique_seconds, unit="s"), "Z").astype(object)[index]
+
+
+def _settlement_period_starts(start, end) -> pd.DatetimeIndex:
+    start = pd.Timestamp(start).tz_localize("UTC") if pd.Timestamp(start).tz is None else pd.Timestamp(start)
+    end = pd.Timestamp(end).tz_localize("UTC") if pd.Timestamp(end).tz is None else pd.Timestamp(end)
+    return pd.date_range(start.floor("30min"), end, freq="30min", inclusive="left").tz_convert("UTC")
+
+
+def _capacities(units: List[str], seed: int) -> np.ndarray:
+    return np.random.default_rng([seed, 1]).uniform(20, 400, len(units)).round()
+
+
+def generate_physical_data(
+    start,
+    end,
+    units: Optional[List[str]] = None,
+    n_units: int = 10,
+    acceptances_per_day: float = 10,
+    missing_fpn_fraction: float = 0.01,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """PN and BOALF data from `start` to `end` (naive UTC), in the layout of `call_physbm_api`.
+
+    `units` defaults to the first `n_units` wind units. Every unit has one PN per settlement period, apart from
+    the missing ones, and on average `acceptances_per_day` acceptances a day. Each acceptance turns the unit
+    down to a random level for up to two hours, in three BOALF segments: a ramp down, a hold and a ramp up.
+    Later acceptances override earlier ones they overlap with.
+    """
+
+    units = wind_units(n_units) if units is None else list(units)
+    rng = np.random.default_rng(seed)
+    periods = _settlement_period_starts(start, end)
+    capacity = _capacities(units, seed)
+
+    # PN: a random walk per unit between 0 and its capacity
+    walk = np.cumsum(rng.normal(0, 0.05, (len(units), len(periods) + 1)), axis=1) + rng.uniform(0, 6, (len(units), 1))
+    levels = np.round(capacity[:, None] * (np.sin(walk) + 1) / 2)
+    dates, settlement_periods = to_settlement_periods(periods)
+    present = rng.random((len(units), len(periods))) >= missing_fpn_fraction
+    unit_index, period_index = np.nonzero(present)
+
+    df_pn = pd.DataFrame(
+        {
+            "recordType": "PN",
+            "settlementDate": dates[period_index],
+            "settlementPeriod": settlement_periods[period_index],
+            "timeFrom": _api_times(periods)[period_index],
+            "timeTo": _api_times(periods + SETTLEMENT_PERIOD)[period_index],
+            "levelFrom": levels[unit_index, period_index],
+            "levelTo": levels[unit_index, period_index + 1],
+            "bmUnitID": np.asarray(units)[unit_index],
+        },
+        columns=PN_COLUMNS,
+    )
+    # assigned after construction, as tz-aware columns in the constructor are converted one value at a time
+    df_pn["local_datetime"] = periods[period_index]
+
+    df_boalf = _generate_boalf(periods, units, capacity, levels, acceptances_per_day, rng)
+
+    df = pd.concat([df_boalf, df_pn], axis=0)[PHYSICAL_DATA_COLUMNS]
+
+    logger.info(f"Generated {len(df_pn)} PNs and {len(df_boalf)} BOALFs for {len(units)} units")
+
+    return df
+
+
+def _generate_boalf(
+    periods: pd.DatetimeIndex,
+    units: List[str],
+    capacity: np.ndarray,
+    levels: np.ndarray,
+    acceptances_per_day: float,
+    rng: np.random.Generator,
+) -> pd.DataFrame:
+    """BOALF rows of random acceptances, one row for every settlement period each segment touches"""
+
+    n_minutes = len(periods) * 30
+    n_acceptances = rng.poisson(acceptances_per_day * n_minutes / (24 * 60) * len(units))
+
+    # start at least a ramp before the end of the data, and end the hold at the latest there too
+    acceptance_units = np.sort(rng.integers(0, len(units), n_acceptances))
+    start_minutes = rng.integers(0, max(n_minutes - 2 * RAMP_MINUTES, 1), n_acceptances)
+    hold_minutes = np.minimum(rng.integers(5, 120, n_acceptances), n_minutes - start_minutes - 2 * RAMP_MINUTES)
+    hold_minutes = np.maximum(hold_minutes, 0)
+
+    # turn down from the FPN level at the start, to a random fraction of it
+    fpn_level = levels[acceptance_units, start_minutes // 30]
+    turned_down = np.round(fpn_level * rng.uniform(0, 0.8, n_acceptances))
+
+    # acceptances are numbered in order of acceptance time for every unit
+    accept_minutes = start_minutes - rng.integers(1, 10, n_acceptances)
+    order = np.lexsort((accept_minutes, acceptance_units))
+    acceptance_units, start_minutes, hold_minutes, fpn_level, turned_down, accept_minutes = (
+        values[order]
+        for values in [acceptance_units, start_minutes, hold_minutes, fpn_level, turned_down, accept_minutes]
+    )
+    first_of_unit = np.searchsorted(acceptance_units, acceptance_units)
+    accept_ids = 100000 + np.arange(n_acceptances) - first_of_unit
+
+    # three segments per acceptance: ramp down, hold and ramp up
+    segment_from = np.concatenate(
+        [start_minutes, start_minutes + RAMP_MINUTES, start_minutes + RAMP_MINUTES + hold_minutes]
+    )
+    segment_to = np.concatenate(
+        [
+            start_minutes + RAMP_MINUTES,
+            start_minutes + RAMP_MINUTES + hold_minutes,
+            start_minutes + 2 * RAMP_MINUTES + hold_minutes,
+        ]
+    )
+    level_from = np.concatenate([fpn_level, turned_down, turned_down])
+    level_to = np.concatenate([turned_down, turned_down, fpn_level])
+    segment_acceptance = np.tile(np.arange(n_acceptances), 3)
+    keep = segment_to > segment_from
+    segment_from, segment_to, level_from, level_to, segment_acceptance = (
+        values[keep] for values in [segment_from, segment_to, level_from, level_to, segment_acceptance]
+    )
+
+    # the API reports a segment in every settlement period it touches
+    first_period = segment_from // 30
+    n_reports = (segment_to - 1) // 30 - first_period + 1
+    rows = np.repeat(np.arange(len(segment_from)), n_reports)
+
+    origin = periods[0] if len(periods) > 0 else pd.Timestamp(0, tz="UTC")
+    time_from = origin + pd.to_timedelta(segment_from[rows], unit="min")
+    time_to = origin + pd.to_timedelta(segment_to[rows], unit="min")
+    accept_time = origin + pd.to_timedelta(accept_minutes[segment_acceptance[rows]], unit="min")
+    dates, settlement_periods = to_settlement_periods(time_from)
+    acceptance = segment_acceptance[rows]
+
+    df = pd.DataFrame(
+        {
+            "recordType": "BOALF",
+            "settlementDate": dates,
+            "settlementPeriod": settlement_periods,
+            "timeFrom": _api_times(time_from),
+            "timeTo": _api_times(time_to),
+            "levelFrom": level_from[rows],
+            "levelTo": level_to[rows],
+            "Accept ID": accept_ids[acceptance],
+            "acceptanceTime": _api_times(accept_time),
+            "deemedBidOfferFlag": False,
+            "soFlag": (rng.random(n_acceptances) < 0.1)[acceptance],
+            "rrScheduleFlag": False,
+            "bmUnitID": np.asarray(units)[acceptance_units[acceptance]],
+        },
+        columns=PHYSICAL_DATA_COLUMNS[:-1],
+    )
+    df["local_datetime"] = time_from
+
+    return df
+
+
+def generate_bod_data(
+    start,
+    end,
+    units: Optional[List[str]] = None,
+    n_units: int = 10,
+    n_bid_pairs: int = 1,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """BOD data from `start` to `end` (naive UTC), in the layout of `call_api_bod`.
+
+    Every unit has `n_bid_pairs` bid pairs (-1, -2, ...) and as many offer pairs for every settlement period.
+    Each bid pair covers an equal share of the unit capacity, at a lower price than the pair before.
+    """
+
+    units = wind_units(n_units) if units is None else list(units)
+    rng = np.random.default_rng([seed, 2])
+    periods = _settlement_period_starts(start, end)
+    capacity = _capacities(units, seed)
+    dates, settlement_periods = to_settlement_periods(periods)
+
+    pairs = np.r_[-np.arange(1, n_bid_pairs + 1), np.arange(1, n_bid_pairs + 1)]
+    unit_index, period_index, pair_index = (
+        index.ravel()
+        for index in np.meshgrid(np.arange(len(units)), np.arange(len(periods)), np.arange(len(pairs)), indexing="ij")
+    )
+
+    # bids get cheaper further down the ladder, offers are priced out
+    first_bid = rng.uniform(-150, -20, (len(units), len(periods)))
+    ladder_step = rng.uniform(10, 50, (len(units), len(periods)))
+    pair = pairs[pair_index]
+    bid_price = first_bid[unit_index, period_index] - (np.abs(pair) - 1) * ladder_step[unit_index, period_index]
+    bid_price = np.round(bid_price, 2)
+    level = np.sign(pair) * np.round(capacity[unit_index] / n_bid_pairs)
+
+    df = pd.DataFrame(
+        {
+            "recordType": "BOD",
+            "settlementDate": dates[period_index],
+            "settlementPeriod": settlement_periods[period_index],
+            "timeFrom": _api_times(periods)[period_index],
+            "timeTo": _api_times(periods + SETTLEMENT_PERIOD)[period_index],
+            "bidOfferLevelFrom": level,
+            "bidOfferLevelTo": level,
+            "bidOfferPairNumber": pair,
+            "offerPrice": 9999.0,
+            "bidPrice": bid_price,
+            "bmUnitID": np.asarray(units)[unit_index],
+        },
+        columns=BOD_COLUMNS[:-1],
+    )
+    df["local_datetime"] = periods[period_index]
+
+    logger.info(f"Generated {len(df)} BODs for {len(units)} units")
+
+    return df
+
+
+def load_synthetic_data(database_engine, start, end, units: Optional[List[str]] = None, n_units: int = 10, **kwargs):
+    """Generate data from `start` to `end` and load it into the FPN, BOAL and BOD tables of `database_engine`,
+    processed like data from the API. `kwargs` are passed to `generate_physical_data`."""
+
+    units = wind_units(n_units) if units is None else list(units)
+    seed = kwargs.get("seed", 0)
+
+    df_fpn, df_boal = process_physical_data(generate_physical_data(start, end, units=units, **kwargs))
+    df_bod = process_bod_data(generate_bod_data(start, end, units=units, seed=seed))
+
+    write_fpn_to_db(df_fpn, database_engine)
+    write_boal_to_db(df_boal, database_engine)
+    write_bod_to_db(df_bod, database_engine)
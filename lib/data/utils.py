@@ -3,6 +3,8 @@ import multiprocessing
 
 import pandas as pd
 
+from lib.settlement_periods import to_utc
+
 MINUTES_TO_HOURS = 1 / 60
 N_POOL_INSTANCES = 20
 
@@ -13,7 +15,7 @@ multiprocessing.log_to_stderr()
 def format_physical_data(df: pd.DataFrame) -> pd.DataFrame:
     df = df.rename(columns={"timeFrom": "From Time", "timeTo": "To Time", "bmUnitID": "Unit"})
 
-    df["From Time"], df["To Time"] = df["From Time"].apply(pd.to_datetime), df["To Time"].apply(pd.to_datetime)
+    df["From Time"], df["To Time"] = pd.to_datetime(df["From Time"]), pd.to_datetime(df["To Time"])
     return df
 
 
@@ -44,9 +46,5 @@ def parse_boal_from_physical_data(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def add_utc_timezone(datetime):
-    """ Add utc timezone to datetime. """
-    if datetime.tzinfo is None:
-        datetime = datetime.tz_localize('UTC')
-    else:
-        datetime = datetime.tz_convert('UTC')
-    return datetime
+    """ Add utc timezone to datetime, or datetimes. """
+    return to_utc(datetime)
@@ -1,14 +1,37 @@
 import logging
 import sqlite3
-from typing import Tuple
+from typing import List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 from sqlalchemy import create_engine
 
 from lib.constants import SQL_DIR, BASE_DIR
+from lib.settlement_periods import to_epoch_seconds
+from lib.spans import frame_bytes, span
 
 logger = logging.getLogger(__name__)
 
+# the columns the curtailment engines use, the only ones loaded with `compact=True`
+COMPACT_COLUMNS = {
+    "fpn": ["timeFrom", "timeTo", "levelFrom", "levelTo"],
+    "boal": ["timeFrom", "timeTo", "levelFrom", "levelTo", "Accept ID", "Accept Time"],
+    "bod": [
+        "timeFrom",
+        "timeTo",
+        "bidOfferPairNumber",
+        "bidOfferLevelFrom",
+        "bidOfferLevelTo",
+        "bidPrice",
+        "offerPrice",
+    ],
+}
+COMPACT_LEVEL_COLUMNS = ["levelFrom", "levelTo", "bidOfferLevelFrom", "bidOfferLevelTo"]
+# the FPN, BOAL and BOD tables of the CCGT units have this prefix, see sql/init_gas_db.sql
+GAS_TABLE_PREFIX = "gas_"
+# stored as int64 UTC epoch seconds, and loaded as naive UTC datetimes
+TIME_COLUMNS = ["local_datetime", "timeFrom", "timeTo"]
+
 
 def drop_and_initialize_tables(path_to_db):
     """Init the tables of our DB, setting primary keys.
@@ -41,28 +64,144 @@ def drop_and_initialize_bod_table(path_to_db):
         connection.commit()
 
 
+def drop_and_initialize_gas_tables(path_to_db):
+    """Init the FPN, BOAL and BOD tables of the CCGT units"""
+
+    logger.info(f"drop and initialize gas tables {path_to_db} ")
+    connection = sqlite3.connect(path_to_db)
+
+    with open(SQL_DIR / "init_gas_db.sql") as f:
+        query = f.read()
+
+    with connection:
+        connection.executescript(query)
+        connection.commit()
+
+
+def to_stored_times(df: pd.DataFrame) -> pd.DataFrame:
+    """`df` with its `TIME_COLUMNS` as int64 UTC epoch seconds, as they are written to the DB"""
+    df = df.copy()
+    for column in TIME_COLUMNS:
+        if column in df.columns:
+            df[column] = to_epoch_seconds(df[column])
+
+    return df
+
+
+def from_stored_times(df: pd.DataFrame) -> pd.DataFrame:
+    """`df` with its `TIME_COLUMNS` as naive UTC datetimes.
+
+    DBs written before times were stored as epoch seconds have them as text, which is parsed instead.
+    """
+    for column in TIME_COLUMNS:
+        if column not in df.columns:
+            continue
+        if pd.api.types.is_numeric_dtype(df[column]) and len(df) > 0:
+            df[column] = pd.to_datetime(df[column], unit="s")
+        else:
+            df[column] = pd.to_datetime(df[column])
+
+    return df
+
+
+def compact_physical_data(df: pd.DataFrame) -> pd.DataFrame:
+    """Use a categorical unit index and float32 levels.
+
+    Times are kept as naive UTC datetime64, which are already int64 epoch nanoseconds.
+    """
+    df = df.copy()
+    df.index = pd.CategoricalIndex(df.index, name=df.index.name)
+    for column in COMPACT_LEVEL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype(np.float32)
+
+    return df
+
+
+class UnitPartition:
+    """The rows of a frame indexed by unit, grouped by unit.
+
+    Rows are stably sorted by unit, so every unit is one contiguous block, in its original row order, and
+    the offsets of each block are computed once. Getting the rows of a unit is a dictionary lookup and a
+    positional slice, and always returns a DataFrame, which is empty (with the same columns and dtypes)
+    for units without rows.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        codes, units = pd.factorize(np.asarray(df.index), sort=True)
+        if (np.diff(codes) < 0).any():
+            order = np.argsort(codes, kind="stable")
+            df, codes = df.iloc[order], codes[order]
+
+        starts = np.searchsorted(codes, np.arange(len(units) + 1))
+        self.frame = df
+        self.units = pd.Index(units, name=df.index.name)
+        self._offsets = dict(zip(units, zip(starts[:-1], starts[1:])))
+
+    def __getitem__(self, unit) -> pd.DataFrame:
+        start, end = self._offsets.get(unit, (0, 0))
+        return self.frame.iloc[start:end]
+
+    def __contains__(self, unit) -> bool:
+        return unit in self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def take(self, units) -> pd.DataFrame:
+        """The rows of all `units`, unit by unit"""
+        offsets = [self._offsets[unit] for unit in units if unit in self._offsets]
+        if len(offsets) == 0:
+            return self.frame.iloc[:0]
+        return self.frame.iloc[np.concatenate([np.arange(start, end) for start, end in offsets])]
+
+
+def sort_by_unit(df: pd.DataFrame) -> pd.DataFrame:
+    """`df` stably sorted by its unit index, so its rows are already grouped for `UnitPartition`"""
+    return UnitPartition(df).frame
+
+
 class DbRepository:
     def __init__(self, db_path: str):
         self.db_path = db_path
         self.engine = create_engine(f"sqlite:///{self.db_path}", echo=False)
 
-    def _get_query(self, table_name: str, start_time: str, end_time: str):
+    def _get_query(self, table_name: str, start_time: str, end_time: str, columns: Optional[List[str]] = None):
         """
         Cannot set table name as an SQL param:https://stackoverflow.com/questions/46736633/syntax-error-with-python3-and-sqlite3-when-using-parameters
+
+        All columns are selected, unless `columns` is given.
         """
+        columns = "*" if columns is None else ", ".join(f'"{column}"' for column in columns)
+
+        return f"select {columns} from {table_name} where {self._time_condition(start_time, end_time)}"
+
+    @staticmethod
+    def _time_condition(start_time: str, end_time: str) -> str:
+        """Rows from a second before `start_time` to a second after `end_time`"""
         start_time = pd.to_datetime(start_time) - pd.Timedelta(seconds=1)
         start_time = str(start_time)
 
         end_time = pd.to_datetime(end_time) + pd.Timedelta(seconds=1)
         end_time = str(end_time)
 
+        # times are stored as epoch seconds, or as text in older DBs. Integers sort before text in SQLite,
+        # so each of these ranges only matches its own storage
+        start_seconds, end_seconds = to_epoch_seconds(pd.DatetimeIndex([start_time, end_time]))
+
         return (
-            f"select * from {table_name} "
-            f" where local_datetime < '{end_time}' "
-            f" and local_datetime >= '{start_time}' "
+            f" ((local_datetime < {end_seconds} and local_datetime >= {start_seconds}) "
+            f" or (local_datetime < '{end_time}' and local_datetime >= '{start_time}')) "
         )
 
-    def get_data_for_time_range(self, start_time: str, end_time: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    def get_data_for_time_range(
+        self, start_time: str, end_time: str, compact: bool = False, table_prefix: str = ""
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+        """FPN, BOAL and BOD data, indexed by unit and sorted by unit, see `get_data_by_unit_for_time_range`.
+
+        With `compact`, only the columns in `COMPACT_COLUMNS` are loaded, see `compact_physical_data`.
+        With `table_prefix=GAS_TABLE_PREFIX`, the data of the CCGT units is loaded instead of the wind units.
+        """
 
         logger.debug(f"{start_time=}")
         logger.debug(f"{end_time=}")
@@ -70,35 +209,94 @@ class DbRepository:
         # load 30 minutes more
         start_time = pd.to_datetime(start_time) - pd.Timedelta(minutes=30)
 
-        with self.engine.connect() as conn:
+        def columns(table_name: str, index_col: str) -> Optional[List[str]]:
+            return [index_col] + COMPACT_COLUMNS[table_name] if compact else None
+
+        with span("db_read") as read, self.engine.connect() as conn:
             logger.debug(f"Getting FPNs from {start_time} to {end_time}")
             df_fpn = pd.read_sql(
-                self._get_query("fpn", start_time, end_time),
+                self._get_query(f"{table_prefix}fpn", start_time, end_time, columns=columns("fpn", "unit")),
                 conn,
                 index_col="unit",
-                parse_dates=["timeFrom", "timeTo"],
             )
             logger.debug(f"Getting BOAs from {start_time} to {end_time}")
             df_boal = pd.read_sql(
-                self._get_query("boal", start_time, end_time),
+                self._get_query(f"{table_prefix}boal", start_time, end_time, columns=columns("boal", "unit")),
                 conn,
                 index_col="unit",
-                parse_dates=["timeFrom", "timeTo"],
             )
             logger.debug(f"Getting BODs from {start_time} to {end_time}")
             df_bod = pd.read_sql(
-                self._get_query("bod", start_time, end_time),
+                self._get_query(f"{table_prefix}bod", start_time, end_time, columns=columns("bod", "bmUnitID")),
                 conn,
                 index_col="bmUnitID",
-                parse_dates=["timeFrom", "timeTo"],
             )
 
+            df_fpn, df_boal, df_bod = map(from_stored_times, (df_fpn, df_boal, df_bod))
+            if compact:
+                df_fpn, df_boal, df_bod = map(compact_physical_data, (df_fpn, df_boal, df_bod))
+            df_fpn, df_boal, df_bod = map(sort_by_unit, (df_fpn, df_boal, df_bod))
+
             logger.info(f"Found {len(df_fpn)} FPNs")
             logger.info(f"Found {len(df_boal)} BOAs")
             logger.info(f"Found {len(df_bod)} BODs")
 
+            read.rows_out = len(df_fpn) + len(df_boal) + len(df_bod)
+            read.bytes = frame_bytes(df_fpn, df_boal, df_bod)
+
         return df_fpn, df_boal, df_bod
 
+    def get_fpn_around_time_range(
+        self,
+        start_time: str,
+        end_time: str,
+        outer_start_time: str,
+        outer_end_time: str,
+        compact: bool = False,
+        table_prefix: str = "",
+    ) -> pd.DataFrame:
+        """Each unit's last FPN row before the rows `get_data_for_time_range` loads from `start_time` to `end_time`,
+        and its first FPN row after them, looking no further than the rows it would load from `outer_start_time`
+        to `outer_end_time`. The engines interpolate from these rows across gaps in the FPNs.
+
+        Indexed by unit and sorted by unit, like `get_data_for_time_range`. The rows may overlap the ones it loads.
+        """
+
+        # load 30 minutes more, like `get_data_for_time_range`
+        start_time = pd.to_datetime(start_time) - pd.Timedelta(minutes=30)
+        outer_start_time = pd.to_datetime(outer_start_time) - pd.Timedelta(minutes=30)
+
+        columns = ", ".join(f'"{column}"' for column in ["unit"] + COMPACT_COLUMNS["fpn"]) if compact else "*"
+
+        # SQLite takes the other columns from the row with the max or min
+        queries = [
+            f"select {columns}, {aggregate}(local_datetime) as bound from {table_prefix}fpn "
+            f"where {self._time_condition(start, end)} group by unit"
+            for aggregate, start, end in [("max", outer_start_time, start_time), ("min", end_time, outer_end_time)]
+        ]
+
+        with span("db_read") as read, self.engine.connect() as conn:
+            # converted one at a time, as an empty frame would turn the times of the other to objects
+            df_fpn = pd.concat(
+                [from_stored_times(pd.read_sql(query, conn, index_col="unit")) for query in queries]
+            ).drop(columns=["bound"])
+            if compact:
+                df_fpn = compact_physical_data(df_fpn)
+            df_fpn = sort_by_unit(df_fpn)
+
+            read.rows_out = len(df_fpn)
+            read.bytes = frame_bytes(df_fpn)
+
+        return df_fpn
+
+    def get_data_by_unit_for_time_range(
+        self, start_time: str, end_time: str, compact: bool = False
+    ) -> Tuple[UnitPartition, UnitPartition, UnitPartition]:
+        """FPN, BOAL and BOD data, grouped by unit, for taking the rows of one unit at a time"""
+        return tuple(
+            map(UnitPartition, self.get_data_for_time_range(start_time=start_time, end_time=end_time, compact=compact))
+        )
+
 
 if __name__ == "__main__":
     db = DbRepository(BASE_DIR / "scripts/phys_data.db")
@@ -0,0 +1,146 @@
+"""
+Gas turn up: the energy and cost of the CCGT units the system operator turns up, e.g. to replace curtailed wind.
+
+Every CCGT acceptance with the system operator flag ("soFlag") set moves a unit away from its FPN. The turn up
+is the positive part of BOAL - FPN, integrated exactly over the same piecewise-linear intervals as the exact
+curtailment engine (see `lib.curtailment_exact.build_curtailment_segments`), for all units in one pass. All
+acceptances are resolved first, so a system operator acceptance only counts where no later acceptance, flagged
+or not, has replaced it.
+Every MWh is costed at the unit's offer price (bid-offer pair 1) at the time, like turn downs are costed at
+pair -1.
+
+This replaces the fixed £100 or £200 per MWh gas price that `sql/read_data.sql` used to assume.
+"""
+import logging
+
+import numpy as np
+import pandas as pd
+
+from lib.bid_prices import BidPriceIndex
+from lib.constants import df_bm_units
+from lib.curtailment_exact import SECONDS_TO_HOURS, build_curtailment_segments
+from lib.db_utils import GAS_TABLE_PREFIX, DbRepository
+from lib.settlement_periods import SETTLEMENT_PERIOD_SECONDS, from_epoch_seconds, to_utc
+from lib.spans import span
+
+logger = logging.getLogger(__name__)
+
+GAS_TURN_UP_COLUMNS = ["turnup_mwh", "turnup_cost_gbp"]
+# soFlag is "T" or "F" from the API, and a bool in synthetic data
+SO_FLAG_VALUES = ["T", "True", "true", "1"]
+
+
+def ccgt_units(df_bm_units: pd.DataFrame = df_bm_units) -> np.ndarray:
+    """Settlement BM unit IDs of the CCGT units"""
+    return df_bm_units[df_bm_units["FUEL TYPE"] == "CCGT"]["SETT_BMU_ID"].unique()
+
+
+def system_operator_acceptances(df_boal: pd.DataFrame) -> pd.DataFrame:
+    """BOALs of the acceptances flagged by the system operator"""
+    return df_boal[df_boal["soFlag"].astype(str).isin(SO_FLAG_VALUES)]
+
+
+def _is_system_operator_acceptance(units, accept_ids, df_boal: pd.DataFrame) -> np.ndarray:
+    """Whether each (unit, "Accept ID") is an acceptance flagged by the system operator in `df_boal`"""
+    df_so = system_operator_acceptances(df_boal)
+    so_accepts = pd.MultiIndex.from_arrays([df_so.index, df_so["Accept ID"]])
+    return pd.MultiIndex.from_arrays([units, accept_ids]).isin(so_accepts)
+
+
+def _no_turn_up() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Unit": pd.Series([], dtype=object),
+            "Time": from_epoch_seconds([]),
+            **{column: pd.Series([], dtype=float) for column in GAS_TURN_UP_COLUMNS},
+        }
+    )
+
+
+def _positive_part(level_from: np.ndarray, level_to: np.ndarray) -> np.ndarray:
+    """Mean of max(level, 0) over an interval on which the level is linear from `level_from` to `level_to`"""
+
+    both_positive = (level_from >= 0) & (level_to >= 0)
+
+    # crossing zero, the positive end is positive for |positive| / (|from| + |to|) of the interval
+    positive_squared = np.maximum(level_from, 0) ** 2 + np.maximum(level_to, 0) ** 2
+    total = np.abs(level_from) + np.abs(level_to)
+    crossing = np.divide(positive_squared, 2 * total, out=np.zeros_like(total), where=total > 0)
+
+    return np.where(both_positive, 0.5 * (level_from + level_to), crossing)
+
+
+def analyze_gas_units(
+    df_fpn: pd.DataFrame,
+    df_boal: pd.DataFrame,
+    df_bod: pd.DataFrame,
+    period_seconds: int = SETTLEMENT_PERIOD_SECONDS,
+) -> pd.DataFrame:
+    """Turn up of every unit, one row per (Unit, Time) period of `period_seconds` with `GAS_TURN_UP_COLUMNS`.
+
+    The inputs are indexed by unit, as returned by `DbRepository.get_data_for_time_range`, and the BOALs need
+    their "soFlag". Time is in Europe/London, and only periods with a system operator acceptance are returned.
+    Every acceptance takes part in the last-"Accept ID"-wins resolution, and only the intervals won by a system
+    operator acceptance are turn up.
+    """
+
+    if len(system_operator_acceptances(df_boal)) == 0:
+        return _no_turn_up()
+
+    df_segments = build_curtailment_segments(
+        df_fpn=df_fpn, df_boal=df_boal, df_bod=df_bod, period_seconds=period_seconds
+    )
+    df_segments = df_segments[
+        _is_system_operator_acceptance(df_segments["Unit"], df_segments["Accept ID"], df_boal)
+    ]
+    if len(df_segments) == 0:
+        return _no_turn_up()
+
+    time_from = df_segments["time_from"].to_numpy(np.int64)
+    hours = (df_segments["time_to"].to_numpy(np.int64) - time_from) * SECONDS_TO_HOURS
+    turn_up_mwh = (
+        _positive_part(
+            df_segments["boal_from"].to_numpy(float) - df_segments["fpn_from"].to_numpy(float),
+            df_segments["boal_to"].to_numpy(float) - df_segments["fpn_to"].to_numpy(float),
+        )
+        * hours
+    )
+
+    # offer price, as-of the start of each interval
+    offer_prices = BidPriceIndex(df_bod).lookup_offer(df_segments["Unit"].to_numpy(), time_from)
+    turn_up_cost_gbp = np.nan_to_num(offer_prices * turn_up_mwh)
+
+    df = pd.DataFrame(
+        {
+            "Unit": df_segments["Unit"].to_numpy(),
+            "Time": time_from // period_seconds * period_seconds,
+            "turnup_mwh": turn_up_mwh,
+            "turnup_cost_gbp": turn_up_cost_gbp,
+        }
+    )
+    df = df.groupby(["Unit", "Time"], sort=True).sum().reset_index()
+    df["Time"] = from_epoch_seconds(df["Time"])
+
+    return df[["Unit", "Time"] + GAS_TURN_UP_COLUMNS]
+
+
+def analyze_gas_turn_up(db: DbRepository, start_time, end_time) -> pd.DataFrame:
+    """National gas turn up between `start_time` and `end_time`: one row per settlement period with a system
+    operator acceptance, with "Time" in Europe/London and `GAS_TURN_UP_COLUMNS`.
+
+    The CCGT data is read from the gas tables, see `drop_and_initialize_gas_tables`.
+    """
+
+    df_fpn, df_boal, df_bod = db.get_data_for_time_range(
+        start_time=start_time, end_time=end_time, table_prefix=GAS_TABLE_PREFIX
+    )
+
+    with span("gas_turn_up", rows_in=len(df_fpn) + len(df_boal) + len(df_bod)) as gas_turn_up:
+        df = analyze_gas_units(df_fpn, df_boal, df_bod)
+        df = df[(df["Time"] >= to_utc(pd.Timestamp(start_time))) & (df["Time"] < to_utc(pd.Timestamp(end_time)))]
+        df = df.groupby("Time")[GAS_TURN_UP_COLUMNS].sum().reset_index()
+        gas_turn_up.rows_out = len(df)
+
+    logger.info(f"Total gas turn up was {df['turnup_mwh'].sum():.2f} MWh, costing £{df['turnup_cost_gbp'].sum():.2f}")
+
+    return df
@@ -7,6 +7,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.exc import IntegrityError
 
 from lib import constants
+from lib.spans import frame_bytes, span
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +37,7 @@ def write_curtailment_data(df: pd.DataFrame):
 
         logger.info(f"Adding curtailment to database ({len(df)}")
 
-        with engine.connect() as conn:
+        with span("postgres_write", rows_in=len(df), bytes=frame_bytes(df)), engine.connect() as conn:
             df.to_sql("curtailment", conn, if_exists="append", index=False)
 
 
@@ -51,7 +52,7 @@ def write_sbp_data(df: pd.DataFrame):
         engine = get_db_connection()
         logger.info(f"Adding sbp to database ({len(df)}")
 
-        with engine.connect() as conn:
+        with span("postgres_write", rows_in=len(df), bytes=frame_bytes(df)), engine.connect() as conn:
             try:
                 df.to_sql("sbp", conn, if_exists="append", index=False)
             except IntegrityError:
@@ -79,6 +80,8 @@ def load_data(path: Path) -> pd.DataFrame:
     df = pd.read_csv(path, index_col=0)
 
     columns = ["time", "level_fpn", "level_boal", "level_after_boal", "delta_mw", "cost_gbp"]
+    # results from before the gas turn up stage do not have these, see lib/gas_turn_up.py
+    columns += [column for column in ["turnup_mwh", "turnup_cost_gbp"] if column in df.columns]
 
     if len(df) == 0:
         logger.debug("No data to load")
@@ -0,0 +1,93 @@
+"""
+Vectorized conversions between times and settlement periods.
+
+Settlement periods are the 30 minute periods of a settlement date, counted from 1 at local midnight in
+Europe/London, so a date has 46 periods when the clocks go forward, 50 when they go back and 48 otherwise.
+The functions here convert whole arrays of times at once. Only the local midnight of every distinct date
+needs a time zone conversion, so this is much faster than converting one time at a time (e.g. `sp2ts.dt2sp`).
+
+Times are UTC throughout, and naive times are taken to be UTC. Inside the pipeline a time is an int64 UTC
+epoch: seconds in the database and in the engines' arrays (see `to_epoch_seconds`), and datetime64 columns
+otherwise. Conversions go through timedeltas rather than the int64 values underneath datetime64 data, so they
+do not depend on its resolution (nanoseconds before pandas 2, which can also use s, ms or us). Times are only
+converted to Europe/London at the output, by `from_epoch_seconds` or `to_local`.
+"""
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+LOCAL_TIMEZONE = "Europe/London"
+SETTLEMENT_PERIOD_SECONDS = 30 * 60
+SETTLEMENT_PERIOD = pd.Timedelta(seconds=SETTLEMENT_PERIOD_SECONDS)
+EPOCH = pd.Timestamp(0, tz="UTC")
+
+
+def to_utc(times):
+    """Times (a timestamp, index or series) in UTC, taking naive times to be UTC already"""
+    if isinstance(times, pd.Series):
+        return times.dt.tz_localize("UTC") if times.dt.tz is None else times.dt.tz_convert("UTC")
+    return times.tz_localize("UTC") if times.tz is None else times.tz_convert("UTC")
+
+
+def to_local(times):
+    """Times (a timestamp, index or series) in Europe/London, taking naive times to be UTC"""
+    times = to_utc(times)
+    if isinstance(times, pd.Series):
+        return times.dt.tz_convert(LOCAL_TIMEZONE)
+    return times.tz_convert(LOCAL_TIMEZONE)
+
+
+def to_epoch_seconds(times) -> np.ndarray:
+    """Datetimes (naive UTC or tz-aware) or integer epoch seconds, as int64 epoch seconds"""
+    times = np.asarray(times) if not isinstance(times, (pd.Series, pd.Index)) else times
+    if pd.api.types.is_integer_dtype(times.dtype):
+        return np.asarray(times, dtype=np.int64)
+    return np.asarray((to_utc(pd.DatetimeIndex(times)) - EPOCH) // pd.Timedelta(seconds=1), dtype=np.int64)
+
+
+def from_epoch_seconds(seconds) -> pd.DatetimeIndex:
+    """Epoch seconds as Europe/London times, for output"""
+    return pd.to_datetime(np.asarray(seconds, dtype=np.int64), unit="s", utc=True).tz_convert(LOCAL_TIMEZONE)
+
+
+def _local_midnights(dates: np.ndarray) -> pd.DatetimeIndex:
+    """The local midnight of datetime64[D] `dates`, in UTC"""
+    days, day_index = np.unique(dates, return_inverse=True)
+    return pd.DatetimeIndex(days).tz_localize(LOCAL_TIMEZONE).tz_convert("UTC")[day_index.reshape(-1)]
+
+
+def to_settlement_periods(times, closed: str = "left") -> Tuple[np.ndarray, np.ndarray]:
+    """The settlement dates (as "YYYY-MM-DD" strings) and settlement periods that an array of `times` fall in.
+
+    Periods are closed left by default, so 00:00 is in period 1. With `closed="right"`, a time on a period
+    boundary is in the period that ends there, so 00:30 is in period 1, like `sp2ts.dt2sp`.
+    """
+    if closed not in ("left", "right"):
+        raise ValueError(f"closed should be 'left' or 'right', not {closed}")
+
+    times = to_utc(pd.DatetimeIndex(times))
+    if closed == "right":
+        times = times - pd.Timedelta(1, "ns")
+
+    local_dates = times.tz_convert(LOCAL_TIMEZONE).tz_localize(None).to_numpy().astype("datetime64[D]")
+    periods = np.asarray((times - _local_midnights(local_dates)) // SETTLEMENT_PERIOD) + 1
+
+    # dates repeat, so only format the distinct ones
+    days, day_index = np.unique(local_dates, return_inverse=True)
+    return np.datetime_as_string(days).astype(object)[day_index.reshape(-1)], periods.astype(np.int64)
+
+
+def from_settlement_periods(dates, periods) -> pd.DatetimeIndex:
+    """The UTC start times of settlement `periods` of settlement `dates`"""
+    dates = np.asarray(dates).astype("datetime64[D]")
+    periods = np.asarray(periods, dtype=np.int64)
+
+    return _local_midnights(dates) + pd.to_timedelta((periods - 1) * SETTLEMENT_PERIOD_SECONDS, unit="s")
+
+
+def periods_in_day(dates) -> np.ndarray:
+    """The number of settlement periods in each of `dates`: 46, 48 or 50"""
+    dates = np.asarray(dates).astype("datetime64[D]")
+    day_lengths = _local_midnights(dates + 1) - _local_midnights(dates)
+    return np.asarray(day_lengths // SETTLEMENT_PERIOD, dtype=np.int64)
@@ -0,0 +1,111 @@
+"""
+Lightweight spans, to see where the time of a run goes.
+
+Every stage of the ETL and the engine is wrapped in a `span`, which records its duration and, where they are
+known, the rows going in and out and the bytes handled. Spans go to the current run (see `start_run`), which
+sums them by name into a summary that can be logged as one line of JSON:
+
+    with span("sqlite_write", rows_in=len(df), bytes=frame_bytes(df)):
+        df.to_sql(...)
+
+Spans are thread safe, so the threads fetching units in parallel all record into the same run. Spans in
+worker processes are not recorded, the span around the whole parallel stage is.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    name: str
+    duration_s: float = 0.0
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    bytes: Optional[int] = None
+
+
+class Run:
+    """The spans of one run, e.g. one chunk of the ETL"""
+
+    def __init__(self, name: str = "run"):
+        self.name = name
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, rows_in: Optional[int] = None, bytes: Optional[int] = None) -> Iterator[Span]:
+        """Time the body, which can set `rows_out` (and `rows_in` and `bytes`) on the yielded span"""
+        span = Span(name=name, rows_in=rows_in, bytes=bytes)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration_s = time.perf_counter() - start
+            with self._lock:
+                self.spans.append(span)
+
+    def summary(self, **fields) -> dict:
+        """Spans summed by name, in the order they first ran. `fields` are added to the summary as they are."""
+
+        stages: Dict[str, dict] = {}
+        with self._lock:
+            spans = list(self.spans)
+
+        for span in spans:
+            stage = stages.setdefault(
+                span.name, {"count": 0, "total_s": 0.0, "max_s": 0.0, "rows_in": 0, "rows_out": 0, "bytes": 0}
+            )
+            stage["count"] += 1
+            stage["total_s"] += span.duration_s
+            stage["max_s"] = max(stage["max_s"], span.duration_s)
+            for field in ["rows_in", "rows_out", "bytes"]:
+                stage[field] += getattr(span, field) or 0
+
+        for stage in stages.values():
+            stage["total_s"] = round(stage["total_s"], 6)
+            stage["max_s"] = round(stage["max_s"], 6)
+
+        return {"run": self.name, "wall_s": round(time.perf_counter() - self._start, 6), **fields, "stages": stages}
+
+    def to_json(self, **fields) -> str:
+        return json.dumps(self.summary(**fields), default=str)
+
+
+_current_run = Run()
+
+
+def start_run(name: str = "run") -> Run:
+    """Start recording spans into a new run, and return it"""
+    global _current_run
+    _current_run = Run(name)
+    return _current_run
+
+
+def current_run() -> Run:
+    return _current_run
+
+
+def span(name: str, rows_in: Optional[int] = None, bytes: Optional[int] = None):
+    """A span of the current run, see `Run.span`"""
+    return _current_run.span(name, rows_in=rows_in, bytes=bytes)
+
+
+def frame_bytes(*dfs: pd.DataFrame) -> int:
+    """Shallow memory use of dataframes, which is cheap but does not count the contents of strings"""
+    return int(sum(df.memory_usage(index=True, deep=False).sum() for df in dfs if df is not None))
+
+
+def log_run_summary(run: Optional[Run] = None, **fields):
+    """Log the summary of `run` (the current run by default) as one line of JSON"""
+    run = _current_run if run is None else run
+    logger.info(run.to_json(**fields))
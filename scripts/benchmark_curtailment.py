@@ -0,0 +1,61 @@
+"""
+Benchmark the curtailment engine, see `lib/benchmark.py`.
+
+    python scripts/benchmark_curtailment.py --scales small medium
+    python scripts/benchmark_curtailment.py --scales small medium --update-baseline
+
+Results are written to `--output`, and compared to the baseline in `scripts/benchmark_baseline.json`.
+The script exits with status 1 if any run regressed past the baseline. Baselines depend on the machine,
+so update the baseline on the machine the benchmarks are compared on.
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from lib.benchmark import SCALES, Tolerance, find_regressions, load_results, run_benchmarks, save_results
+from lib.constants import DATA_DIR
+
+BASELINE_PATH = Path(__file__).parent / "benchmark_baseline.json"
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs="+", default=["small", "medium"], choices=list(SCALES))
+    parser.add_argument("--benchmarks", nargs="+", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=DATA_DIR / "benchmark_results.json")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--wall-ratio", type=float, default=Tolerance.wall_ratio)
+    parser.add_argument("--peak-ratio", type=float, default=Tolerance.peak_ratio)
+    args = parser.parse_args()
+
+    df = run_benchmarks([SCALES[name] for name in args.scales], benchmarks=args.benchmarks, repeat=args.repeat)
+    print(df.to_string(index=False))
+
+    save_results(df, args.output)
+    logger.info(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        save_results(df, args.baseline)
+        logger.info(f"Baseline written to {args.baseline}")
+        sys.exit(0)
+
+    if not args.baseline.exists():
+        logger.warning(f"No baseline at {args.baseline}, run with --update-baseline to store one")
+        sys.exit(0)
+
+    tolerance = Tolerance(wall_ratio=args.wall_ratio, peak_ratio=args.peak_ratio)
+    df_regressions = find_regressions(df, load_results(args.baseline), tolerance=tolerance)
+    if len(df_regressions) > 0:
+        logger.error(f"{len(df_regressions)} runs regressed past the baseline")
+        print(df_regressions.to_string(index=False))
+        sys.exit(1)
+
+    logger.info("No regressions")
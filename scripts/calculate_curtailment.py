@@ -1,3 +1,4 @@
+import os
 import sys
 from pathlib import Path
 
@@ -16,7 +17,7 @@ from lib.curtailment import (
     calculate_curtailment_in_mwh,
     calculate_notified_generation_in_mwh,
     calculate_curtailment_costs_in_gbp,
-    analyze_curtailment,
+    analyze_curtailment_in_windows,
 )
 from lib.data.utils import *
 
@@ -26,15 +27,17 @@ def run1(db: DbRepository, start_time, end_time):
     specified by the BOAL.
     """
 
-    df_fpn, df_boal, df_bod = db.get_data_for_time_range(start_time=start_time, end_time=end_time)
+    fpn_by_unit, boal_by_unit, bod_by_unit = db.get_data_by_unit_for_time_range(
+        start_time=start_time, end_time=end_time
+    )
     curtailment_dfs = []
-    units = df_boal.index.unique()
+    units = boal_by_unit.units
 
     for i, unit in enumerate(units):
         df_curtailment_unit = analyze_one_unit(
-            df_boal_unit=df_boal.loc[unit],
-            df_fpn_unit=df_fpn.loc[unit],
-            df_bod_unit=df_bod.loc[unit],
+            df_boal_unit=boal_by_unit[unit],
+            df_fpn_unit=fpn_by_unit[unit],
+            df_bod_unit=bod_by_unit[unit],
         )
 
         curtailment_in_mwh = calculate_curtailment_in_mwh(df_curtailment_unit)
@@ -94,7 +97,7 @@ def run(db: DbRepository, start_time, end_time):
     specified by the BOAL.
     """
 
-    df = analyze_curtailment(db, start_time, end_time)
+    df = pd.concat(analyze_curtailment_in_windows(db, start_time, end_time, workers=os.cpu_count()))
     df.to_csv(BASE_DIR / f"data/outputs/results-{start_time}-{end_time}.csv")
     make_time_series_plot(df)
 
@@ -3,9 +3,9 @@ import datetime
 import logging
 
 import pandas as pd
-import requests
 
 from lib.constants import DATA_DIR
+from lib.data.rate_limit import shared_limiter
 from lib.data.utils import client
 
 logger = logging.getLogger(__name__)
@@ -26,7 +26,7 @@ def fetch_data_elexon_insights():
     end_time = start_time + datetime.timedelta(days=2)
     data = []
     while end_time < today:
-        r = requests.get(
+        r = shared_limiter().get(
             "https://data.elexon.co.uk/bmrs/api/v1/generation/outturn/summary",
             params=dict(startTime=start_time, endTime=end_time, format="json"),
         )
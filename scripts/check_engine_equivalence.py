@@ -0,0 +1,40 @@
+"""
+Check a curtailment engine against the reference implementation, see `lib/curtailment_golden.py`.
+
+    python scripts/check_engine_equivalence.py --engine exact --start 2022-01-01 --end 2022-01-03
+
+Differences per unit and settlement period are written to `--output`, and the script exits with status 1
+if any period is out of tolerance.
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from lib.constants import BASE_DIR, DATA_DIR
+from lib.curtailment_golden import check_engine
+from lib.db_utils import DbRepository
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", default="minute", choices=["minute", "exact"])
+    parser.add_argument("--start", default="2022-01-01")
+    parser.add_argument("--end", default="2022-01-03")
+    parser.add_argument("--db", type=Path, default=BASE_DIR / "scripts/phys_data.db")
+    parser.add_argument("--output", type=Path, default=DATA_DIR / "engine_differences.csv")
+    args = parser.parse_args()
+
+    df_fpn, df_boal, df_bod = DbRepository(args.db).get_data_for_time_range(start_time=args.start, end_time=args.end)
+    report = check_engine(df_fpn, df_boal, df_bod, engine=args.engine)
+
+    print(report.summary())
+    if not report.passed:
+        report.differences.to_csv(args.output, index=False)
+        logger.info(f"Differences written to {args.output}")
+        sys.exit(1)
@@ -1,11 +1,12 @@
 --Neat trick to get these: dump dataframe to sql, then use the
 --sqlite3 CLI and call .schema tablename
+--Times are int64 UTC epoch seconds
 
 DROP TABLE IF EXISTS bod;
 
 CREATE TABLE bod (
         "bmUnitID" TEXT,
-        local_datetime TIMESTAMP,
+        local_datetime INTEGER,
         "recordType" TEXT,
         "bMUnitType" TEXT,
         "leadPartyName" TEXT,
@@ -13,9 +14,9 @@ CREATE TABLE bod (
         "settlementDate" TEXT,
         "settlementPeriod" TEXT,
         "bidOfferPairNumber" REAL,
-        "timeFrom" DATETIME,
+        "timeFrom" INTEGER,
         "bidOfferLevelFrom" REAL,
-        "timeTo" DATETIME,
+        "timeTo" INTEGER,
         "bidOfferLevelTo" REAL,
         "bidPrice" REAL,
         "offerPrice" REAL,
@@ -26,4 +27,5 @@ CREATE TABLE bod (
     );
 
 CREATE INDEX ix_bod_unit ON bod ("bmUnitID");
+CREATE INDEX ix_bod_local_datetime ON bod (local_datetime);
 CREATE INDEX ix_bod_time ON bod ("timeFrom", "timeTo");
@@ -0,0 +1,5 @@
+--Add the gas turn up columns to an existing curtailment table, see lib/gas_turn_up.py.
+--Rows written before this have NULLs, and read_data.sql falls back to the fixed gas price for them
+
+ALTER TABLE curtailment ADD COLUMN IF NOT EXISTS "turnup_mwh" REAL;
+ALTER TABLE curtailment ADD COLUMN IF NOT EXISTS "turnup_cost_gbp" REAL;
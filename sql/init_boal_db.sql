@@ -1,21 +1,22 @@
 --Neat trick to get these: dump dataframe to sql, then use the
 --sqlite3 CLI and call .schema tablename
+--Times are int64 UTC epoch seconds
 
 DROP TABLE IF EXISTS fpn;
 DROP TABLE IF EXISTS boal;
 
 CREATE TABLE fpn (
         "unit" TEXT,
-        local_datetime TIMESTAMP,
+        local_datetime INTEGER,
         "recordType" TEXT,
         "bMUnitType" TEXT,
         "leadPartyName" TEXT,
         "ngcBMUnitName" TEXT,
         "settlementDate" TEXT,
         "settlementPeriod" TEXT,
-        "timeFrom" DATETIME,
+        "timeFrom" INTEGER,
         "levelFrom" REAL,
-        "timeTo" DATETIME,
+        "timeTo" INTEGER,
         "levelTo" REAL,
         "activeFlag" TEXT,
         "Fuel Type" TEXT,
@@ -25,20 +26,21 @@ CREATE TABLE fpn (
     );
 
 CREATE INDEX ix_fpn_unit ON fpn ("unit");
+CREATE INDEX ix_fpn_local_datetime ON fpn (local_datetime);
 CREATE INDEX ix_fpn_time ON fpn ("timeFrom", "timeTo");
 
 
 CREATE TABLE boal (
     "unit" TEXT,
-    local_datetime TIMESTAMP,
+    local_datetime INTEGER,
     "recordType" TEXT,
     "bMUnitType" TEXT,
     "leadPartyName" TEXT,
     "ngcBMUnitName" TEXT,
     "settlementDate" TEXT,
     "settlementPeriod" TEXT,
-    "timeFrom" DATETIME,
-    "timeTo" DATETIME,
+    "timeFrom" INTEGER,
+    "timeTo" INTEGER,
     "activeFlag" TEXT,
     "Accept ID" TEXT,
     "Accept Time" TEXT,
@@ -55,4 +57,5 @@ CREATE TABLE boal (
 );
 
 CREATE INDEX ix_boal_unit ON boal ("unit");
+CREATE INDEX ix_boal_local_datetime ON boal (local_datetime);
 CREATE INDEX ix_boal_time ON fpn ("timeFrom", "timeTo");
\ No newline at end of file
@@ -0,0 +1,23 @@
+--Per (unit, settlement period) curtailment results, with a fingerprint of the
+--FPN, BOAL and BOD rows they were computed from. "time" is the start of the
+--settlement period in seconds since the epoch (UTC), and "cached_at" when the
+--row was cached, in seconds since the epoch.
+
+CREATE TABLE IF NOT EXISTS curtailment_cache (
+    "engine" TEXT,
+    "unit" TEXT,
+    "time" INTEGER,
+    "fingerprint" TEXT,
+    "has_output" INTEGER,
+    "Level_FPN" REAL,
+    "Level_BOAL" REAL,
+    "Level_After_BOAL" REAL,
+    "delta" REAL,
+    "energy_mwh" REAL,
+    "cost_gbp" REAL,
+    "cached_at" REAL,
+
+    PRIMARY KEY("engine", "unit", "time")
+);
+
+CREATE INDEX IF NOT EXISTS ix_curtailment_cache_time ON curtailment_cache ("engine", "time");
@@ -0,0 +1,77 @@
+--Tables of the CCGT units, for the gas turn up stage, see lib/gas_turn_up.py.
+--Same columns as the wind tables in init_boal_db.sql and add_bod.sql
+--Times are int64 UTC epoch seconds
+
+DROP TABLE IF EXISTS gas_fpn;
+DROP TABLE IF EXISTS gas_boal;
+DROP TABLE IF EXISTS gas_bod;
+
+CREATE TABLE gas_fpn (
+        "unit" TEXT,
+        local_datetime INTEGER,
+        "recordType" TEXT,
+        "bMUnitType" TEXT,
+        "leadPartyName" TEXT,
+        "ngcBMUnitName" TEXT,
+        "settlementDate" TEXT,
+        "settlementPeriod" TEXT,
+        "timeFrom" INTEGER,
+        "levelFrom" REAL,
+        "timeTo" INTEGER,
+        "levelTo" REAL,
+        "activeFlag" TEXT,
+        "Fuel Type" TEXT,
+
+    PRIMARY KEY("unit", "timeFrom", "timeTo")
+);
+
+CREATE TABLE gas_boal (
+    "unit" TEXT,
+    local_datetime INTEGER,
+    "recordType" TEXT,
+    "bMUnitType" TEXT,
+    "leadPartyName" TEXT,
+    "ngcBMUnitName" TEXT,
+    "settlementDate" TEXT,
+    "settlementPeriod" TEXT,
+    "timeFrom" INTEGER,
+    "timeTo" INTEGER,
+    "activeFlag" TEXT,
+    "Accept ID" TEXT,
+    "Accept Time" TEXT,
+    "deemedBidOfferFlag" TEXT,
+    "soFlag" TEXT,
+    "storProviderFlag" TEXT,
+    "rrInstructionFlag" TEXT,
+    "rrScheduleFlag" TEXT,
+    "levelFrom" REAL,
+    "levelTo" REAL,
+    "Fuel Type" TEXT,
+
+    PRIMARY KEY("unit", "timeFrom", "timeTo", "Accept ID")
+);
+
+CREATE TABLE gas_bod (
+        "bmUnitID" TEXT,
+        local_datetime INTEGER,
+        "recordType" TEXT,
+        "bMUnitType" TEXT,
+        "leadPartyName" TEXT,
+        "ngcBMUnitName" TEXT,
+        "settlementDate" TEXT,
+        "settlementPeriod" TEXT,
+        "bidOfferPairNumber" REAL,
+        "timeFrom" INTEGER,
+        "bidOfferLevelFrom" REAL,
+        "timeTo" INTEGER,
+        "bidOfferLevelTo" REAL,
+        "bidPrice" REAL,
+        "offerPrice" REAL,
+        "activeFlag" TEXT,
+
+    PRIMARY KEY("bmUnitID", "timeFrom", "timeTo","bidOfferPairNumber")
+);
+
+CREATE INDEX ix_gas_fpn_local_datetime ON gas_fpn (local_datetime);
+CREATE INDEX ix_gas_boal_local_datetime ON gas_boal (local_datetime);
+CREATE INDEX ix_gas_bod_local_datetime ON gas_bod (local_datetime);
@@ -0,0 +1,28 @@
+--Raw Elexon API responses, see lib/data/response_cache.py. Every response is
+--keyed by its dataset, the settlement date and period it starts at, the number
+--of periods it covers and its unit ("all" for calls of all units), and points to
+--its zlib compressed body by the SHA-256 of the body. "expires_at" is NULL for
+--settled periods, which do not change any more. Times are in seconds since the
+--epoch (UTC).
+
+CREATE TABLE IF NOT EXISTS responses (
+    "key" TEXT PRIMARY KEY,
+    "dataset" TEXT,
+    "settlement_date" TEXT,
+    "settlement_period" INTEGER,
+    "n_periods" INTEGER,
+    "unit" TEXT,
+    "digest" TEXT,
+    "fetched_at" REAL,
+    "expires_at" REAL,
+    "last_used" REAL
+);
+
+CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses ("last_used");
+CREATE INDEX IF NOT EXISTS ix_responses_digest ON responses ("digest");
+
+CREATE TABLE IF NOT EXISTS response_bodies (
+    "digest" TEXT PRIMARY KEY,
+    "body" BLOB,
+    "size" INTEGER
+);
@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from lib.db_utils import DbRepository, drop_and_initialize_bod_table, drop_and_initialize_tables
+
+
+@pytest.fixture(scope="session")
+def test_data():
+    df_fpn = pd.read_parquet("tests/test_data/fpn.parquet")
+    df_boal = pd.read_parquet("tests/test_data/boal.parquet")
+    df_bod = pd.read_parquet("tests/test_data/bod.parquet")
+
+    return df_fpn, df_boal, df_bod
+
+
+@pytest.fixture(scope="session")
+def db(tmp_path_factory, test_data) -> DbRepository:
+    """SQLite DB loaded with the parquet test data, 2022-01-01 to 2022-01-03"""
+    df_fpn, df_boal, df_bod = test_data
+
+    db_path = str(tmp_path_factory.mktemp("db") / "phys_data.db")
+    drop_and_initialize_tables(db_path)
+    drop_and_initialize_bod_table(db_path)
+
+    engine = create_engine(f"sqlite:///{db_path}", echo=False)
+    with engine.connect() as connection:
+        df_fpn.to_sql("fpn", connection, if_exists="append", index_label="unit")
+        df_boal.to_sql("boal", connection, if_exists="append", index_label="unit")
+        df_bod.drop(columns=["Fuel Type"]).to_sql("bod", connection, if_exists="append", index_label="bmUnitID")
+
+    return DbRepository(db_path)
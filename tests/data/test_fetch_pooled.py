@@ -0,0 +1,145 @@
+import json
+import threading
+from urllib.parse import parse_qsl, urlparse
+
+import pandas as pd
+import pytest
+import requests
+
+from lib.data import fetch_pooled
+from lib.data.fetch_pooled import fetch_all
+from lib.data.fetch_boa_data import fetch_physical_data
+from lib.data.fetch_bod_data import fetch_bod_data
+from lib.settlement_periods import SETTLEMENT_PERIOD
+
+UNITS = ["T_A-1", "T_B-1"]
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, data):
+        self.content = json.dumps({"data": data}).encode()
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        pass
+
+
+def fake_get(url, **kwargs):
+    """A few rows per unit in the layout of the PN, BOALF and BOD endpoints"""
+    query = dict(parse_qsl(urlparse(url).query))
+    units = [query["bmUnit"]] if "bmUnit" in query else UNITS
+
+    rows = []
+    for unit in units:
+        row = {"bmUnit": unit, "nationalGridBmUnit": unit[2:], "levelFrom": 10, "levelTo": 20}
+        if query.get("dataset") == "PN":
+            time_from = pd.Timestamp(query["settlementDate"]) + (int(query["settlementPeriod"]) - 1) * SETTLEMENT_PERIOD
+            row |= {"dataset": "PN", "settlementDate": query["settlementDate"]}
+            row |= {"settlementPeriod": int(query["settlementPeriod"])}
+        elif "BOALF" in url:
+            time_from = pd.Timestamp(query["from"]) + pd.Timedelta("40min")
+            row |= {"dataset": "BOALF", "acceptanceNumber": 1, "settlementPeriodFrom": 1, "settlementPeriodTo": 2}
+            row |= {"amendmentFlag": "ORI", "storFlag": False, "deemedBoFlag": False, "rrFlag": False, "soFlag": True}
+        else:
+            time_from = pd.Timestamp(query["from"])
+            row |= {"dataset": "BOD", "pairId": 1, "offer": 80.0, "bid": 30.0}
+        time_to = time_from + pd.Timedelta("30min")
+        row |= {"timeFrom": f"{time_from.isoformat()}Z", "timeTo": f"{time_to.isoformat()}Z"}
+        rows.append(row)
+
+    return FakeResponse(rows)
+
+
+class FakeSession:
+    def __init__(self):
+        self.urls = []
+        self.threads = set()
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        self.threads.add(threading.get_ident())
+        return fake_get(url)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(requests, "get", fake_get)
+    monkeypatch.setattr(fetch_pooled, "make_session", lambda pool_size: session)
+    return session
+
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def test_fetch_all(fake_api):
+    urls = [f"https://example.com/BOD?from=2022-01-01 00:{minute:02d}&bmUnit=T_A-1" for minute in range(30)]
+
+    dfs = fetch_all(urls, concurrency=8)
+
+    assert sorted(fake_api.urls) == sorted(urls)
+    assert len(fake_api.threads) > 1
+    assert [df["timeFrom"].iloc[0] for df in dfs] == [f"2022-01-01T00:{minute:02d}:00Z" for minute in range(30)]
+
+
+
+def test_fetch_all_session_per_thread(monkeypatch):
+    sessions = []
+
+    def make_session(pool_size):
+        sessions.append(FakeSession())
+        return sessions[-1]
+
+    monkeypatch.setattr(fetch_pooled, "make_session", make_session)
+    urls = [f"https://example.com/BOD?from=2022-01-01 00:{minute:02d}&bmUnit=T_A-1" for minute in range(30)]
+
+    fetch_all(urls, concurrency=4)
+
+    # sessions are not thread safe, so none is shared between threads
+    assert 0 < len(sessions) <= 4
+    assert all(len(session.threads) == 1 for session in sessions)
+    assert sum(len(session.urls) for session in sessions) == len(urls)
+
+@pytest.mark.parametrize("pull_data_once", [False, True])
+def test_fetch_physical_data_pooled(fake_api, tmp_path, pull_data_once):
+    kwargs = dict(save_dir=tmp_path, cache=False, unit_ids=UNITS, pull_data_once=pull_data_once)
+
+    df_threads = fetch_physical_data("2022-01-01 00:00", "2022-01-01 02:00", **kwargs)
+    df_pooled = fetch_physical_data("2022-01-01 00:00", "2022-01-01 02:00", fetch_engine="pooled", **kwargs)
+
+    # per unit (or all units), 5 PN calls and 3 hour long BOALF windows
+    assert len(fake_api.urls) == (1 if pull_data_once else len(UNITS)) * (5 + 3)
+    pd.testing.assert_frame_equal(_sorted(df_pooled), _sorted(df_threads))
+
+
+def test_fetch_bod_data_pooled(fake_api, tmp_path):
+    kwargs = dict(save_dir=tmp_path, cache=False, unit_ids=UNITS)
+
+    df_threads = fetch_bod_data("2022-01-01 00:00", "2022-01-01 02:00", **kwargs)
+    df_pooled = fetch_bod_data("2022-01-01 00:00", "2022-01-01 02:00", fetch_engine="pooled", **kwargs)
+
+    assert len(fake_api.urls) == len(UNITS) * 5
+    pd.testing.assert_frame_equal(_sorted(df_pooled), _sorted(df_threads))
+
+
+def test_fetch_physical_data_cache(fake_api, tmp_path):
+    kwargs = dict(save_dir=tmp_path, unit_ids=UNITS, pull_data_once=False)
+
+    df = fetch_physical_data("2022-01-01 00:00", "2022-01-01 02:00", fetch_engine="pooled", **kwargs)
+    n_calls = len(fake_api.urls)
+
+    # other chunks, and other engines, reuse the settlement periods fetched before
+    df_cached = fetch_physical_data("2022-01-01 00:00", "2022-01-01 02:00", **kwargs)
+    df_chunk = fetch_physical_data("2022-01-01 01:00", "2022-01-01 02:00", fetch_engine="pooled", **kwargs)
+
+    assert len(fake_api.urls) == n_calls
+    pd.testing.assert_frame_equal(_sorted(df_cached), _sorted(df))
+    assert len(df_chunk) > 0
@@ -0,0 +1,157 @@
+import json
+from urllib.parse import parse_qsl, urlparse
+
+import pandas as pd
+import pytest
+import requests
+
+from lib.data import fetch_pooled, fetch_stream
+from lib.data.fetch_boa_data import fetch_physical_data
+from lib.data.fetch_bod_data import fetch_bod_data
+from lib.data.fetch_stream import StreamPages
+from lib.settlement_periods import SETTLEMENT_PERIOD
+
+UNITS = ["T_A-1", "T_B-1"]
+CHUNKS = [("2024-01-10 00:00:00", "2024-01-11 00:00:00"), ("2024-01-11 00:00:00", "2024-01-11 06:00:00")]
+
+
+def _iso(time: pd.Timestamp) -> str:
+    return f"{time.isoformat()}Z"
+
+
+def _make_rows() -> dict:
+    """(timeFrom, timeTo, row) of every PN, BOALF and BOD of the fake API, from 2024-01-09 to 2024-01-13"""
+
+    rows = {"PN": [], "BOALF": [], "BOD": []}
+    for unit in UNITS:
+        for i, time_from in enumerate(pd.date_range("2024-01-09", "2024-01-13", freq="30min", inclusive="left")):
+            row = {"bmUnit": unit, "nationalGridBmUnit": unit[2:], "levelFrom": i % 7, "levelTo": i % 5}
+            period = time_from.hour * 2 + time_from.minute // 30 + 1
+            time_to = time_from + SETTLEMENT_PERIOD
+
+            pn = row | {"dataset": "PN", "settlementDate": str(time_from.date()), "settlementPeriod": period}
+            rows["PN"].append((time_from, time_to, pn | {"timeFrom": _iso(time_from), "timeTo": _iso(time_to)}))
+
+            bod = row | {"dataset": "BOD", "pairId": 1, "offer": 80.0 + i, "bid": 30.0}
+            rows["BOD"].append((time_from, time_to, bod | {"timeFrom": _iso(time_from), "timeTo": _iso(time_to)}))
+
+            # a 45 minute BOA every 2 hours, crossing the boundaries of the BOALF windows
+            if i % 4 == 1:
+                boa_from, boa_to = time_from + pd.Timedelta("10min"), time_from + pd.Timedelta("55min")
+                boalf = row | {"dataset": "BOALF", "acceptanceNumber": i, "settlementPeriodFrom": period}
+                boalf |= {"settlementPeriodTo": period + 1, "amendmentFlag": "ORI", "storFlag": False}
+                boalf |= {"deemedBoFlag": False, "rrFlag": False, "soFlag": True}
+                rows["BOALF"].append((boa_from, boa_to, boalf | {"timeFrom": _iso(boa_from), "timeTo": _iso(boa_to)}))
+
+    return rows
+
+
+ROWS = _make_rows()
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self.content = json.dumps(payload).encode()
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        pass
+
+
+def fake_get(url, **kwargs):
+    """The rows of the per settlement period and stream endpoints, as the API selects them"""
+    path = urlparse(url).path
+    query = dict(parse_qsl(urlparse(url).query))
+
+    def time(key):
+        time = pd.Timestamp(query[key])
+        return time if time.tzinfo is None else time.tz_convert(None)
+
+    if path.endswith("/stream"):
+        dataset = path.split("/")[-2]
+        data = [row for time_from, _, row in ROWS[dataset] if time("from") <= time_from < time("to")]
+        return FakeResponse(data)
+
+    if query.get("dataset") == "PN":
+        date, period = query["settlementDate"], int(query["settlementPeriod"])
+        data = [row for _, _, row in ROWS["PN"] if (row["settlementDate"], row["settlementPeriod"]) == (date, period)]
+    elif path.endswith("BOALF"):
+        data = [row for time_from, time_to, row in ROWS["BOALF"] if time_to >= time("from") and time_from <= time("to")]
+    else:
+        data = [row for time_from, time_to, row in ROWS["BOD"] if time_from <= time("from") < time_to]
+
+    return FakeResponse({"data": [row for row in data if row["bmUnit"] == query.get("bmUnit", row["bmUnit"])]})
+
+
+class FakeSession:
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return fake_get(url)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(requests, "get", fake_get)
+    monkeypatch.setattr(fetch_pooled, "make_session", lambda pool_size: session)
+    monkeypatch.setattr(fetch_stream, "_stream_pages", StreamPages())
+    return session
+
+
+def _stream_calls(session: FakeSession) -> int:
+    return sum("/stream" in url for url in session.urls)
+
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.drop_duplicates()
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def test_fetch_physical_data_stream(fake_api, tmp_path):
+    kwargs = dict(save_dir=tmp_path, cache=False, unit_ids=UNITS[:1], pull_data_once=True)
+
+    for start, end in CHUNKS:
+        df_pooled = fetch_physical_data(start, end, fetch_engine="pooled", **kwargs)
+        df_stream = fetch_physical_data(start, end, fetch_engine="stream", **kwargs)
+
+        assert len(df_stream) > 0
+        pd.testing.assert_frame_equal(_sorted(df_stream), _sorted(df_pooled))
+
+    # the PN and BOALF pages of the 9th, 10th and 11th, kept for the second chunk
+    assert _stream_calls(fake_api) == 2 * 3
+
+
+def test_fetch_bod_data_stream(fake_api, tmp_path):
+    kwargs = dict(save_dir=tmp_path, cache=False, unit_ids=UNITS, pull_data_once=True)
+
+    for start, end in CHUNKS:
+        df_pooled = fetch_bod_data(start, end, fetch_engine="pooled", **kwargs)
+        df_stream = fetch_bod_data(start, end, fetch_engine="stream", **kwargs)
+
+        assert len(df_stream) > 0
+        pd.testing.assert_frame_equal(_sorted(df_stream), _sorted(df_pooled))
+
+    assert _stream_calls(fake_api) == 3
+
+
+def test_recent_pages_are_not_kept(fake_api):
+    pages = StreamPages(now=lambda: pd.Timestamp("2024-01-11 00:30", tz="UTC"))
+
+    pages.rows("BOD", "2024-01-10 12:00", "2024-01-10 23:00")
+    pages.rows("BOD", "2024-01-10 12:00", "2024-01-10 23:00")
+    assert _stream_calls(fake_api) == 2
+
+    pages._now = lambda: pd.Timestamp("2024-01-11 01:00", tz="UTC")
+    pages.rows("BOD", "2024-01-10 12:00", "2024-01-10 23:00")
+    pages.rows("BOD", "2024-01-10 12:00", "2024-01-10 23:00")
+    assert _stream_calls(fake_api) == 3
@@ -0,0 +1,110 @@
+import pytest
+import requests
+
+from lib.data.rate_limit import RateLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeSession:
+    """Responds with `status_codes` in turn, then 200"""
+
+    def __init__(self, status_codes, clock, latency_s=0.1, headers=None):
+        self.status_codes = list(status_codes)
+        self.clock = clock
+        self.latency_s = latency_s
+        self.headers = headers or {}
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        self.clock.now += self.latency_s
+
+        status_code = self.status_codes.pop(0) if self.status_codes else 200
+        if status_code is None:
+            raise requests.ConnectionError("connection dropped")
+
+        response = requests.Response()
+        response.status_code = status_code
+        response.url = url
+        response.headers.update(self.headers)
+        response._content = b'{"data": []}'
+        return response
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def limiter(clock, **kwargs) -> RateLimiter:
+    return RateLimiter(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(rate=10, burst=2, clock=clock, sleep=clock.sleep)
+
+    for _ in range(5):
+        bucket.take()
+
+    # the burst goes straight away, then one call every 0.1s
+    assert clock.sleeps == pytest.approx([0.1, 0.1, 0.1])
+
+
+def test_retry_throttled(clock):
+    rate_limiter = limiter(clock, rate=20, concurrency=16)
+    session = FakeSession([429, 503, None], clock, headers={"Retry-After": "2"})
+
+    response = rate_limiter.get("https://example.com", session=session)
+
+    assert response.status_code == 200
+    assert session.calls == 4
+    assert rate_limiter.retries == 3
+    # waits at least the Retry-After of the throttled and unavailable calls, and jitters the dropped connection
+    assert min(clock.sleeps[:2]) >= 2
+    assert len(clock.sleeps) == 3
+    assert rate_limiter.concurrency < 16 / 4
+    assert rate_limiter.bucket.rate < 20
+
+
+def test_retry_gives_up(clock):
+    session = FakeSession([500] * 10, clock)
+
+    with pytest.raises(requests.HTTPError):
+        limiter(clock, max_retries=3).get("https://example.com", session=session)
+    assert session.calls == 4
+
+
+def test_client_errors_are_not_retried(clock):
+    session = FakeSession([404], clock)
+
+    with pytest.raises(requests.HTTPError):
+        limiter(clock).get("https://example.com", session=session)
+    assert session.calls == 1
+
+
+def test_adaptive_concurrency(clock):
+    rate_limiter = limiter(clock, concurrency=4, max_concurrency=8)
+
+    # fast calls grow concurrency up to its maximum
+    session = FakeSession([], clock, latency_s=0.1)
+    for _ in range(100):
+        rate_limiter.get("https://example.com", session=session)
+    assert rate_limiter.concurrency == 8
+
+    # calls much slower than usual shrink it
+    session.latency_s = 1.0
+    rate_limiter.get("https://example.com", session=session)
+    assert rate_limiter.concurrency == pytest.approx(8 * 0.9)
+    assert rate_limiter.snapshot()["calls"] == 101
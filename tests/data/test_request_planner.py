@@ -0,0 +1,37 @@
+import pandas as pd
+
+from lib.data.request_planner import boalf_urls, boalf_windows, fetch_per_unit, plan_requests
+
+
+def test_boalf_windows():
+    windows = boalf_windows("2024-04-11 04:00", "2024-04-11 05:30")
+
+    # 30 minutes either side, in hour long windows that do not overlap
+    assert windows == [
+        (pd.Timestamp("2024-04-11 03:30"), pd.Timestamp("2024-04-11 04:30")),
+        (pd.Timestamp("2024-04-11 04:30"), pd.Timestamp("2024-04-11 05:30")),
+        (pd.Timestamp("2024-04-11 05:30"), pd.Timestamp("2024-04-11 06:00")),
+    ]
+    assert boalf_urls("2024-04-11 04:00", "2024-04-11 05:30", unit="T_A-1")[0] == (
+        "https://data.elexon.co.uk/bmrs/api/v1/datasets/BOALF"
+        "?from=2024-04-11 03:30:00&to=2024-04-11 04:30:00&bmUnit=T_A-1&format=json"
+    )
+
+
+def test_fetch_per_unit():
+    assert fetch_per_unit(["T_A-1"], ["PN", "BOALF"])
+    assert not fetch_per_unit([f"T_{i}" for i in range(400)], ["PN", "BOALF"])
+    assert not fetch_per_unit(None, ["BOD"])
+
+    # forced either way
+    assert not fetch_per_unit(["T_A-1"], ["BOD"], pull_data_once=True)
+    assert fetch_per_unit([f"T_{i}" for i in range(400)], ["BOD"], pull_data_once=False)
+
+
+def test_plan_requests():
+    plan = plan_requests("2024-04-11 04:00", "2024-04-11 05:00", ["PN", "BOALF", "BOD"], unit_ids=["T_A-1", "T_B-1"])
+
+    assert plan.per_unit
+    assert {dataset: len(urls) for dataset, urls in plan.urls.items()} == {"PN": 6, "BOALF": 4, "BOD": 6}
+    assert plan.n_calls == 16
+    assert all("bmUnit=T_B-1" in url for url in plan.urls["PN"][3:])
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from lib.data import response_cache
+from lib.data.fetch_stream import stream_url
+from lib.data.request_planner import boalf_urls, bod_urls, pn_urls
+from lib.data.response_cache import RECENT_TTL, ResponseCache, ResponseKey, response_key
+
+
+class FakeClock:
+    def __init__(self, now: str):
+        self.now = pd.Timestamp(now, tz="UTC").timestamp()
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize(
+    "url, key",
+    [
+        (pn_urls("2024-01-10 00:00", "2024-01-10 00:30", "T_A-1")[1], ResponseKey("PN", "2024-01-10", 1, 1, "T_A-1")),
+        (boalf_urls("2024-01-10 00:00", "2024-01-10 01:00")[0], ResponseKey("BOALF", "2024-01-09", 48, 2)),
+        (bod_urls("2024-01-10 00:30", "2024-01-10 00:30")[0], ResponseKey("BOD", "2024-01-10", 2, 0)),
+        # 00:00 UTC is 01:00 in summer, settlement period 3
+        (
+            stream_url("PN", pd.Timestamp("2024-06-10", tz="UTC"), pd.Timestamp("2024-06-11", tz="UTC")),
+            ResponseKey("PN-stream", "2024-06-10", 3, 48),
+        ),
+        # not on settlement period boundaries, or not PN, BOALF or BOD
+        (boalf_urls("2024-01-10 00:10", "2024-01-10 01:10")[0], None),
+        ("https://data.elexon.co.uk/bmrs/api/v1/balancing/settlement/system-prices/2024-01-10", None),
+    ],
+)
+def test_response_key(url, key):
+    assert response_key(url) == key
+
+
+def test_settled_and_recent_responses(tmp_path):
+    clock = FakeClock("2024-01-10 12:00")
+    cache = ResponseCache(tmp_path / "responses.db", now=clock)
+
+    settled, recent = ResponseKey("PN", "2024-01-08", 1, 1), ResponseKey("PN", "2024-01-10", 20, 1)
+    cache.put(settled, b'{"data": [1]}')
+    cache.put(recent, b'{"data": [2]}')
+    assert cache.get(settled) == b'{"data": [1]}'
+    assert cache.get(recent) == b'{"data": [2]}'
+
+    # recent periods expire, so late data is fetched again, settled ones never do
+    clock.now += RECENT_TTL.total_seconds() + 1
+    assert cache.get(recent) is None
+    clock.now += 365 * 24 * 3600
+    assert cache.get(settled) == b'{"data": [1]}'
+
+
+def test_eviction(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "EVICT_BATCH", 1)
+    clock = FakeClock("2024-01-10 12:00")
+    bodies = {period: f'{{"data": [{period}]}}'.encode() * 100 for period in range(1, 11)}
+
+    cache = ResponseCache(tmp_path / "responses.db", max_bytes=10**9, now=clock)
+    for period, body in bodies.items():
+        clock.now += 1
+        cache.put(ResponseKey("BOD", "2024-01-01", period, 0), body)
+        # identical bodies are stored once
+        cache.put(ResponseKey("BOD", "2024-01-01", period, 0, "T_A-1"), body)
+    body_bytes = cache._bytes
+    assert body_bytes < 10 * len(bodies[1])
+
+    # with room for about half of the bodies, the least recently used go
+    cache.max_bytes = body_bytes // 2
+    clock.now += 1
+    assert cache.get(ResponseKey("BOD", "2024-01-01", 1, 0)) is not None
+    cache.put(ResponseKey("BOD", "2024-01-01", 11, 0), b'{"data": []}')
+
+    assert cache._bytes <= cache.max_bytes
+    assert cache.get(ResponseKey("BOD", "2024-01-01", 1, 0)) == bodies[1]
+    assert cache.get(ResponseKey("BOD", "2024-01-01", 2, 0)) is None
+    assert cache.get(ResponseKey("BOD", "2024-01-01", 10, 0, "T_A-1")) == bodies[10]
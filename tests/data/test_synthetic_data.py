@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+from lib.curtailment import analyze_curtailment
+from lib.data.fetch_boa_data import process_physical_data
+from lib.data.synthetic import (
+    BOD_COLUMNS,
+    PHYSICAL_DATA_COLUMNS,
+    generate_bod_data,
+    generate_physical_data,
+    load_synthetic_data,
+    wind_units,
+)
+from lib.db_utils import DbRepository, drop_and_initialize_bod_table, drop_and_initialize_tables
+
+
+def test_generate_physical_data_clock_changes():
+    # the clocks go forward on 2022-03-27 and back on 2022-10-30
+    df = generate_physical_data("2022-03-26", "2022-11-01", n_units=2, missing_fpn_fraction=0)
+    df_pn = df[df["recordType"] == "PN"]
+
+    assert list(df.columns) == PHYSICAL_DATA_COLUMNS
+    for day, n_periods in [("2022-03-27", 46), ("2022-10-30", 50)]:
+        periods = df_pn.loc[df_pn["settlementDate"] == day, "settlementPeriod"]
+        assert sorted(periods.unique()) == list(range(1, n_periods + 1))
+        assert not df_pn.duplicated(["bmUnitID", "settlementDate", "settlementPeriod"]).any()
+
+
+def test_generate_physical_data_boalf():
+    df = generate_physical_data("2022-01-01", "2022-01-02", n_units=3, acceptances_per_day=100, seed=1)
+    df_boalf = df[df["recordType"] == "BOALF"]
+
+    # acceptances overlap, and segments spanning settlement periods are reported more than once
+    assert len(df_boalf[["bmUnitID", "Accept ID"]].drop_duplicates()) > 250
+    assert df_boalf.duplicated(["bmUnitID", "timeFrom", "timeTo", "Accept ID"]).any()
+    time_from = pd.to_datetime(df_boalf["timeFrom"])
+    assert (pd.to_datetime(df_boalf["timeTo"]) > time_from).all()
+    assert (pd.to_datetime(df_boalf["acceptanceTime"]) < time_from).all()
+
+    df_fpn, df_boal = process_physical_data(df)
+    assert not df_boal.assign(unit=df_boal.index).duplicated(["unit", "timeFrom", "timeTo", "Accept ID"]).any()
+    assert set(df_fpn.index) == set(wind_units(3))
+
+
+def test_generate_physical_data_missing_fpns():
+    df = generate_physical_data("2022-01-01", "2022-01-08", n_units=4, missing_fpn_fraction=0.1)
+    n_pn = (df["recordType"] == "PN").sum()
+
+    assert 0.85 * 4 * 7 * 48 < n_pn < 0.95 * 4 * 7 * 48
+
+
+def test_generate_bod_data():
+    df = generate_bod_data("2022-01-01", "2022-01-02", n_units=2, n_bid_pairs=2)
+
+    assert list(df.columns) == BOD_COLUMNS
+    assert len(df) == 2 * 48 * 4
+    bids = df[df["bidOfferPairNumber"] < 0].set_index(["bmUnitID", "timeFrom", "bidOfferPairNumber"])["bidPrice"]
+    assert (bids.xs(-2, level=2) < bids.xs(-1, level=2)).all()
+
+
+def test_load_synthetic_data(tmp_path):
+    db_path = str(tmp_path / "synthetic.db")
+    drop_and_initialize_tables(db_path)
+    drop_and_initialize_bod_table(db_path)
+
+    load_synthetic_data(create_engine(f"sqlite:///{db_path}"), "2022-10-29", "2022-10-31", n_units=3)
+
+    df = analyze_curtailment(DbRepository(db_path), "2022-10-29", "2022-10-31")
+    df_exact = analyze_curtailment(DbRepository(db_path), "2022-10-29", "2022-10-31", engine="exact")
+
+    # 48 hours, across the clocks going back
+    assert len(df) == 96
+    assert df["Time"].is_unique
+    assert df["energy_mwh"].sum() > 0
+    np.testing.assert_allclose(df_exact["energy_mwh"].sum(), df["energy_mwh"].sum(), rtol=0.1)
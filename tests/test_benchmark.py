@@ -0,0 +1,58 @@
+import pandas as pd
+
+from lib.benchmark import (
+    BENCHMARK_START,
+    SCALES,
+    Scale,
+    find_regressions,
+    benchmark_end,
+    load_benchmark_db,
+    load_results,
+    run_benchmarks,
+    save_results,
+)
+
+
+def test_load_benchmark_db(tmp_path):
+    scale = Scale("test", units=3, days=2, acceptances=4)
+    db = load_benchmark_db(str(tmp_path / "benchmark.db"), scale)
+    df_fpn, df_boal, df_bod = db.get_data_for_time_range(BENCHMARK_START, benchmark_end(scale))
+
+    assert df_fpn.index.nunique() == 3
+    assert len(df_fpn) == 3 * 2 * 48
+    assert df_boal.groupby(level=0)["Accept ID"].nunique().sum() > 0
+    assert set(df_bod["bidOfferPairNumber"]) == {-1.0, 1.0}
+    assert (df_boal["timeFrom"] <= df_boal["timeTo"]).all()
+
+
+def test_run_benchmarks(tmp_path):
+    benchmarks = ["linearize_physical_data", "analyze_curtailment[exact]"]
+    df = run_benchmarks([SCALES["small"]], benchmarks=benchmarks, repeat=1)
+
+    assert list(df["benchmark"]) == benchmarks
+    assert (df["wall_s"] > 0).all()
+    assert (df["peak_mb"] > 0).all()
+
+    save_results(df, tmp_path / "results.json")
+    df_loaded = load_results(tmp_path / "results.json")
+    pd.testing.assert_frame_equal(df_loaded[["benchmark", "scale"]], df[["benchmark", "scale"]])
+
+
+def test_find_regressions():
+    df_baseline = pd.DataFrame(
+        [
+            ["a", "small", 5, 1, 2, 1.0, 100.0],
+            ["b", "small", 5, 1, 2, 1.0, 100.0],
+            ["c", "small", 5, 1, 2, 1.0, 100.0],
+            ["d", "small", 5, 1, 2, 0.01, 0.1],
+        ],
+        columns=["benchmark", "scale", "units", "days", "acceptances", "wall_s", "peak_mb"],
+    )
+    df = df_baseline.copy()
+    df["wall_s"] = [2.0, 1.1, 1.0, 0.04]
+    df["peak_mb"] = [100.0, 100.0, 200.0, 0.5]
+
+    # "d" is slower and larger, but by less than the noise
+    df_regressions = find_regressions(df, df_baseline)
+    assert list(df_regressions["benchmark"]) == ["a", "c"]
+    assert list(df_regressions["wall_ratio"]) == [2.0, 1.0]
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+from lib.bid_prices import BidPriceIndex
+
+
+def make_bod(rows):
+    return pd.DataFrame(
+        rows, columns=["bmUnitID", "timeFrom", "bidOfferPairNumber", "bidPrice", "offerPrice"]
+    ).set_index("bmUnitID")
+
+
+def test_bid_price_index_as_of_lookup():
+    df_bod = make_bod(
+        [
+            ["A", pd.Timestamp("2022-01-01 00:00"), -1, -50.0, 10.0],
+            ["A", pd.Timestamp("2022-01-01 01:00"), -1, -60.0, 20.0],
+            ["A", pd.Timestamp("2022-01-01 00:00"), 1, 30.0, 40.0],
+            ["B", pd.Timestamp("2022-01-01 00:30"), -1, -70.0, 50.0],
+        ]
+    )
+    index = BidPriceIndex(df_bod)
+
+    units = ["A", "A", "A", "B", "B", "C"]
+    times = pd.to_datetime(
+        [
+            "2021-12-31 23:59",
+            "2022-01-01 00:59",
+            "2022-01-01 01:00",
+            "2022-01-01 00:00",
+            "2022-01-02 00:00",
+            "2022-01-01 01:00",
+        ]
+    )
+
+    np.testing.assert_array_equal(
+        index.lookup(units, times, pair=-1), [np.nan, -50.0, -60.0, np.nan, -70.0, np.nan]
+    )
+    np.testing.assert_array_equal(
+        index.lookup_offer(units, times, pair=1), [np.nan, 40.0, 40.0, np.nan, np.nan, np.nan]
+    )
+    assert np.isnan(index.lookup(units, times, pair=-2)).all()
+
+
+def test_bid_price_index_duplicated_times():
+    """The last BOD row wins, as with the forward fill it replaces"""
+    df_bod = make_bod(
+        [
+            ["A", pd.Timestamp("2022-01-01 00:00"), -1, -50.0, 10.0],
+            ["A", pd.Timestamp("2022-01-01 00:00"), -1, -55.0, 10.0],
+        ]
+    )
+    index = BidPriceIndex(df_bod)
+
+    prices = index.lookup(None, pd.to_datetime(["2022-01-01 00:00", "2022-01-01 02:00"]))
+    np.testing.assert_array_equal(prices, [-55.0, -55.0])
+
+
+def test_bid_price_index_epoch_seconds(test_data):
+    _, _, df_bod = test_data
+    index = BidPriceIndex(df_bod)
+
+    units = df_bod.index.to_numpy()
+    times = pd.DatetimeIndex(df_bod["timeFrom"])
+    np.testing.assert_array_equal(
+        index.lookup(units, times, pair=-1), index.lookup(units, (times - pd.Timestamp(0)) // pd.Timedelta(seconds=1), pair=-1)
+    )
+
+
+def test_bid_price_index_empty():
+    index = BidPriceIndex(make_bod([]))
+
+    assert np.isnan(index.lookup(["A"], pd.to_datetime(["2022-01-01 00:00"]))).all()
+
+
+def test_bid_price_index_ladder():
+    df_bod = pd.DataFrame(
+        [
+            ["A", pd.Timestamp("2022-01-01 00:00"), pd.Timestamp("2022-01-01 00:30"), -1, -10.0, -10.0, -50.0],
+            ["A", pd.Timestamp("2022-01-01 00:00"), pd.Timestamp("2022-01-01 00:30"), -2, -20.0, -40.0, -80.0],
+            ["A", pd.Timestamp("2022-01-01 00:00"), pd.Timestamp("2022-01-01 00:30"), 1, 10.0, 10.0, 60.0],
+        ],
+        columns=[
+            "bmUnitID",
+            "timeFrom",
+            "timeTo",
+            "bidOfferPairNumber",
+            "bidOfferLevelFrom",
+            "bidOfferLevelTo",
+            "bidPrice",
+        ],
+    ).set_index("bmUnitID")
+    index = BidPriceIndex(df_bod)
+
+    units = ["A"] * 5
+    times = pd.to_datetime(["2022-01-01 00:00"] * 4 + ["2022-01-01 00:15"])
+    volumes = [0.0, 5.0, 20.0, 50.0, 40.0]
+
+    # 10 MW at -50, then the rest at -80, with pair -2 ramping to 40 MW
+    expected = [-50.0, -50.0, (10 * -50 + 10 * -80) / 20, (10 * -50 + 40 * -80) / 50, (10 * -50 + 30 * -80) / 40]
+    np.testing.assert_allclose(index.lookup_bid_ladder(units, times, volumes), expected)
+    np.testing.assert_array_equal(index.lookup_for_costing(units, times, volumes, costing="pair"), [-50.0] * 5)
+    assert np.isnan(index.lookup_bid_ladder(["B"], times[:1], [10.0])).all()
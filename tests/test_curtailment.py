@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from lib.curtailment import (
+    _batch_units,
+    analyze_curtailment,
+    analyze_curtailment_in_windows,
+    linearize_physical_data,
+    resolve_applied_bid_offer_level,
+    resolve_applied_bid_offer_levels_all_units,
+)
+from lib.data.synthetic import load_synthetic_data
+from lib.db_utils import DbRepository, drop_and_initialize_bod_table, drop_and_initialize_tables
+
+
+def test_resolve_applied_bid_offer_levels_all_units(test_data):
+    _, df_boal, _ = test_data
+
+    df_resolved = resolve_applied_bid_offer_levels_all_units(df_boal)
+
+    assert set(df_resolved["Unit"]) == set(df_boal.index)
+    for unit in df_boal.index.unique()[:5]:
+        expected = resolve_applied_bid_offer_level(linearize_physical_data(df_boal.loc[unit]))
+        resolved = df_resolved[df_resolved["Unit"] == unit].set_index("Time")
+
+        assert resolved.index.equals(expected.index)
+        np.testing.assert_array_equal(resolved["Level"].values, expected["Level"].values)
+        np.testing.assert_array_equal(resolved["Accept ID"].values, expected["Accept ID"].values)
+
+
+def test_resolve_applied_bid_offer_levels_all_units_overlapping():
+    df_boal = pd.DataFrame(
+        {
+            "timeFrom": pd.to_datetime(["2022-01-01 00:00", "2022-01-01 00:02", "2022-01-01 00:01"]),
+            "timeTo": pd.to_datetime(["2022-01-01 00:02", "2022-01-01 00:05", "2022-01-01 00:03"]),
+            "levelFrom": [10.0, 5.0, 7.0],
+            "levelTo": [5.0, 5.0, 7.0],
+            "Accept ID": ["1", "1", "2"],
+        },
+        index=pd.Index(["T_A", "T_A", "T_B"], name="unit"),
+    )
+
+    df_resolved = resolve_applied_bid_offer_levels_all_units(df_boal)
+
+    unit_a = df_resolved[df_resolved["Unit"] == "T_A"]
+    assert list(unit_a["Level"]) == [10.0, 10.0, 5.0, 5.0, 5.0, 5.0]
+    assert list(df_resolved[df_resolved["Unit"] == "T_B"]["Level"]) == [7.0, 7.0, 7.0]
+
+
+def test_resolve_applied_bid_offer_levels_all_units_empty(test_data):
+    _, df_boal, _ = test_data
+
+    df_resolved = resolve_applied_bid_offer_levels_all_units(df_boal.iloc[:0])
+
+    assert len(df_resolved) == 0
+    assert list(df_resolved.columns) == ["Unit", "Time", "Level", "Accept ID"]
+
+
+def test_analyze_curtailment(db):
+    df = analyze_curtailment(db, "2022-01-01", "2022-01-02")
+
+    assert len(df) == 48
+    assert df["Time"].iloc[0] == pd.Timestamp("2022-01-01 00:00", tz="Europe/London")
+    assert (df["delta"] >= 0).all()
+    # values from the original per-unit implementation
+    np.testing.assert_allclose(df["delta"].sum(), 131701.6139, rtol=1e-9)
+    np.testing.assert_allclose(df["Level_FPN"].sum(), 679465.2083, rtol=1e-9)
+    np.testing.assert_allclose(df["cost_gbp"].sum(), 4812895.256, rtol=1e-9)
+
+
+def test_analyze_curtailment_energy(db):
+    df = analyze_curtailment(db, "2022-01-01", "2022-01-02")
+
+    # delta is the average MW over each settlement period, so half an hour of it in MWh
+    np.testing.assert_allclose(df["energy_mwh"], df["delta"] * 0.5, rtol=1e-9, atol=1e-9)
+    assert "bidPrice" not in df.columns
+    assert "index" not in df.columns
+
+
+def test_analyze_curtailment_workers(db):
+    df = analyze_curtailment(db, "2022-01-01", "2022-01-02")
+    df_parallel = analyze_curtailment(db, "2022-01-01", "2022-01-02", workers=2)
+
+    pd.testing.assert_frame_equal(df, df_parallel)
+
+
+def test_analyze_curtailment_per_unit(db):
+    df = analyze_curtailment(db, "2022-01-01", "2022-01-02", engine="exact")
+    df_per_unit, matrix = analyze_curtailment(db, "2022-01-01", "2022-01-02", engine="exact", per_unit=True)
+
+    pd.testing.assert_frame_equal(df_per_unit, df)
+
+    assert matrix.delta.shape == (len(matrix.units), 48)
+    assert matrix.delta.dtype == np.float64
+    assert (matrix.times == df["Time"]).all()
+    np.testing.assert_allclose(matrix.national()["delta"].values, df["delta"].values)
+    np.testing.assert_allclose(matrix.national()["cost_gbp"].values, df["cost_gbp"].values)
+
+    table = matrix.to_arrow()
+    assert table.num_rows == (~np.isnan(matrix.delta)).sum()
+    assert table.column_names == ["unit", "time", "delta", "level_fpn", "level_after_boal", "cost_gbp"]
+
+
+def test_analyze_curtailment_compact(db):
+    df_fpn, df_boal, df_bod = db.get_data_for_time_range("2022-01-01", "2022-01-02", compact=True)
+    assert isinstance(df_fpn.index, pd.CategoricalIndex)
+    assert df_fpn["levelFrom"].dtype == np.float32
+    assert "leadPartyName" not in df_bod.columns
+
+    df = analyze_curtailment(db, "2022-01-01", "2022-01-02")
+    df_compact = analyze_curtailment(db, "2022-01-01", "2022-01-02", compact=True, memory_budget_mb=1)
+
+    pd.testing.assert_frame_equal(df, df_compact)
+
+
+def test_batch_units():
+    memory_per_unit = pd.Series([4.0, 4.0, 12.0, 1.0, 1.0], index=["A", "B", "C", "D", "E"])
+
+    assert _batch_units(memory_per_unit, memory_budget=10) == [["A", "B"], ["C"], ["D", "E"]]
+
+
+def test_analyze_curtailment_in_windows(db):
+    df = analyze_curtailment(db, "2022-01-01", "2022-01-02")
+    windows = list(analyze_curtailment_in_windows(db, "2022-01-01", "2022-01-02", window=pd.Timedelta(hours=5)))
+
+    assert len(windows) == 5
+    pd.testing.assert_frame_equal(pd.concat(windows).reset_index(drop=True), df)
+
+
+@pytest.mark.parametrize("engine", ["minute", "exact"])
+def test_analyze_curtailment_in_windows_fpn_gaps(tmp_path, engine):
+    """Gaps in the FPNs that cross the end of a window are interpolated across, like on the whole range"""
+    db_path = str(tmp_path / "synthetic.db")
+    drop_and_initialize_tables(db_path)
+    drop_and_initialize_bod_table(db_path)
+    load_synthetic_data(
+        create_engine(f"sqlite:///{db_path}"), "2022-02-10", "2022-02-12", seed=3, missing_fpn_fraction=0.1
+    )
+    db = DbRepository(db_path)
+
+    df, matrix = analyze_curtailment(db, "2022-02-10", "2022-02-12", engine=engine, per_unit=True)
+    windows = list(analyze_curtailment_in_windows(db, "2022-02-10", "2022-02-12", engine=engine, per_unit=True))
+
+    def by_unit(matrices):
+        df_units = pd.concat([matrix.to_frame().astype({"unit": str}) for matrix in matrices])
+        return df_units.sort_values(["unit", "time"]).reset_index(drop=True)
+
+    # every unit keeps its periods in the gaps
+    pd.testing.assert_frame_equal(by_unit(matrix for _, matrix in windows), by_unit([matrix]), rtol=1e-4)
+    df_windows = pd.concat([df_window for df_window, _ in windows]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(df_windows, df, check_dtype=False, rtol=1e-4)
+
+
+def test_analyze_curtailment_ladder_costing(db):
+    df = analyze_curtailment(db, "2022-01-01", "2022-01-02")
+    df_ladder = analyze_curtailment(db, "2022-01-01", "2022-01-02", costing="ladder")
+
+    # the test data only has bid-offer pair -1
+    pd.testing.assert_frame_equal(df, df_ladder)
+
+    with pytest.raises(ValueError):
+        analyze_curtailment(db, "2022-01-01", "2022-01-02", costing="offers")
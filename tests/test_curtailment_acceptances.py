@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib.curtailment import analyze_curtailment
+from lib.curtailment_acceptances import ACCEPTANCE_COLUMNS
+
+
+@pytest.mark.parametrize("engine", ["minute", "exact"])
+def test_analyze_curtailment_per_acceptance(db, engine):
+    df, df_acceptances = analyze_curtailment(db, "2022-01-01", "2022-01-02", engine=engine, per_acceptance=True)
+
+    assert list(df_acceptances.columns) == ACCEPTANCE_COLUMNS
+    assert not df_acceptances.duplicated(["Unit", "Accept ID"]).any()
+    assert df_acceptances["Accept Time"].notna().all()
+    assert (df_acceptances["time_from"] < df_acceptances["time_to"]).all()
+
+    # all curtailment comes from an acceptance
+    np.testing.assert_allclose(df_acceptances["energy_mwh"].sum(), df["energy_mwh"].sum())
+    np.testing.assert_allclose(df_acceptances["cost_gbp"].sum(), df["cost_gbp"].sum())
+
+
+def test_analyze_curtailment_per_acceptance_workers(db):
+    _, df_acceptances = analyze_curtailment(db, "2022-01-01", "2022-01-02", per_acceptance=True)
+    _, _, df_acceptances_parallel = analyze_curtailment(
+        db, "2022-01-01", "2022-01-02", per_acceptance=True, per_unit=True, workers=2
+    )
+
+    pd.testing.assert_frame_equal(df_acceptances, df_acceptances_parallel)
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from lib import curtailment_cache
+from lib.curtailment import analyze_curtailment, analyze_units_by_minute
+from lib.curtailment_cache import CurtailmentCache, analyze_units_with_cache, fingerprint_inputs
+from lib.curtailment_exact import analyze_units_exact
+from lib.data.synthetic import load_synthetic_data
+from lib.db_utils import DbRepository, drop_and_initialize_bod_table, drop_and_initialize_tables
+
+
+def test_fingerprint_inputs(test_data):
+    df_fpn, df_boal, df_bod = test_data
+
+    df = fingerprint_inputs(df_fpn, df_boal, df_bod)
+    df_shuffled = fingerprint_inputs(df_fpn.sample(frac=1, random_state=0), df_boal, df_bod)
+
+    assert not df.duplicated(["Unit", "Time"]).any()
+    assert set(df["Unit"]) == set(df_fpn.index) | set(df_boal.index) | set(df_bod.index)
+    pd.testing.assert_frame_equal(df, df_shuffled)
+
+
+def test_analyze_units_with_cache(tmp_path, test_data):
+    df_fpn, df_boal, df_bod = test_data
+    cache = CurtailmentCache(str(tmp_path / "cache.db"))
+
+    recomputed_units = []
+
+    def analyze_units(df_fpn, df_boal, df_bod):
+        recomputed_units.append(set(df_fpn.index))
+        return analyze_units_exact(df_fpn, df_boal, df_bod)
+
+    df = analyze_units_with_cache(df_fpn, df_boal, df_bod, cache=cache, engine="exact", analyze_units=analyze_units)
+    pd.testing.assert_frame_equal(df, analyze_units_exact(df_fpn, df_boal, df_bod))
+
+    # nothing has changed, so nothing is recomputed
+    df_cached = analyze_units_with_cache(
+        df_fpn, df_boal, df_bod, cache=cache, engine="exact", analyze_units=analyze_units
+    )
+    assert len(recomputed_units) == 1
+    pd.testing.assert_frame_equal(df_cached, df)
+
+    # a late change to one BOAL only recomputes that unit
+    unit = df_boal.index[0]
+    df_boal_changed = df_boal.copy()
+    df_boal_changed.iloc[0, df_boal.columns.get_loc("levelTo")] += 10
+    df_changed = analyze_units_with_cache(
+        df_fpn, df_boal_changed, df_bod, cache=cache, engine="exact", analyze_units=analyze_units
+    )
+    assert recomputed_units[-1] == {unit}
+    pd.testing.assert_frame_equal(df_changed, analyze_units_exact(df_fpn, df_boal_changed, df_bod))
+
+
+def test_analyze_curtailment_cache(db, tmp_path):
+    cache = CurtailmentCache(str(tmp_path / "cache.db"))
+
+    df = analyze_curtailment(db, "2022-01-01", "2022-01-02", engine="exact")
+    df_cold = analyze_curtailment(db, "2022-01-01", "2022-01-02", engine="exact", cache=cache)
+    df_warm = analyze_curtailment(db, "2022-01-01", "2022-01-02", engine="exact", cache=cache)
+
+    pd.testing.assert_frame_equal(df_cold, df)
+    pd.testing.assert_frame_equal(df_warm, df)
+
+
+def test_analyze_curtailment_cache_hourly_chunks(db, tmp_path):
+    """The periods at the edge of a chunk depend on data outside it, so the next chunk must not reuse them"""
+    cache = CurtailmentCache(str(tmp_path / "cache.db"))
+
+    chunks = pd.date_range("2022-01-01 00:00", "2022-01-01 04:00", freq="1h")
+    for start, end in zip(chunks[:-1], chunks[1:]):
+        df = analyze_curtailment(db, str(start), str(end), engine="minute")
+        df_cached = analyze_curtailment(db, str(start), str(end), engine="minute", cache=cache)
+
+        pd.testing.assert_frame_equal(df_cached, df)
+
+
+def test_analyze_units_with_cache_version(tmp_path, test_data, monkeypatch):
+    """Results cached by another version of the engines are recomputed"""
+    df_fpn, df_boal, df_bod = test_data
+    cache = CurtailmentCache(str(tmp_path / "cache.db"))
+
+    recomputed = []
+
+    def analyze_units(df_fpn, df_boal, df_bod):
+        recomputed.append(len(df_fpn))
+        return analyze_units_exact(df_fpn, df_boal, df_bod)
+
+    analyze_units_with_cache(df_fpn, df_boal, df_bod, cache=cache, engine="exact", analyze_units=analyze_units)
+    monkeypatch.setattr(curtailment_cache, "CACHE_VERSION", curtailment_cache.CACHE_VERSION + 1)
+    analyze_units_with_cache(df_fpn, df_boal, df_bod, cache=cache, engine="exact", analyze_units=analyze_units)
+
+    assert recomputed == [len(df_fpn), len(df_fpn)]
+
+
+def test_curtailment_cache_max_age(tmp_path, test_data):
+    df_fpn, df_boal, df_bod = test_data
+    now = [0.0]
+    cache = CurtailmentCache(str(tmp_path / "cache.db"), max_age=pd.Timedelta(days=1), now=lambda: now[0])
+
+    unit = df_fpn.index[0]
+    df_fpn_unit, df_boal_unit, df_bod_unit = df_fpn.loc[[unit]], df_boal.iloc[:0], df_bod.loc[[unit]]
+    analyze_units_with_cache(
+        df_fpn_unit, df_boal_unit, df_bod_unit, cache=cache, engine="exact", analyze_units=analyze_units_exact
+    )
+    n_cached = len(cache.get("exact", 0, 2**40))
+    assert n_cached > 0
+
+    # caching other results two days later drops the first ones
+    now[0] = pd.Timedelta(days=2).total_seconds()
+    other = df_fpn.index[-1]
+    analyze_units_with_cache(
+        df_fpn.loc[[other]],
+        df_boal_unit,
+        df_bod.loc[[other]],
+        cache=cache,
+        engine="exact",
+        analyze_units=analyze_units_exact,
+    )
+    assert set(cache.get("exact", 0, 2**40)["Unit"]) == {other}
+
+
+@pytest.mark.parametrize("analyze_units", [analyze_units_exact, analyze_units_by_minute])
+def test_analyze_units_with_cache_fpn_gap(tmp_path, analyze_units):
+    """The engines interpolate across gaps in the FPNs, so the periods in a gap depend on the FPN rows around it"""
+    db_path = str(tmp_path / "synthetic.db")
+    drop_and_initialize_tables(db_path)
+    drop_and_initialize_bod_table(db_path)
+    load_synthetic_data(
+        create_engine(f"sqlite:///{db_path}"), "2022-02-10", "2022-02-12", seed=3, missing_fpn_fraction=0.1
+    )
+    df_fpn, df_boal, df_bod = DbRepository(db_path).get_data_for_time_range("2022-02-10 12:00", "2022-02-11 12:00")
+    cache = CurtailmentCache(str(tmp_path / "cache.db"))
+
+    analyze_units_with_cache(df_fpn, df_boal, df_bod, cache=cache, engine="test", analyze_units=analyze_units)
+
+    # change the level of the first FPN row after a gap of at least an hour
+    df_fpn = df_fpn.sort_values(["unit", "timeFrom"])
+    gap = (df_fpn["timeFrom"] - df_fpn.groupby(level=0)["timeTo"].shift()) >= pd.Timedelta(hours=1)
+    assert gap.any()
+    df_fpn.iloc[np.flatnonzero(gap.to_numpy())[0], df_fpn.columns.get_loc("levelFrom")] += 100
+
+    df_cached = analyze_units_with_cache(
+        df_fpn, df_boal, df_bod, cache=cache, engine="test", analyze_units=analyze_units
+    )
+    pd.testing.assert_frame_equal(df_cached, analyze_units(df_fpn, df_boal, df_bod))
+
+
+@pytest.mark.parametrize("analyze_units", [analyze_units_exact, analyze_units_by_minute])
+def test_analyze_units_with_cache_inside_fpn_gap(tmp_path, test_data, analyze_units):
+    """Recomputing periods in the middle of a gap in the FPNs needs the FPN rows around the whole gap"""
+    df_fpn, df_boal, df_bod = test_data
+    unit = df_boal.index[0]
+    gap = (df_fpn["timeFrom"] >= "2022-01-01 01:00") & (df_fpn["timeFrom"] < "2022-01-01 05:00")
+    df_fpn = df_fpn[~((df_fpn.index == unit) & gap)]
+    cache = CurtailmentCache(str(tmp_path / "cache.db"))
+
+    analyze_units_with_cache(df_fpn, df_boal, df_bod, cache=cache, engine="test", analyze_units=analyze_units)
+
+    # a new bid price in the middle of the gap
+    df_bod = df_bod.copy()
+    changed = (df_bod.index == unit) & (df_bod["timeFrom"] == pd.Timestamp("2022-01-01 03:00"))
+    df_bod.loc[changed, "bidPrice"] = -200.0
+
+    df_cached = analyze_units_with_cache(
+        df_fpn, df_boal, df_bod, cache=cache, engine="test", analyze_units=analyze_units
+    )
+    pd.testing.assert_frame_equal(df_cached, analyze_units(df_fpn, df_boal, df_bod))
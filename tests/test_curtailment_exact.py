@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib.curtailment import analyze_curtailment
+from lib.curtailment_exact import analyze_units_exact, build_curtailment_segments
+
+
+@pytest.fixture
+def one_unit_data():
+    index = pd.Index(["T_A", "T_A"], name="unit")
+    df_fpn = pd.DataFrame(
+        {
+            "timeFrom": pd.to_datetime(["2022-01-01 00:00", "2022-01-01 00:30"]),
+            "timeTo": pd.to_datetime(["2022-01-01 00:30", "2022-01-01 01:00"]),
+            "levelFrom": [0.0, 30.0],
+            "levelTo": [30.0, 60.0],
+        },
+        index=index,
+    )
+    df_boal = pd.DataFrame(
+        {
+            "timeFrom": pd.to_datetime(["2022-01-01 00:10"]),
+            "timeTo": pd.to_datetime(["2022-01-01 00:20"]),
+            "levelFrom": [10.0],
+            "levelTo": [10.0],
+            "Accept ID": ["1"],
+        },
+        index=index[:1],
+    )
+    df_bod = pd.DataFrame(
+        {
+            "timeFrom": pd.to_datetime(["2022-01-01 00:00"]),
+            "bidOfferPairNumber": ["-1"],
+            "bidPrice": ["-50.0"],
+        },
+        index=pd.Index(["T_A"], name="bmUnitID"),
+    )
+    return df_fpn, df_boal, df_bod
+
+
+def test_build_curtailment_segments(one_unit_data):
+    df_segments = build_curtailment_segments(*one_unit_data)
+
+    # breakpoints at 00:00, 00:10, 00:20, 00:30 and 01:00
+    assert len(df_segments) == 4
+    assert list(df_segments["Accept ID"]) == [None, "1", None, None]
+    np.testing.assert_array_equal(df_segments["fpn_from"], [0.0, 10.0, 20.0, 30.0])
+
+
+def test_analyze_units_exact(one_unit_data):
+    df = analyze_units_exact(*one_unit_data)
+
+    assert len(df) == 2
+    assert df["Time"].iloc[0] == pd.Timestamp("2022-01-01 00:00", tz="Europe/London")
+    np.testing.assert_allclose(df["Level_FPN"], [15.0, 45.0])
+    np.testing.assert_allclose(df["Level_BOAL"], [10 / 3, 0.0])
+    np.testing.assert_allclose(df["delta"], [5 / 3, 0.0])
+    np.testing.assert_allclose(df["energy_mwh"], [5 / 6, 0.0])
+    np.testing.assert_allclose(df["cost_gbp"], [50 * 5 / 6, 0.0])
+
+
+def test_analyze_units_exact_seconds(one_unit_data):
+    df_fpn, df_boal, df_bod = one_unit_data
+    df_boal = df_boal.assign(timeTo=pd.to_datetime(["2022-01-01 00:20:30"]))
+
+    df = analyze_units_exact(df_fpn, df_boal, df_bod)
+
+    # the extra 30 seconds are not rounded away
+    np.testing.assert_allclose(df["delta"].iloc[0], (5 * 600 + 10.25 * 30) / 1800)
+
+
+def test_analyze_curtailment_exact(db):
+    df_minute = analyze_curtailment(db, "2022-01-01", "2022-01-02")
+    df_exact = analyze_curtailment(db, "2022-01-01", "2022-01-02", engine="exact")
+
+    assert len(df_exact) == len(df_minute)
+    assert (df_exact["Time"] == df_minute["Time"]).all()
+    for column in ["delta", "Level_FPN", "Level_After_BOAL", "cost_gbp"]:
+        np.testing.assert_allclose(df_exact[column].sum(), df_minute[column].sum(), rtol=1e-3)
+
+
+def test_analyze_curtailment_unknown_engine(db):
+    with pytest.raises(ValueError):
+        analyze_curtailment(db, "2022-01-01", "2022-01-02", engine="hourly")
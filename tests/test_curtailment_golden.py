@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from lib.curtailment import analyze_units_by_minute
+from lib.curtailment_golden import check_engine, compare_to_reference, reference_analyze_units
+from lib.data.synthetic import load_synthetic_data
+from lib.db_utils import DbRepository, drop_and_initialize_bod_table, drop_and_initialize_tables
+
+
+@pytest.fixture(scope="module")
+def some_units(test_data):
+    df_fpn, df_boal, df_bod = test_data
+    units = sorted(df_boal.index.unique())[:10]
+    return df_fpn[df_fpn.index.isin(units)], df_boal[df_boal.index.isin(units)], df_bod[df_bod.index.isin(units)]
+
+
+def test_minute_engine_matches_reference(some_units):
+    report = check_engine(*some_units, engine="minute")
+
+    assert report.passed, report.summary()
+
+
+def test_minute_engine_matches_reference_on_synthetic_data(tmp_path):
+    """Many overlapping acceptances, across the clocks going back"""
+    db_path = str(tmp_path / "synthetic.db")
+    drop_and_initialize_tables(db_path)
+    drop_and_initialize_bod_table(db_path)
+    start, end = "2022-10-29 20:00", "2022-10-30 04:00"
+    load_synthetic_data(create_engine(f"sqlite:///{db_path}"), start, end, n_units=4, acceptances_per_day=60)
+
+    df_fpn, df_boal, df_bod = DbRepository(db_path).get_data_for_time_range(start_time=start, end_time=end)
+    report = check_engine(df_fpn, df_boal, df_bod, engine="minute")
+
+    assert report.passed, report.summary()
+
+
+def test_compare_to_reference_reports_differences(some_units):
+    df_reference = reference_analyze_units(*some_units)
+
+    df_engine = analyze_units_by_minute(*some_units)
+    unit = df_engine["Unit"].iloc[0]
+    changed = (df_engine["Unit"] == unit) & (df_engine.index % 2 == 0)
+    df_engine.loc[changed, "cost_gbp"] += 1.0
+    df_engine = df_engine.iloc[:-1]
+
+    report = compare_to_reference(df_reference, df_engine)
+
+    assert not report.passed
+    assert report.units.loc[unit, "periods"] == changed.sum()
+    assert report.units.loc[unit, "max_cost_gbp_diff"] == pytest.approx(1.0)
+    assert report.units.loc[unit, "max_delta_diff"] == 0.0
+
+    # the last period of the last unit is missing from the engine results
+    missing = report.differences[report.differences["found_in"] == "reference"]
+    assert len(missing) == 1
+    assert missing["Unit"].iloc[0] == df_reference["Unit"].iloc[-1]
+    assert missing["Time"].iloc[0] == df_reference["Time"].iloc[-1]
+
+
+def test_exact_engine_differences_are_reported_per_unit(some_units):
+    report = check_engine(*some_units, engine="exact")
+
+    # the exact engine integrates segments instead of sampling minutes, so it is not expected to match
+    assert set(report.units.index) <= set(some_units[0].index) | set(some_units[1].index)
+    assert (report.units["periods"] > 0).all()
+    assert isinstance(report.differences["Time"].dtype, pd.DatetimeTZDtype)
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib.curtailment import analyze_curtailment
+from lib.curtailment_resolutions import period_hours, roll_up
+
+
+@pytest.mark.parametrize("engine", ["minute", "exact"])
+def test_analyze_curtailment_resolutions(db, engine):
+    df = analyze_curtailment(db, "2022-01-01", "2022-01-02", engine=engine)
+    resolutions = analyze_curtailment(
+        db, "2022-01-01", "2022-01-02", engine=engine, resolutions=["1min", "5min", "30min", "day", "month"]
+    )
+
+    pd.testing.assert_frame_equal(resolutions["30min"], df)
+    assert [len(resolutions[resolution]) for resolution in ["1min", "5min", "day", "month"]] == [1440, 288, 1, 1]
+
+    for df_resolution in resolutions.values():
+        np.testing.assert_allclose(df_resolution["energy_mwh"].sum(), df["energy_mwh"].sum())
+        np.testing.assert_allclose(df_resolution["cost_gbp"].sum(), df["cost_gbp"].sum())
+
+    # average MW over the day, and over all of January
+    np.testing.assert_allclose(resolutions["day"]["delta"].iloc[0], df["delta"].mean())
+    np.testing.assert_allclose(resolutions["month"]["delta"].iloc[0], df["delta"].sum() / 2 / (31 * 24))
+
+
+def test_roll_up_clock_change():
+    # the clocks went back on 2022-10-30, which had 25 hours
+    times = pd.date_range("2022-10-30 00:00", "2022-10-31 00:00", freq="30T", tz="Europe/London", inclusive="left")
+    df = pd.DataFrame(
+        {
+            "Unit": "A",
+            "Time": times,
+            "Level_FPN": 10.0,
+            "Level_BOAL": 0.0,
+            "Level_After_BOAL": 10.0,
+            "delta": 2.0,
+            "energy_mwh": 1.0,
+            "cost_gbp": 3.0,
+        }
+    )
+
+    assert len(times) == 50
+    np.testing.assert_array_equal(period_hours(pd.Series(times[:1]), "day"), [25.0])
+
+    df_day = roll_up(df, 1800, "day")
+    assert len(df_day) == 1
+    assert df_day["Time"].iloc[0] == pd.Timestamp("2022-10-30", tz="Europe/London")
+    np.testing.assert_allclose(df_day[["Level_FPN", "delta", "energy_mwh", "cost_gbp"]].iloc[0], [10, 2, 50, 150])
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib.curtailment import analyze_curtailment
+from lib.curtailment_cache import CurtailmentCache
+from lib.curtailment_scenarios import READ_DATA_SCENARIO, SCENARIO_COLUMNS, Scenario, reprice_curtailment
+
+
+@pytest.fixture(scope="module")
+def curtailment(db):
+    _, matrix = analyze_curtailment(db, "2022-01-01", "2022-01-02", per_unit=True)
+    _, _, df_bod = db.get_data_for_time_range(pd.Timestamp("2022-01-01"), pd.Timestamp("2022-01-02"))
+    return matrix, df_bod
+
+
+def test_reprice_curtailment(curtailment):
+    matrix, df_bod = curtailment
+    scenarios = [
+        READ_DATA_SCENARIO,
+        Scenario(name="gas 2021", gas_prices_by_year={2021: 200.0}),
+        Scenario(name="pair -1 cheap gas", gas_price=50.0),
+    ]
+
+    df = reprice_curtailment(matrix, scenarios, df_bod)
+
+    assert list(df.columns) == SCENARIO_COLUMNS
+    assert list(df["scenario"]) == ["read_data.sql", "gas 2021", "pair -1 cheap gas"]
+
+    energy = np.nansum(matrix.delta) * 0.5
+    np.testing.assert_allclose(df["energy_mwh"], energy)
+    # pair -1 prices the turn down as the engines do
+    np.testing.assert_allclose(df["turndown_cost_gbp"], np.nansum(matrix.cost_gbp))
+    np.testing.assert_allclose(df["turnup_cost_gbp"], [200 * energy, 100 * energy, 50 * energy])
+    np.testing.assert_allclose(df["total_cost_gbp"], df["turndown_cost_gbp"] + df["turnup_cost_gbp"])
+
+
+def test_reprice_curtailment_system_buy_price(curtailment):
+    matrix, df_bod = curtailment
+    scenario = Scenario(name="sbp", system_buy_price=True)
+
+    with pytest.raises(ValueError):
+        reprice_curtailment(matrix, [scenario], df_bod)
+
+    # naive UTC, as in the SBP table
+    sbp = pd.Series(80.0, index=pd.date_range("2022-01-01", "2022-01-02", freq="30min", inclusive="left"))
+    df = reprice_curtailment(matrix, [scenario], df_bod, system_buy_prices=sbp)
+    np.testing.assert_allclose(df["turnup_cost_gbp"], 80 * np.nansum(matrix.delta) * 0.5)
+
+
+def test_curtailment_cache_get_matrix(tmp_path, db):
+    cache = CurtailmentCache(str(tmp_path / "cache.db"))
+    _, matrix = analyze_curtailment(db, "2022-01-01", "2022-01-02", per_unit=True, cache=cache)
+
+    cached = cache.get_matrix("minute", "2022-01-01", "2022-01-02")
+
+    np.testing.assert_array_equal(cached.units, matrix.units)
+    pd.testing.assert_index_equal(cached.times, matrix.times)
+    np.testing.assert_allclose(cached.delta, matrix.delta)
+    np.testing.assert_allclose(cached.cost_gbp, matrix.cost_gbp)
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from lib.db_utils import UnitPartition, from_stored_times, to_stored_times
+
+
+def test_unit_partition():
+    df = pd.DataFrame(
+        {"levelFrom": [1.0, 2.0, 3.0, 4.0, 5.0]}, index=pd.Index(["B", "A", "B", "C", "A"], name="unit")
+    )
+    data_by_unit = UnitPartition(df)
+
+    assert list(data_by_unit.units) == ["A", "B", "C"]
+    assert len(data_by_unit) == 3
+    # rows keep their order within a unit
+    assert list(data_by_unit["A"]["levelFrom"]) == [2.0, 5.0]
+    assert list(data_by_unit["B"]["levelFrom"]) == [1.0, 3.0]
+    # a single row, or no rows, is still a frame with the same columns
+    assert isinstance(data_by_unit["C"], pd.DataFrame)
+    assert len(data_by_unit["C"]) == 1
+    assert "D" not in data_by_unit
+    assert len(data_by_unit["D"]) == 0
+    assert data_by_unit["D"]["levelFrom"].dtype == np.float64
+
+    assert list(data_by_unit.take(["C", "A", "D"])["levelFrom"]) == [4.0, 2.0, 5.0]
+
+
+def test_get_data_by_unit_for_time_range(db):
+    df_fpn, df_boal, df_bod = db.get_data_for_time_range(start_time="2022-01-01", end_time="2022-01-02")
+    fpn_by_unit, boal_by_unit, bod_by_unit = db.get_data_by_unit_for_time_range(
+        start_time="2022-01-01", end_time="2022-01-02"
+    )
+
+    assert df_fpn.index.is_monotonic_increasing
+    for df, data_by_unit in [(df_fpn, fpn_by_unit), (df_boal, boal_by_unit), (df_bod, bod_by_unit)]:
+        assert set(data_by_unit.units) == set(df.index)
+        unit = data_by_unit.units[0]
+        pd.testing.assert_frame_equal(data_by_unit[unit], df[df.index == unit])
+
+
+def test_stored_times_round_trip():
+    df = pd.DataFrame(
+        {
+            "timeFrom": pd.to_datetime(["2022-10-30 00:30", "2022-10-30 01:30"], utc=True),
+            "timeTo": pd.to_datetime(["2022-10-30 01:00", "2022-10-30 02:00"]),
+            "levelFrom": [1.0, 2.0],
+        }
+    )
+
+    df_stored = to_stored_times(df)
+    assert df_stored["timeFrom"].dtype == np.int64
+    assert list(df_stored["timeTo"]) == [1667091600, 1667095200]
+
+    df_loaded = from_stored_times(df_stored)
+    assert list(df_loaded["timeFrom"]) == list(df["timeTo"] - pd.Timedelta(minutes=30))
+    pd.testing.assert_series_equal(df_loaded["timeTo"], df["timeTo"])
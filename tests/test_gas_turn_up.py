@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from lib.db_utils import DbRepository, drop_and_initialize_gas_tables, to_stored_times
+from lib.gas_turn_up import analyze_gas_turn_up, analyze_gas_units
+
+
+@pytest.fixture
+def gas_unit_data():
+    """One CCGT unit at 100 MW, turned up to 200 MW from 00:00 to 01:00 by the system operator"""
+    index = pd.Index(["T_GAS", "T_GAS"], name="unit")
+    df_fpn = pd.DataFrame(
+        {
+            "timeFrom": pd.to_datetime(["2022-01-01 00:00", "2022-01-01 00:30"]),
+            "timeTo": pd.to_datetime(["2022-01-01 00:30", "2022-01-01 01:00"]),
+            "levelFrom": [100.0, 100.0],
+            "levelTo": [100.0, 100.0],
+        },
+        index=index,
+    )
+    df_boal = pd.DataFrame(
+        {
+            "timeFrom": pd.to_datetime(["2022-01-01 00:00", "2022-01-01 00:30"]),
+            "timeTo": pd.to_datetime(["2022-01-01 00:30", "2022-01-01 01:00"]),
+            "levelFrom": [200.0, 200.0],
+            "levelTo": [200.0, 200.0],
+            "Accept ID": ["1", "1"],
+            "soFlag": ["T", "T"],
+        },
+        index=index,
+    )
+    df_bod = pd.DataFrame(
+        {
+            "timeFrom": pd.to_datetime(["2022-01-01 00:00", "2022-01-01 00:00"]),
+            "timeTo": pd.to_datetime(["2022-01-01 00:30", "2022-01-01 00:30"]),
+            "bidOfferPairNumber": [-1.0, 1.0],
+            "bidPrice": [30.0, 30.0],
+            "offerPrice": [80.0, 80.0],
+        },
+        index=pd.Index(["T_GAS", "T_GAS"], name="bmUnitID"),
+    )
+    return df_fpn, df_boal, df_bod
+
+
+def test_analyze_gas_units(gas_unit_data):
+    df = analyze_gas_units(*gas_unit_data)
+
+    assert list(df["Time"]) == list(pd.date_range("2022-01-01", periods=2, freq="30min", tz="Europe/London"))
+    np.testing.assert_allclose(df["turnup_mwh"], [50.0, 50.0])
+    np.testing.assert_allclose(df["turnup_cost_gbp"], [4000.0, 4000.0])
+
+
+def test_analyze_gas_units_ignores_other_acceptances(gas_unit_data):
+    df_fpn, df_boal, df_bod = gas_unit_data
+    df_boal = df_boal.assign(soFlag=["F", "F"])
+
+    assert len(analyze_gas_units(df_fpn, df_boal, df_bod)) == 0
+
+
+def test_analyze_gas_units_overridden_by_other_acceptance(gas_unit_data):
+    df_fpn, df_boal, df_bod = gas_unit_data
+    # a later acceptance without the system operator flag replaces the turn up from 00:30
+    df_other = df_boal.iloc[1:].assign(levelFrom=[150.0], levelTo=[150.0], **{"Accept ID": ["2"], "soFlag": ["F"]})
+    df_boal = pd.concat([df_boal, df_other])
+
+    df = analyze_gas_units(df_fpn, df_boal, df_bod)
+
+    assert list(df["Time"]) == [pd.Timestamp("2022-01-01 00:00", tz="Europe/London")]
+    np.testing.assert_allclose(df["turnup_mwh"], [50.0])
+
+
+def test_analyze_gas_units_crossing_the_fpn(gas_unit_data):
+    df_fpn, df_boal, df_bod = gas_unit_data
+    # 100 MW above the FPN at 00:00, and 100 MW below at 00:30: only the first 15 minutes are turn up
+    df_boal = df_boal.iloc[:1].assign(levelFrom=[200.0], levelTo=[0.0])
+
+    df = analyze_gas_units(df_fpn, df_boal, df_bod)
+
+    np.testing.assert_allclose(df["turnup_mwh"], [0.5 * 100 * 0.25])
+    np.testing.assert_allclose(df["turnup_cost_gbp"], [80 * 0.5 * 100 * 0.25])
+
+
+def test_analyze_gas_turn_up(tmp_path, gas_unit_data):
+    db_path = str(tmp_path / "phys_data.db")
+    drop_and_initialize_gas_tables(db_path)
+
+    engine = create_engine(f"sqlite:///{db_path}", echo=False)
+    with engine.connect() as connection:
+        for table, df in zip(["gas_fpn", "gas_boal", "gas_bod"], gas_unit_data):
+            df = to_stored_times(df.assign(local_datetime=df["timeFrom"]))
+            df.to_sql(table, connection, if_exists="append", index_label=df.index.name)
+
+    df = analyze_gas_turn_up(DbRepository(db_path), "2022-01-01 00:30", "2022-01-01 01:00")
+
+    assert list(df["Time"]) == [pd.Timestamp("2022-01-01 00:30", tz="Europe/London")]
+    np.testing.assert_allclose(df["turnup_mwh"], [50.0])
+    np.testing.assert_allclose(df["turnup_cost_gbp"], [4000.0])
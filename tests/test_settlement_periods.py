@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib.settlement_periods import from_settlement_periods, periods_in_day, to_local, to_settlement_periods, to_utc
+
+
+@pytest.mark.parametrize("day, n_periods", [("2022-03-27", 46), ("2022-10-30", 50), ("2022-06-01", 48)])
+def test_settlement_periods_round_trip(day, n_periods):
+    next_day = pd.Timestamp(day) + pd.Timedelta(days=1)
+    times = pd.date_range(
+        pd.Timestamp(day, tz="Europe/London"), next_day.tz_localize("Europe/London"), freq="30min", inclusive="left"
+    )
+
+    dates, periods = to_settlement_periods(times)
+
+    assert len(times) == n_periods
+    assert (dates == day).all()
+    np.testing.assert_array_equal(periods, np.arange(1, n_periods + 1))
+    assert (from_settlement_periods(dates, periods) == times).all()
+    assert periods_in_day([day])[0] == n_periods
+
+
+def test_to_settlement_periods_closed():
+    # naive times are UTC, and 2022-07-01 00:00 UTC is 01:00 BST
+    times = pd.DatetimeIndex(["2022-01-01 00:00", "2022-01-01 00:10", "2022-07-01 00:00"])
+
+    dates, periods = to_settlement_periods(times)
+    assert list(dates) == ["2022-01-01", "2022-01-01", "2022-07-01"]
+    assert list(periods) == [1, 1, 3]
+
+    # closed right, like sp2ts.dt2sp: a period boundary is in the period that ends there
+    dates, periods = to_settlement_periods(times, closed="right")
+    assert list(dates) == ["2021-12-31", "2022-01-01", "2022-07-01"]
+    assert list(periods) == [48, 1, 2]
+
+
+def test_to_utc_and_local():
+    naive = pd.Series(pd.to_datetime(["2022-07-01 00:00"]))
+    assert to_utc(naive).iloc[0] == pd.Timestamp("2022-07-01 00:00", tz="UTC")
+    assert to_local(naive).iloc[0] == pd.Timestamp("2022-07-01 01:00", tz="Europe/London")
+    assert to_utc(pd.Timestamp("2022-07-01 01:00", tz="Europe/London")) == pd.Timestamp("2022-07-01 00:00", tz="UTC")
@@ -0,0 +1,65 @@
+import json
+import logging
+
+import pandas as pd
+
+from lib.curtailment import analyze_curtailment
+from lib.spans import Run, frame_bytes, log_run_summary, span, start_run
+
+
+def test_run_summary():
+    run = Run("test")
+    for rows in [10, 20]:
+        with run.span("parse", rows_in=rows, bytes=100) as parse:
+            parse.rows_out = rows // 2
+    with run.span("write", rows_in=5):
+        pass
+
+    summary = run.summary(start="2022-01-01")
+
+    assert summary["run"] == "test"
+    assert summary["start"] == "2022-01-01"
+    assert list(summary["stages"]) == ["parse", "write"]
+    assert summary["stages"]["parse"]["count"] == 2
+    assert summary["stages"]["parse"]["rows_in"] == 30
+    assert summary["stages"]["parse"]["rows_out"] == 15
+    assert summary["stages"]["parse"]["bytes"] == 200
+    assert summary["stages"]["write"]["rows_out"] == 0
+    assert summary["stages"]["parse"]["max_s"] <= summary["stages"]["parse"]["total_s"] <= summary["wall_s"]
+
+
+def test_span_recorded_on_error():
+    run = Run()
+    try:
+        with run.span("fails"):
+            raise ValueError
+    except ValueError:
+        pass
+
+    assert run.summary()["stages"]["fails"]["count"] == 1
+
+
+def test_frame_bytes():
+    df = pd.DataFrame({"a": [1.0, 2.0, 3.0]})
+    assert frame_bytes(df, None) == df.memory_usage(index=True).sum()
+
+
+def test_analyze_curtailment_spans(db, caplog):
+    run = start_run("test")
+    analyze_curtailment(db, "2022-01-01", "2022-01-02")
+
+    stages = run.summary()["stages"]
+    assert list(stages) == ["db_read", "analysis", "aggregation"]
+    assert stages["db_read"]["rows_out"] > 0
+    assert stages["db_read"]["bytes"] > 0
+    assert stages["analysis"]["rows_in"] == stages["db_read"]["rows_out"]
+    # periods outside the time range are dropped before aggregation
+    assert 0 < stages["aggregation"]["rows_in"] <= stages["analysis"]["rows_out"]
+
+    with span("extra"):
+        pass
+    with caplog.at_level(logging.INFO, logger="lib.spans"):
+        log_run_summary(rss_mb=1)
+    logged = json.loads(caplog.records[-1].getMessage())
+    assert logged["rss_mb"] == 1
+    assert "extra" in logged["stages"]